@@ -73,6 +73,9 @@ class SpeakAction(object):
     def run(self, voice_command):
         self.say(self.words)
 
+    def static_responses(self):
+        return [self.words]
+
 
 # Example: Tell the current time
 # ==============================
@@ -92,6 +95,11 @@ class SpeakTime(object):
         time_str = self.to_str(datetime.datetime.now())
         self.say(time_str)
 
+    def static_responses(self):
+        # There are only a few distinct answers, so they can all be prepared.
+        return sorted({self.to_str(datetime.time(hour, minute))
+                       for hour in range(24) for minute in range(60)})
+
     def to_str(self, dt):
         """Convert a datetime to a human-readable string."""
         HRS_TEXT = ['midnight', 'one', 'two', 'three', 'four', 'five', 'six',
@@ -144,6 +152,9 @@ class SpeakShellCommandOutput(object):
         elif self.failure_text:
             self.say(self.failure_text)
 
+    def static_responses(self):
+        return [self.failure_text] if self.failure_text else []
+
 
 # Example: Change the volume
 # ==========================
@@ -175,6 +186,9 @@ class VolumeControl(object):
         except (ValueError, subprocess.CalledProcessError):
             logging.exception("Error using amixer to adjust volume.")
 
+    def static_responses(self):
+        return [_('Volume at %d %%.') % vol for vol in range(101)]
+
 
 # Example: Repeat after me
 # ========================
@@ -234,6 +248,9 @@ class ChangeLightColor(object):
             logging.info("hue: No bridge registered, press button on bridge and try again")
             self.say(_("No bridge registered, press button on bridge and try again"))
 
+    def static_responses(self):
+        return [_("Ok"), _("No bridge registered, press button on bridge and try again")]
+
 
 # Power: Shutdown or reboot the pi
 # ================================
@@ -258,6 +275,9 @@ class PowerCommand(object):
             logging.error("Error identifying power command.")
             self.say("Sorry I didn't identify that command")
 
+    def static_responses(self):
+        return ["Shutting down, goodbye", "Rebooting", "Sorry I didn't identify that command"]
+
 # =========================================
 # Makers! Implement your own actions here.
 # =========================================
@@ -284,12 +304,29 @@ def make_actor(say):
     # Makers! Add your own voice commands here.
     # =========================================
 
-    actor.add_keyword(_('raspberry power off'), PowerCommand(say, 'shutdown'))
-    actor.add_keyword(_('raspberry reboot'), PowerCommand(say, 'reboot'))
+    # Never power off or reboot on a command that is only similar.
+    actor.add_keyword(_('raspberry power off'), PowerCommand(say, 'shutdown'), fuzzy=False)
+    actor.add_keyword(_('raspberry reboot'), PowerCommand(say, 'reboot'), fuzzy=False)
 
     return actor
 
 
+def get_static_responses(actor):
+    """Collect everything the actor's actions can say that is known in advance.
+
+    Actions list their fixed responses with an optional static_responses()
+    method, so they can be synthesized before they are first needed. Handlers
+    without an action are skipped.
+    """
+    responses = []
+    for handler in actor.handlers:
+        handler_action = getattr(handler, 'action', None)
+        static_responses = getattr(handler_action, 'static_responses', None)
+        if static_responses:
+            responses.extend(static_responses())
+    return responses
+
+
 def add_commands_just_for_cloud_speech_api(actor, say):
     """Add simple commands that are only used with the Cloud Speech API."""
     def simple_command(keyword, response):
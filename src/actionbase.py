@@ -18,6 +18,12 @@ This code lets you link keywords to actions. The actions are declared in
 action.py.
 """
 
+import collections
+import re
+
+# Default for Actor.set_fuzzy_matching().
+DEFAULT_FUZZY_THRESHOLD = 0.8
+
 
 class Actor(object):
 
@@ -25,9 +31,38 @@ class Actor(object):
 
     def __init__(self):
         self.handlers = []
+        # Matches all the keywords at once. It is rebuilt when the handlers
+        # change, and only used if they are all KeywordHandlers.
+        self._matcher = None
+        self._matcher_handlers = None
+        self._fuzzy_threshold = None
+        self._fuzzy_index = None
+
+    def set_fuzzy_matching(self, threshold=DEFAULT_FUZZY_THRESHOLD):
+        """Also handle commands that do not contain a keyword exactly.
+
+        If no keyword is in the command, it is compared with all the keywords
+        after normalizing punctuation, so "I.P. address" and "volume-up" match.
+        Words that sound like a keyword, such as "thyme" for "time", are
+        compared with it even if they are spelled quite differently. The most
+        similar keyword is used if its similarity by spelling, between 0 and
+        1, is at least the threshold. Ties go to the keyword that was added
+        first. Keywords added with fuzzy=False only match exactly.
 
-    def add_keyword(self, keyword, action):
-        self.handlers.append(KeywordHandler(keyword, action))
+        This only applies if all the handlers are KeywordHandlers. Pass None
+        to turn it off again.
+        """
+        self._fuzzy_threshold = threshold
+        self._matcher = None
+
+    def add_keyword(self, keyword, action, fuzzy=True):
+        """Adds a handler that runs the action if the keyword is in a command.
+
+        If fuzzy is False, the keyword is left out of fuzzy matching, eg for
+        actions that would do harm if they ran by mistake.
+        """
+        self.handlers.append(KeywordHandler(keyword, action, fuzzy))
+        self._matcher = None
 
     def get_phrases(self):
         """Get a list of all phrases that are expected by the handlers."""
@@ -38,6 +73,9 @@ class Actor(object):
 
         Returns True if the command would be handled."""
 
+        if self._get_matcher():
+            return self._find_handler(command) is not None
+
         for handler in self.handlers:
             if handler.can_handle(command):
                 return True
@@ -48,19 +86,55 @@ class Actor(object):
 
         Returns True if the command was handled."""
 
+        if self._get_matcher():
+            handler = self._find_handler(command)
+            if handler is None:
+                return False
+            handler.action.run(command)
+            return True
+
         for handler in self.handlers:
             if handler.handle(command):
                 return True
         return False
 
+    def _get_matcher(self):
+        """Returns a _KeywordMatcher for the handlers, or None to scan them."""
+        if self._matcher is None or self._matcher_handlers != self.handlers:
+            self._matcher_handlers = list(self.handlers)
+            if all(type(h) is KeywordHandler for h in self.handlers):
+                keywords = [h.keyword for h in self.handlers]
+                self._matcher = _KeywordMatcher(keywords)
+                if self._fuzzy_threshold is not None:
+                    self._fuzzy_index = _FuzzyIndex(
+                        [h.keyword if h.fuzzy else None for h in self.handlers],
+                        self._fuzzy_threshold)
+                else:
+                    self._fuzzy_index = None
+            else:
+                # Other handlers decide for themselves what they handle.
+                self._matcher = False
+        return self._matcher
+
+    def _find_handler(self, command):
+        index = self._matcher.find(command.lower())
+        if index is None and self._fuzzy_index:
+            index = self._fuzzy_index.find(command)
+        return None if index is None else self.handlers[index]
+
 
 class KeywordHandler(object):
 
-    """Perform the action when the given keyword is in the command."""
+    """Perform the action when the given keyword is in the command.
+
+    If fuzzy is False, Actor only uses it for commands that contain the keyword
+    exactly, even with fuzzy matching on.
+    """
 
-    def __init__(self, keyword, action):
+    def __init__(self, keyword, action, fuzzy=True):
         self.keyword = keyword.lower()
         self.action = action
+        self.fuzzy = fuzzy
 
     def get_phrases(self):
         return [self.keyword]
@@ -73,3 +147,301 @@ class KeywordHandler(object):
             self.action.run(command)
             return True
         return False
+
+
+class _KeywordMatcher(object):
+
+    """Finds the earliest added of many keywords that occurs in a text.
+
+    This is an Aho-Corasick automaton: a trie of the keywords, where each
+    state also has a failure link to the longest suffix of its text that is
+    also in the trie. Each state records the lowest index of any keyword that
+    ends there, so the earliest registered keyword wins, as with a linear
+    scan.
+    """
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._first = [None]
+
+        for index, keyword in enumerate(keywords):
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._first.append(None)
+                state = next_state
+            if self._first[state] is None:
+                self._first[state] = index
+
+        # Breadth first, so failure links always point to finished states.
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                self._first[next_state] = _lowest(self._first[next_state], self._first[fail])
+
+    def find(self, text):
+        """Returns the index of the first keyword that occurs in text, or None."""
+        goto = self._goto
+        fail = self._fail
+        first = self._first
+
+        # An empty keyword matches anything.
+        best = first[0]
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            index = first[state]
+            if index is not None and (best is None or index < best):
+                best = index
+                if best == 0:
+                    break
+        return best
+
+
+def _lowest(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+
+class _FuzzyIndex(object):
+
+    """Finds the keyword that a command resembles most.
+
+    Keywords are indexed by the phonetic codes of their words, which finds
+    runs of words in the command that sound like a keyword, and by the
+    character trigrams of their normalized text. A keyword is only compared
+    with a run of words by edit distance if they sound alike or share enough
+    trigrams to be within the threshold, and the comparison gives up as soon
+    as the threshold can no longer be reached. Sounding alike never counts
+    towards the similarity itself, as very different words can share a code.
+
+    Keywords that are None are not indexed.
+    """
+
+    def __init__(self, keywords, threshold):
+        self._threshold = threshold
+        # (number of words, text without spaces, trigram counts) for each keyword
+        self._keywords = []
+        # trigram -> [(keyword index, occurrences)]
+        self._by_trigram = collections.defaultdict(list)
+        # phonetic codes of all the words -> keyword indexes
+        self._by_codes = collections.defaultdict(list)
+
+        for index, keyword in enumerate(keywords):
+            if keyword is None:
+                self._keywords.append(None)
+                continue
+            words = normalize(keyword).split()
+            text = ''.join(words)
+            trigrams = collections.Counter(_trigrams(text))
+            self._keywords.append((len(words), text, trigrams))
+
+            for trigram, count in trigrams.items():
+                self._by_trigram[trigram].append((index, count))
+            if words:
+                self._by_codes[tuple(phonetic_code(word) for word in words)].append(index)
+
+        self._code_lengths = sorted({len(codes) for codes in self._by_codes})
+        # Keywords that are short enough to be within the threshold without
+        # sharing any trigrams with a command.
+        self._unshared = [index for index, keyword in enumerate(self._keywords)
+                          if keyword and _min_shared_trigrams(keyword, threshold) <= 0]
+
+    def find(self, command):
+        """Returns the index of the most similar keyword, or None."""
+        words = normalize(command).split()
+        if not words:
+            return None
+
+        # keyword index -> best similarity so far
+        scores = {}
+        # Later keywords have to be at least as good, so they can be rejected
+        # sooner.
+        threshold = self._threshold
+
+        # Runs of words that sound like a keyword are compared with it by
+        # spelling, as they may not share enough trigrams to be found below.
+        codes = [phonetic_code(word) for word in words]
+        for size in self._code_lengths:
+            for start in range(len(words) - size + 1):
+                for index in self._by_codes.get(tuple(codes[start:start + size]), ()):
+                    score = _similarity(self._keywords[index][1],
+                                        ''.join(words[start:start + size]), threshold)
+                    if score > scores.get(index, 0.0):
+                        scores[index] = score
+                        threshold = max(threshold, score)
+
+        shared = collections.Counter()
+        for trigram in set(_trigrams(''.join(words))):
+            for index, count in self._by_trigram.get(trigram, ()):
+                shared[index] += count
+        for index in self._unshared:
+            shared.setdefault(index, 0)
+
+        # Score the most promising keywords first.
+        runs = {}
+        for index, _ in sorted(shared.items(), key=lambda item: (-item[1], item[0])):
+            keyword = self._keywords[index]
+            if shared[index] < _min_shared_trigrams(keyword, threshold):
+                continue
+            score = self._score(keyword, words, runs, threshold)
+            if score > scores.get(index, 0.0):
+                scores[index] = score
+                threshold = max(threshold, score)
+
+        # Only scores within the threshold are kept, so the best one wins, and
+        # ties go to the first keyword.
+        best = None
+        best_score = 0.0
+        for index in sorted(scores):
+            if scores[index] > best_score:
+                best = index
+                best_score = scores[index]
+        return best
+
+    @staticmethod
+    def _score(keyword, words, runs, threshold):
+        """Returns the best similarity of the keyword to a run of words.
+
+        Similarities below threshold are returned as 0. runs caches the text
+        and trigrams of each run of words.
+        """
+        size, keyword_text, keyword_trigrams = keyword
+        min_trigrams = _min_shared_trigrams(keyword, threshold)
+        best = 0.0
+        for run_size in range(max(1, size - 1), size + 2):
+            for start in range(len(words) - run_size + 1):
+                run = runs.get((start, run_size))
+                if run is None:
+                    text = ''.join(words[start:start + run_size])
+                    run = runs[start, run_size] = (text, set(_trigrams(text)))
+                text, trigrams = run
+                shared = sum(count for trigram, count in keyword_trigrams.items()
+                             if trigram in trigrams)
+                if shared >= min_trigrams:
+                    best = max(best, _similarity(keyword_text, text, threshold))
+                    if best == 1.0:
+                        return best
+        return best
+
+
+def _min_shared_trigrams(keyword, threshold):
+    """Returns how many trigrams a string similar to the keyword must share.
+
+    A string within d edits of the keyword shares all but 3*d of its trigrams.
+    The string may be longer than the keyword, which allows more edits, but it
+    can be at most len(keyword) / threshold characters long. The result may be
+    0 or less for short keywords.
+    """
+    _, text, trigrams = keyword
+    if threshold <= 0 or len(text) < 3:
+        # A keyword this short is its own "trigram", which longer strings lack.
+        return 0
+    longest = int(len(text) / threshold + _ROUNDING_ERROR)
+    return sum(trigrams.values()) - 3 * _max_edits(longest, threshold)
+
+
+# Float results are off by less than this, eg (1 - 0.8) * 5 is just below 1.
+_ROUNDING_ERROR = 1e-9
+
+
+def _max_edits(length, threshold):
+    """Returns the most edits to a string of length that keep it within threshold."""
+    return int((1 - threshold) * length + _ROUNDING_ERROR)
+
+
+_ELIDED = re.compile(r"[.']")
+_NON_WORD = re.compile(r'\W+')
+
+
+def normalize(text):
+    """Lowercases text and reduces it to plain words.
+
+    For example, "I.P. address" becomes "ip address", and "volume-up" becomes
+    "volume up".
+    """
+    return _NON_WORD.sub(' ', _ELIDED.sub('', text.lower())).strip()
+
+
+_SOUNDEX_DIGITS = {letter: str(digit)
+                   for digit, letters in enumerate(
+                       ['aehiouwy', 'bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r'])
+                   for letter in letters}
+
+
+def phonetic_code(word):
+    """Returns a Soundex code for the word, which is the same for most homophones.
+
+    Words with other characters than a to z, like numbers, are their own code.
+    """
+    if not all(letter in _SOUNDEX_DIGITS for letter in word):
+        return word
+    code = word[0]
+    last = _SOUNDEX_DIGITS.get(word[0])
+    for letter in word[1:]:
+        digit = _SOUNDEX_DIGITS.get(letter, '0')
+        if digit != '0' and digit != last:
+            code += digit
+        last = digit
+    return (code + '000')[:4]
+
+
+def _trigrams(text):
+    return [text[i:i + 3] for i in range(len(text) - 2)] or [text]
+
+
+def _similarity(a, b, threshold):
+    """Returns 1 - (edit distance / length), or 0 if it is below threshold."""
+    length = max(len(a), len(b))
+    if not length:
+        return 1.0
+    limit = _max_edits(length, threshold)
+    distance = _edit_distance(a, b, limit)
+    if distance > limit:
+        return 0.0
+    return 1.0 - distance / length
+
+
+def _edit_distance(a, b, limit):
+    """Returns the Levenshtein distance of a and b, or limit + 1 if it is more.
+
+    Only the cells within limit of the diagonal can be within the limit, so
+    the others are not computed.
+    """
+    too_far = limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return too_far
+    previous = [j if j <= limit else too_far for j in range(len(b) + 1)]
+    for i, char_a in enumerate(a, 1):
+        current = [too_far] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        row_min = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            distance = min(previous[j] + 1, current[j - 1] + 1,
+                           previous[j - 1] + (char_a != b[j - 1]), too_far)
+            current[j] = distance
+            if distance < row_min:
+                row_min = distance
+        if row_min > limit:
+            return too_far
+        previous = current
+    return previous[-1]
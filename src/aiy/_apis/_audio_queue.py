@@ -0,0 +1,163 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""A bounded queue for the audio of a speech request."""
+
+import collections
+import threading
+import time
+
+import aiy._drivers._recorder
+
+# Default limit on queued audio: 5 seconds of 16 kHz 16-bit mono.
+DEFAULT_MAX_BYTES = 5 * 16000 * 2
+
+AudioQueueStats = collections.namedtuple('AudioQueueStats', [
+    'depth',          # chunks waiting to be sent
+    'depth_bytes',    # bytes waiting to be sent
+    'max_depth_bytes',  # most bytes waiting at once since clear()
+    'dropped',        # chunks dropped by the overflow policy since clear()
+    'wait_s',         # time the last chunk spent in the queue
+    'max_wait_s',     # longest time a chunk spent in the queue since clear()
+])
+
+
+class AudioQueue(object):
+
+    """A FIFO of audio chunks, limited to max_bytes of audio.
+
+    When a chunk would exceed the limit, the overflow policy applies, as for
+    the Recorder's processor queues: drop the oldest chunks, drop the new
+    chunk, or block the caller of put() until there is room. None marks the
+    end of the audio; it is never dropped and does not count towards the
+    limit.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES,
+                 overflow=aiy._drivers._recorder.OVERFLOW_DROP_OLDEST):
+        if overflow not in aiy._drivers._recorder.OVERFLOW_POLICIES:
+            raise ValueError('overflow must be one of %s' %
+                             ', '.join(aiy._drivers._recorder.OVERFLOW_POLICIES))
+        self._max_bytes = max_bytes
+        self._overflow = overflow
+        self._cond = threading.Condition()
+        self._clear()
+
+    def _clear(self):
+        # (time queued, chunk)
+        self._chunks = collections.deque()
+        self._bytes = 0
+        self._max_depth_bytes = 0
+        self._dropped = 0
+        self._wait_s = 0.0
+        self._max_wait_s = 0.0
+
+    def clear(self):
+        """Discards all the queued audio and restarts the statistics.
+
+        This takes constant time, however much audio is queued.
+        """
+        with self._cond:
+            self._clear()
+            # Wake up callers of put() that are blocked on a full queue.
+            self._cond.notify_all()
+
+    def put(self, data):
+        """Queues a chunk of audio, or None to mark the end of the audio."""
+        with self._cond:
+            size = len(data) if data is not None else 0
+            if self._bytes + size > self._max_bytes:
+                if self._overflow == aiy._drivers._recorder.OVERFLOW_BLOCK:
+                    chunks = self._chunks
+                    while (self._bytes + size > self._max_bytes and self._bytes and
+                           self._chunks is chunks):
+                        self._cond.wait()
+                    if self._chunks is not chunks:
+                        # Cleared while waiting, so this audio is stale.
+                        return
+                elif self._overflow == aiy._drivers._recorder.OVERFLOW_DROP_NEWEST:
+                    self._dropped += 1
+                    return
+                else:
+                    while (self._bytes + size > self._max_bytes and self._chunks and
+                           self._chunks[0][1] is not None):
+                        self._bytes -= len(self._chunks.popleft()[1])
+                        self._dropped += 1
+
+            self._chunks.append((time.monotonic(), data))
+            self._bytes += size
+            self._max_depth_bytes = max(self._max_depth_bytes, self._bytes)
+            self._cond.notify_all()
+
+    def get(self):
+        """Returns the oldest chunk, waiting for one if the queue is empty."""
+        with self._cond:
+            while not self._chunks:
+                self._cond.wait()
+            return self._pop()
+
+    def get_batch(self, max_bytes, block=True):
+        """Returns a list of the oldest chunks, waiting for one if necessary.
+
+        After the first chunk, the chunks that are already queued are added
+        while they fit in max_bytes, without waiting for more. A chunk larger
+        than max_bytes, such as the pre-roll, is returned in pieces of
+        max_bytes. Returns None instead of a list at the end of the audio. If
+        block is False, an empty list is returned instead of waiting.
+        """
+        with self._cond:
+            while not self._chunks:
+                if not block:
+                    return []
+                self._cond.wait()
+            queued_at, data = self._chunks[0]
+            if data is not None and len(data) > max_bytes:
+                self._chunks[0] = (queued_at, data[max_bytes:])
+                self._chunks.appendleft((queued_at, data[:max_bytes]))
+            data = self._pop()
+            if data is None:
+                return None
+            batch = [data]
+            size = len(data)
+            while self._chunks:
+                data = self._chunks[0][1]
+                if data is None or size + len(data) > max_bytes:
+                    break
+                batch.append(self._pop())
+                size += len(data)
+            return batch
+
+    def get_nowait(self):
+        """Returns the oldest chunk, or raises IndexError if there is none."""
+        with self._cond:
+            if not self._chunks:
+                raise IndexError('audio queue is empty')
+            return self._pop()
+
+    def _pop(self):
+        queued_at, data = self._chunks.popleft()
+        if data is not None:
+            self._bytes -= len(data)
+            self._wait_s = time.monotonic() - queued_at
+            self._max_wait_s = max(self._max_wait_s, self._wait_s)
+        # Wake up callers of put() that are blocked on a full queue.
+        self._cond.notify_all()
+        return data
+
+    def get_stats(self):
+        """Returns AudioQueueStats."""
+        with self._cond:
+            return AudioQueueStats(len(self._chunks), self._bytes, self._max_depth_bytes,
+                                   self._dropped, self._wait_s, self._max_wait_s)
@@ -0,0 +1,173 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Keeps OAuth2 credentials fresh in the background."""
+
+import collections
+import datetime
+import logging
+import threading
+import time
+
+import google.auth.exceptions
+import google.auth.transport.requests
+
+logger = logging.getLogger('credentials')
+
+RefreshStats = collections.namedtuple('RefreshStats', [
+    'refreshes',       # successful refreshes
+    'failures',        # failed refreshes
+    'last_latency_s',  # duration of the last refresh
+    'max_latency_s',   # longest refresh seen
+    'expiry',          # UTC expiry of the current token, or None
+])
+
+# One manager per credentials object: credentials -> CredentialsManager
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(credentials):
+    """Returns the shared CredentialsManager for the given credentials.
+
+    Requests that use the same credentials share one manager, and so one
+    refreshed token.
+    """
+    with _managers_lock:
+        manager = _managers.get(credentials)
+        if manager is None:
+            manager = CredentialsManager(credentials)
+            _managers[credentials] = manager
+        return manager
+
+
+class CredentialsManager(object):
+
+    """Refreshes credentials on a background timer before they expire.
+
+    Without this, an expired token is refreshed inside the gRPC auth plugin,
+    on the path of whichever request notices it. The manager refreshes the
+    token REFRESH_MARGIN_S before it expires instead, and retries every
+    RETRY_S if a refresh fails, so a request never waits for an OAuth round
+    trip unless the background refresh has been failing.
+    """
+
+    REFRESH_MARGIN_S = 300
+    RETRY_S = 30
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+
+        self._lock = threading.Lock()
+        self._timer = None
+        self._started = False
+
+        self._refreshes = 0
+        self._failures = 0
+        self._last_latency_s = 0.0
+        self._max_latency_s = 0.0
+
+    def start(self):
+        """Starts refreshing in the background. Does not block."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        self._schedule_refresh()
+
+    def stop(self):
+        with self._lock:
+            self._started = False
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+
+    def ensure_valid(self):
+        """Refreshes the credentials now if they are not valid.
+
+        This only blocks if no background refresh has succeeded yet. Errors are
+        raised, so they are caught early rather than inside gRPC.
+        """
+        if not self.credentials.valid:
+            self._refresh(lambda: not self.credentials.valid)
+
+    def get_stats(self):
+        with self._lock:
+            return RefreshStats(self._refreshes, self._failures,
+                                self._last_latency_s, self._max_latency_s,
+                                self.credentials.expiry)
+
+    def _expires_soon(self):
+        if not self.credentials.token:
+            return True
+        if self.credentials.expiry is None:
+            # The token never expires.
+            return False
+        # google-auth expiries are naive UTC datetimes.
+        remaining = self.credentials.expiry - datetime.datetime.utcnow()
+        return remaining.total_seconds() < self.REFRESH_MARGIN_S
+
+    def _refresh(self, needed):
+        with self._lock:
+            if not needed():
+                # Another thread refreshed while we waited.
+                return
+
+            start = time.monotonic()
+            try:
+                self.credentials.refresh(google.auth.transport.requests.Request())
+            except google.auth.exceptions.GoogleAuthError:
+                self._failures += 1
+                raise
+            finally:
+                latency_s = time.monotonic() - start
+                self._last_latency_s = latency_s
+                self._max_latency_s = max(self._max_latency_s, latency_s)
+
+            self._refreshes += 1
+            logger.info('refreshed credentials in %.3f s, expiring at %s',
+                        latency_s, self.credentials.expiry)
+
+    def _background_refresh(self):
+        try:
+            self._refresh(self._expires_soon)
+        except google.auth.exceptions.GoogleAuthError:
+            logger.exception('Failed to refresh credentials, retrying in %d s',
+                             self.RETRY_S)
+            self._schedule(self.RETRY_S)
+        else:
+            self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        """Schedules the next refresh for shortly before the token expires."""
+        if not self.credentials.token:
+            self._schedule(0)
+            return
+        if self.credentials.expiry is None:
+            return
+
+        # google-auth expiries are naive UTC datetimes.
+        remaining = (self.credentials.expiry - datetime.datetime.utcnow()).total_seconds()
+        # Tokens that live less than twice the margin are refreshed halfway.
+        self._schedule(max(remaining - self.REFRESH_MARGIN_S, remaining / 2, 0))
+
+    def _schedule(self, delay):
+        with self._lock:
+            if not self._started:
+                return
+            self._timer = threading.Timer(delay, self._background_refresh)
+            self._timer.daemon = True
+            self._timer.start()
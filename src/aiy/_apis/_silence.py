@@ -0,0 +1,84 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Drop long runs of silence from the audio sent to a speech API."""
+
+import collections
+
+import numpy as np
+
+
+class SilenceSuppressor(object):
+
+    """Decides which chunks of a request's audio to upload.
+
+    A chunk of 16-bit mono audio is silent if its RMS level is below
+    threshold_db dBFS. The first max_silence_s of each run of silence is still
+    sent, so the ends of words are not clipped and the server can detect the
+    end of speech. After that, silence is dropped, except for the last
+    hangover_s of it, which is sent just before the next speech so the start
+    of the speech is not clipped.
+
+    Once timeout_s of silence has been dropped in a row, timed_out is True.
+    The server cannot notice that nobody is speaking, so the caller should end
+    the request.
+    """
+
+    def __init__(self, threshold_db=-45.0, max_silence_s=1.0, hangover_s=0.3,
+                 timeout_s=10.0, sample_rate_hz=16000):
+        bytes_per_second = 2 * sample_rate_hz
+        self._threshold = (10 ** (threshold_db / 20) * 32768) ** 2
+        self._max_silence_bytes = int(max_silence_s * bytes_per_second)
+        self._hangover_bytes = int(hangover_s * bytes_per_second)
+        self._timeout_bytes = int(timeout_s * bytes_per_second)
+        self.reset()
+
+    def reset(self):
+        """Prepares for a new request."""
+        # Bytes of silence since the last speech.
+        self._silence_bytes = 0
+        # Dropped chunks that will be sent if speech follows.
+        self._held = collections.deque()
+        self._held_bytes = 0
+
+    @property
+    def timed_out(self):
+        return self._silence_bytes - self._max_silence_bytes >= self._timeout_bytes
+
+    def process(self, data):
+        """Returns the list of chunks to upload, given the next captured chunk."""
+        if not self._is_silent(data):
+            self._silence_bytes = 0
+            chunks = list(self._held)
+            chunks.append(data)
+            self._held.clear()
+            self._held_bytes = 0
+            return chunks
+
+        self._silence_bytes += len(data)
+        if self._silence_bytes <= self._max_silence_bytes:
+            return [data]
+
+        self._held.append(data)
+        self._held_bytes += len(data)
+        while self._held_bytes - len(self._held[0]) >= self._hangover_bytes:
+            self._held_bytes -= len(self._held.popleft())
+        return []
+
+    def _is_silent(self, data):
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        if not samples.size:
+            return True
+        return float(np.dot(samples, samples)) / samples.size < self._threshold
@@ -19,6 +19,8 @@ import collections
 import logging
 import os
 import tempfile
+import threading
+import time
 import wave
 
 import google.auth
@@ -29,8 +31,11 @@ from google.cloud.grpc.speech.v1beta1 import cloud_speech_pb2 as cloud_speech
 from google.rpc import code_pb2 as error_code
 from google.assistant.embedded.v1alpha1 import embedded_assistant_pb2
 import grpc
-from six.moves import queue
 
+import aiy._apis._audio_queue
+import aiy._apis._credentials
+import aiy._apis._silence
+import aiy._drivers._recorder
 import aiy.i18n
 
 logger = logging.getLogger('speech')
@@ -38,6 +43,11 @@ logger = logging.getLogger('speech')
 AUDIO_SAMPLE_SIZE = 2  # bytes per sample
 AUDIO_SAMPLE_RATE_HZ = 16000
 
+# Limits of the Cloud Speech API on the phrases in a SpeechContext.
+MAX_PHRASES = 500
+MAX_PHRASE_CHARS = 100
+MAX_PHRASES_TOTAL_CHARS = 10000
+
 
 _Result = collections.namedtuple('_Result', ['transcript', 'response_audio'])
 
@@ -48,28 +58,93 @@ class Error(Exception):
 
 class _ChannelFactory(object):
 
-    """Creates gRPC channels with a given configuration."""
+    """Creates gRPC channels with a given configuration.
+
+    Channels are pooled per host and handed out again to later requests, so
+    only the first request pays for the TLS handshake and HTTP/2 setup.
+    Keepalive pings keep an idle channel warm, and a channel that has failed is
+    replaced the next time one is needed.
+    """
+
+    KEEPALIVE_OPTIONS = [
+        ('grpc.keepalive_time_ms', 30000),
+        ('grpc.keepalive_timeout_ms', 10000),
+        ('grpc.keepalive_permit_without_calls', 1),
+        ('grpc.http2.max_pings_without_data', 0),
+    ]
+
+    BROKEN_STATES = (
+        grpc.ChannelConnectivity.TRANSIENT_FAILURE,
+        grpc.ChannelConnectivity.SHUTDOWN,
+    )
+
+    # Shared by all factories: (target, credentials) -> _PooledChannel
+    _pool = {}
+    _pool_lock = threading.Lock()
 
     def __init__(self, api_host, credentials):
         self._api_host = api_host
         self._credentials = credentials
 
-        self._checked = False
+        # Shared with other requests using the same credentials.
+        self._credentials_manager = aiy._apis._credentials.get_manager(credentials)
+        self._credentials_manager.start()
 
     def make_channel(self):
+        """Returns a secure channel, reusing the pooled one if it is healthy."""
+
+        # The credentials are normally refreshed in the background. If that
+        # hasn't succeeded yet, refresh now, to catch any errors early.
+        # Otherwise, they'll be raised and swallowed somewhere inside gRPC.
+        self._credentials_manager.ensure_valid()
+
+        key = (self._api_host + ':443', self._credentials)
+        with self._pool_lock:
+            pooled = self._pool.get(key)
+            if pooled and not pooled.broken:
+                return pooled.channel
+
+            if pooled:
+                logger.info('rebuilding broken channel to %s', self._api_host)
+                pooled.channel.close()
+
+            pooled = _PooledChannel(self._create_channel())
+            pooled.channel.subscribe(pooled.on_connectivity_change)
+            self._pool[key] = pooled
+            return pooled.channel
+
+    def get_credentials_stats(self):
+        return self._credentials_manager.get_stats()
+
+    def discard_channel(self):
+        """Forgets the pooled channel, eg after it failed a request."""
+
+        with self._pool_lock:
+            pooled = self._pool.pop((self._api_host + ':443', self._credentials), None)
+        if pooled:
+            pooled.channel.close()
+
+    def _create_channel(self):
         """Creates a secure channel."""
 
         request = google.auth.transport.requests.Request()
         target = self._api_host + ':443'
 
-        if not self._checked:
-            # Refresh now, to catch any errors early. Otherwise, they'll be
-            # raised and swallowed somewhere inside gRPC.
-            self._credentials.refresh(request)
-            self._checked = True
-
         return google.auth.transport.grpc.secure_authorized_channel(
-            self._credentials, request, target)
+            self._credentials, request, target, options=self.KEEPALIVE_OPTIONS)
+
+
+class _PooledChannel(object):
+
+    """A pooled channel and whether it has failed since it was created."""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.broken = False
+
+    def on_connectivity_change(self, state):
+        if state in _ChannelFactory.BROKEN_STATES:
+            self.broken = True
 
 
 class GenericSpeechRequest(object):
@@ -81,14 +156,40 @@ class GenericSpeechRequest(object):
 
     DEADLINE_SECS = 185
 
+    # Audio that is already queued is sent in messages of up to this size.
+    MAX_AUDIO_REQUEST_BYTES = 32000
+
+    # Creates the channels for the requests' gRPC calls.
+    CHANNEL_FACTORY = _ChannelFactory
+
     def __init__(self, api_host, credentials):
         self.dialog_follow_on = False
-        self._audio_queue = queue.Queue()
+        self._audio_queue = aiy._apis._audio_queue.AudioQueue()
         self._phrases = []
-        self._channel_factory = _ChannelFactory(api_host, credentials)
+        self._phrase_keys = set()
+        self._phrases_total_chars = 0
+        # Incremented when the phrases change, to rebuild the config request.
+        self._phrases_version = 0
+        self._config_request = None
+        self._config_request_key = None
+        self._channel_factory = self.CHANNEL_FACTORY(api_host, credentials)
         self._endpointer_cb = None
+        self._audio_out_cb = None
+        # Set once the end of the request's audio has been signalled, by the
+        # server or by end_utterance().
+        self._audio_ended = False
+        self._audio_ended_lock = threading.Lock()
         self._audio_logging_enabled = False
         self._request_log_wav = None
+        self._request_start = None
+        self._audio_end = None
+        self._silence_suppressor = None
+        self.time_to_first_response = None
+        self.time_to_ready = None
+        self.result_latency = None
+        self.captured_bytes = 0
+        self.uploaded_bytes = 0
+        self.audio_requests = 0
 
     def add_phrases(self, phrases):
         """Makes the recognition more likely to recognize the given phrase(s).
@@ -96,16 +197,50 @@ class GenericSpeechRequest(object):
                  phrases.
         """
 
-        self._phrases.extend(phrases.get_phrases())
+        for phrase in phrases.get_phrases():
+            self.add_phrase(phrase)
 
     def add_phrase(self, phrase):
-        """Makes the recognition more likely to recognize the given phrase."""
+        """Makes the recognition more likely to recognize the given phrase.
+
+        Duplicate phrases are ignored, as are phrases beyond the API's limits.
+        """
+        phrase = phrase.strip()
+        key = phrase.lower()
+        if not phrase or key in self._phrase_keys:
+            return
+        if len(phrase) > MAX_PHRASE_CHARS:
+            logger.warning('Ignoring phrase longer than %d characters: %r',
+                           MAX_PHRASE_CHARS, phrase)
+            return
+        if (len(self._phrases) >= MAX_PHRASES or
+                self._phrases_total_chars + len(phrase) > MAX_PHRASES_TOTAL_CHARS):
+            logger.warning('Ignoring phrase beyond the limit of %d phrases or'
+                           ' %d characters: %r', MAX_PHRASES,
+                           MAX_PHRASES_TOTAL_CHARS, phrase)
+            return
         self._phrases.append(phrase)
+        self._phrase_keys.add(key)
+        self._phrases_total_chars += len(phrase)
+        self._phrases_version += 1
+
+    def get_credentials_stats(self):
+        """Returns the RefreshStats of the background credentials refresh."""
+        return self._channel_factory.get_credentials_stats()
 
     def set_endpointer_cb(self, cb):
         """Callback to invoke on end of speech."""
         self._endpointer_cb = cb
 
+    def set_audio_out_cb(self, cb):
+        """Callback to invoke with each chunk of response audio as it arrives.
+
+        It is called as cb(transcript, audio_data), where transcript is the
+        user's request as recognized so far. Only APIs that respond with audio
+        call it.
+        """
+        self._audio_out_cb = cb
+
     def set_audio_logging_enabled(self, audio_logging_enabled=True):
         self._audio_logging_enabled = audio_logging_enabled
 
@@ -113,20 +248,52 @@ class GenericSpeechRequest(object):
             self._audio_log_dir = tempfile.mkdtemp()
             self._audio_log_ix = 0
 
-    def reset(self):
-        while True:
-            try:
-                self._audio_queue.get(False)
-            except queue.Empty:
-                return
+    def set_audio_queue_limit(self, max_bytes,
+                              overflow=aiy._drivers._recorder.OVERFLOW_DROP_OLDEST):
+        """Limits the audio waiting to be sent, eg while the network stalls.
+
+        overflow is one of aiy._drivers._recorder.OVERFLOW_POLICIES, and says
+        what to do with audio beyond max_bytes. Blocking applies backpressure
+        to the Recorder.
+        """
+        self._audio_queue = aiy._apis._audio_queue.AudioQueue(max_bytes, overflow)
+
+    def get_audio_queue_stats(self):
+        """Returns the AudioQueueStats of the audio waiting to be sent."""
+        return self._audio_queue.get_stats()
+
+    def set_silence_suppression_enabled(self, enabled=True, **kwargs):
+        """Drop long runs of silence instead of uploading them.
 
+        The keyword arguments, such as threshold_db, are passed to
+        aiy._apis._silence.SilenceSuppressor.
+        """
+        if enabled:
+            self._silence_suppressor = aiy._apis._silence.SilenceSuppressor(**kwargs)
+        else:
+            self._silence_suppressor = None
+
+    def reset(self):
+        with self._audio_ended_lock:
+            self._audio_ended = False
+        self._audio_queue.clear()
         self.dialog_follow_on = False
 
     def add_data(self, data):
-        self._audio_queue.put(data)
+        # The recorder reuses its buffer, so keep a copy of the chunk.
+        self._audio_queue.put(bytes(data))
 
     def end_audio(self):
-        self.add_data(None)
+        self._audio_queue.put(None)
+
+    def end_utterance(self):
+        """Stops sending audio because the user has stopped speaking.
+
+        This is for local end-of-speech detection, which can be quicker than
+        waiting for the server. The endpointer callback is called as if the
+        server had detected the end of speech.
+        """
+        self._end_audio_request()
 
     def _get_speech_context(self):
         """Return a SpeechContext instance to bias recognition towards certain
@@ -142,6 +309,18 @@ class GenericSpeechRequest(object):
         """
         return
 
+    def _get_config_request(self):
+        """Returns the config request, only building it if its inputs changed."""
+        key = self._get_config_request_key()
+        if self._config_request is None or key != self._config_request_key:
+            self._config_request = self._create_config_request()
+            self._config_request_key = key
+        return self._config_request
+
+    def _get_config_request_key(self):
+        """Returns the inputs to _create_config_request(), for caching."""
+        return self._phrases_version
+
     @abstractmethod
     def _create_config_request(self):
         """Create a config request for the given endpoint.
@@ -161,19 +340,53 @@ class GenericSpeechRequest(object):
     def _request_stream(self):
         """Yields a config request followed by requests constructed from the
         audio queue.
+
+        If several chunks are already queued, eg after a network stall, they
+        are sent together, up to MAX_AUDIO_REQUEST_BYTES per request. A chunk
+        that arrives when the queue is empty is sent straight away.
         """
-        yield self._create_config_request()
+        yield self._get_config_request()
+
+        suppressor = self._silence_suppressor
+        if suppressor:
+            suppressor.reset()
 
         while True:
-            data = self._audio_queue.get()
+            batch = self._audio_queue.get_batch(self.MAX_AUDIO_REQUEST_BYTES)
 
-            if not data:
+            if batch is None:
                 return
 
-            if self._request_log_wav:
-                self._request_log_wav.writeframes(data)
+            request = self._create_batch_request(batch)
+            if request:
+                yield request
+
+    def _create_batch_request(self, batch):
+        """Returns an audio request for a batch of queued chunks, or None if
+        there is nothing to send after silence suppression.
+        """
+        suppressor = self._silence_suppressor
+
+        chunks = []
+        for data in batch:
+            self.captured_bytes += len(data)
+            chunks.extend(suppressor.process(data) if suppressor else (data,))
+
+        if suppressor and suppressor.timed_out:
+            logger.info('no speech, ending the request')
+            self._end_audio_request()
+
+        if not chunks:
+            return None
+
+        data = b''.join(chunks) if len(chunks) > 1 else chunks[0]
+        self.uploaded_bytes += len(data)
+        self.audio_requests += 1
+
+        if self._request_log_wav:
+            self._request_log_wav.writeframes(data)
 
-            yield self._create_audio_request(data)
+        return self._create_audio_request(data)
 
     @abstractmethod
     def _create_response_stream(self, service, request_stream, deadline):
@@ -200,24 +413,56 @@ class GenericSpeechRequest(object):
         return
 
     def _end_audio_request(self):
+        with self._audio_ended_lock:
+            if self._audio_ended:
+                return
+            self._audio_ended = True
+            self._audio_end = time.monotonic()
         self.end_audio()
         if self._endpointer_cb:
             self._endpointer_cb()
 
-    def _handle_response_stream(self, response_stream):
-        for resp in response_stream:
-            if resp.error.code != error_code.OK:
-                self._end_audio_request()
-                raise Error('Server error: ' + resp.error.message)
+    def _abort_audio(self):
+        """Stops taking audio after an error.
 
-            if self._stop_sending_audio(resp):
-                self._end_audio_request()
+        The endpointer callback is called as for the end of speech, so the
+        audio source stops adding data, and queued audio is discarded. With the
+        blocking overflow policy, the source would otherwise wait forever for
+        room in the queue.
+        """
+        self._end_audio_request()
+        self._audio_queue.clear()
 
-            self._handle_response(resp)
+    def _handle_response_stream(self, response_stream):
+        for resp in response_stream:
+            self._check_response(resp)
 
         # Server has closed the connection
         return self._finish_request() or ''
 
+    def _check_response(self, resp):
+        """Checks a response for errors and the end of speech, and passes it to
+        the subclass.
+        """
+        if self.time_to_first_response is None:
+            self.time_to_first_response = time.monotonic() - self._request_start
+            logger.info('first response after %.3f s', self.time_to_first_response)
+
+        # The first response after the end of the audio. Unlike the first
+        # response, this doesn't depend on how long the user spoke for.
+        if self.result_latency is None and self._audio_end is not None:
+            self.result_latency = time.monotonic() - self._audio_end
+            logger.info('response %.3f s after the end of the audio', self.result_latency)
+
+        if resp.error.code != error_code.OK:
+            self._end_audio_request()
+            raise Error('Server error: ' + resp.error.message)
+
+        if self._stop_sending_audio(resp):
+            self._end_audio_request()
+
+        self._handle_response(resp)
+
     def _start_logging_request(self):
         """Open a WAV file to log the request audio."""
         self._audio_log_ix += 1
@@ -237,8 +482,29 @@ class GenericSpeechRequest(object):
         if self._request_log_wav:
             self._request_log_wav.close()
 
+        logger.info('uploaded %d of %d bytes of captured audio in %d requests',
+                    self.uploaded_bytes, self.captured_bytes, self.audio_requests)
+        stats = self._audio_queue.get_stats()
+        logger.info('audio queue: up to %d bytes and %.3f s waiting, %d chunks dropped',
+                    stats.max_depth_bytes, stats.max_wait_s, stats.dropped)
         return _Result(None, None)
 
+    def _start_request(self):
+        """Resets the per-request measurements."""
+        self._request_start = time.monotonic()
+        self._audio_end = None
+        self.time_to_first_response = None
+        self.time_to_ready = None
+        self.result_latency = None
+        self.captured_bytes = 0
+        self.uploaded_bytes = 0
+        self.audio_requests = 0
+
+    def _on_channel_ready(self):
+        if self.time_to_ready is None:
+            self.time_to_ready = time.monotonic() - self._request_start
+            logger.info('channel ready after %.3f s', self.time_to_ready)
+
     def do_request(self):
         """Establishes a connection and starts sending audio to the cloud
         endpoint. Responses are handled by the subclass until one returns a
@@ -249,10 +515,23 @@ class GenericSpeechRequest(object):
                 transcript: string with transcript of user query
                 response_audio: optionally, an audio response from the server
 
+        After the request, time_to_first_response holds the seconds from the
+        start of the request to the first response from the server,
+        time_to_ready the seconds until the channel was connected (about 0 for
+        a pooled channel), result_latency the seconds from the end of the audio
+        to the next response, uploaded_bytes and captured_bytes hold how much of the recorded audio
+        was sent, and audio_requests holds the number of messages it took.
+
         Raises speech.Error on error.
         """
+        self._start_request()
+        ready = None
         try:
-            service = self._make_service(self._channel_factory.make_channel())
+            channel = self._channel_factory.make_channel()
+            ready = grpc.channel_ready_future(channel)
+            ready.add_done_callback(
+                lambda future: future.cancelled() or self._on_channel_ready())
+            service = self._make_service(channel)
 
             response_stream = self._create_response_stream(
                 service, self._request_stream(), self.DEADLINE_SECS)
@@ -265,7 +544,18 @@ class GenericSpeechRequest(object):
                 google.auth.exceptions.GoogleAuthError,
                 grpc.RpcError,
         ) as exc:
+            self._abort_audio()
+            code = exc.code() if hasattr(exc, 'code') else None
+            if code == grpc.StatusCode.UNAVAILABLE:
+                # Don't hand out a channel that just failed to the next request.
+                self._channel_factory.discard_channel()
             raise Error('Exception in speech request') from exc
+        except Error:
+            self._abort_audio()
+            raise
+        finally:
+            if ready:
+                ready.cancel()
 
 
 class CloudSpeechRequest(GenericSpeechRequest):
@@ -298,6 +588,9 @@ class CloudSpeechRequest(GenericSpeechRequest):
     def _make_service(self, channel):
         return cloud_speech.SpeechStub(channel)
 
+    def _get_config_request_key(self):
+        return (self._phrases_version, self.language_code)
+
     def _create_config_request(self):
         recognition_config = cloud_speech.RecognitionConfig(
             # There are a bunch of config options you can specify. See
@@ -355,17 +648,20 @@ class AssistantSpeechRequest(GenericSpeechRequest):
         super().__init__('embeddedassistant.googleapis.com', credentials)
 
         self._conversation_state = None
-        self._response_audio = b''
+        self._response_audio = []
         self._transcript = None
 
     def reset(self):
         super().reset()
-        self._response_audio = b''
+        self._response_audio = []
         self._transcript = None
 
     def _make_service(self, channel):
         return embedded_assistant_pb2.EmbeddedAssistantStub(channel)
 
+    def _get_config_request_key(self):
+        return self._conversation_state
+
     def _create_config_request(self):
         audio_in_config = embedded_assistant_pb2.AudioInConfig(
             encoding='LINEAR16',
@@ -402,14 +698,18 @@ class AssistantSpeechRequest(GenericSpeechRequest):
 
     def _handle_response(self, resp):
         """Accumulate audio and text from the remote end. It will be handled
-        in _finish_request().
+        in _finish_request(), and each chunk of audio is also passed to the
+        audio out callback as it arrives.
         """
 
         if resp.result.spoken_request_text:
             logger.info('transcript: %s', resp.result.spoken_request_text)
             self._transcript = resp.result.spoken_request_text
 
-        self._response_audio += resp.audio_out.audio_data
+        if resp.audio_out.audio_data:
+            self._response_audio.append(resp.audio_out.audio_data)
+            if self._audio_out_cb:
+                self._audio_out_cb(self._transcript, resp.audio_out.audio_data)
 
         if resp.result.conversation_state:
             self._conversation_state = resp.result.conversation_state
@@ -422,10 +722,11 @@ class AssistantSpeechRequest(GenericSpeechRequest):
     def _finish_request(self):
         super()._finish_request()
 
-        if self._response_audio and self._audio_logging_enabled:
-            self._log_audio_out(self._response_audio)
+        response_audio = b''.join(self._response_audio)
+        if response_audio and self._audio_logging_enabled:
+            self._log_audio_out(response_audio)
 
-        return _Result(self._transcript, self._response_audio)
+        return _Result(self._transcript, response_audio)
 
     def _log_audio_out(self, frames):
         response_filename = '%s/response.%03d.wav' % (
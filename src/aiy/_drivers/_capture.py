@@ -0,0 +1,272 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Capture backends that supply raw audio to the Recorder.
+
+A backend is a source of raw PCM audio in the Recorder's format. The Recorder
+reads from it with readinto(), so a backend only has to implement start(),
+readinto() and stop().
+"""
+
+import logging
+import subprocess
+import sys
+import threading
+import time
+import wave
+
+import aiy._drivers._alsa
+
+logger = logging.getLogger('recorder')
+
+BACKEND_ARECORD = 'arecord'
+BACKEND_PYAUDIO = 'pyaudio'
+BACKEND_FILE = 'file'
+BACKENDS = (BACKEND_ARECORD, BACKEND_PYAUDIO, BACKEND_FILE)
+
+
+class CaptureBackend(object):
+
+    """Base class for a source of audio for the Recorder."""
+
+    # True if the end of the stream is expected, eg when replaying a file.
+    finite = False
+
+    def start(self):
+        """Starts capturing audio."""
+        pass
+
+    def readinto(self, buf):
+        """Reads audio into buf, blocking until some is available.
+
+        Returns the number of bytes read, or 0 at the end of the stream.
+        """
+        raise NotImplementedError()
+
+    def stop(self):
+        """Stops capturing audio. Pending and later reads return 0."""
+        pass
+
+
+class ArecordCapture(CaptureBackend):
+
+    """Captures audio by reading the output of an arecord subprocess."""
+
+    def __init__(self, input_device, channels, bytes_per_sample, sample_rate_hz):
+        self._cmd = [
+            'arecord',
+            '-q',
+            '-t', 'raw',
+            '-D', input_device,
+            '-c', str(channels),
+            '-f', aiy._drivers._alsa.sample_width_to_string(bytes_per_sample),
+            '-r', str(sample_rate_hz),
+        ]
+        self._arecord = None
+
+    def start(self):
+        self._arecord = subprocess.Popen(self._cmd, stdout=subprocess.PIPE)
+
+    def readinto(self, buf):
+        return self._arecord.stdout.readinto(buf)
+
+    def stop(self):
+        if self._arecord:
+            self._arecord.kill()
+
+
+class PyAudioCapture(CaptureBackend):
+
+    """Captures audio in-process with a PortAudio callback stream.
+
+    PortAudio calls back on its own thread with each buffer of audio, which is
+    appended to a local FIFO that readinto() drains. If the reader falls more
+    than MAX_BUFFERED_S behind, the oldest audio is dropped.
+    """
+
+    MAX_BUFFERED_S = 2
+
+    def __init__(self, input_device, channels, bytes_per_sample, sample_rate_hz,
+                 frames_per_buffer=1600):
+        self._input_device = input_device
+        self._channels = channels
+        self._bytes_per_sample = bytes_per_sample
+        self._sample_rate_hz = sample_rate_hz
+        self._frames_per_buffer = frames_per_buffer
+        self._max_buffered = int(
+            self.MAX_BUFFERED_S * sample_rate_hz) * channels * bytes_per_sample
+
+        self._pending = bytearray()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._audio = None
+        self._stream = None
+        self._continue = None
+
+    def start(self):
+        import pyaudio
+
+        self._audio = pyaudio.PyAudio()
+        self._stream = self._audio.open(
+            format=self._audio.get_format_from_width(self._bytes_per_sample),
+            channels=self._channels,
+            rate=self._sample_rate_hz,
+            input=True,
+            input_device_index=self._find_device_index(),
+            frames_per_buffer=self._frames_per_buffer,
+            stream_callback=self._callback)
+        self._continue = pyaudio.paContinue
+        self._stream.start_stream()
+
+    def _find_device_index(self):
+        """Maps the input device name to a PortAudio device index."""
+        if self._input_device in (None, '', 'default'):
+            return None
+        if str(self._input_device).isdigit():
+            return int(self._input_device)
+
+        for i in range(self._audio.get_device_count()):
+            info = self._audio.get_device_info_by_index(i)
+            if info['maxInputChannels'] and self._input_device in info['name']:
+                return i
+        raise ValueError('No PortAudio input device matches %r' % self._input_device)
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        with self._cond:
+            self._pending.extend(in_data)
+            overflow = len(self._pending) - self._max_buffered
+            if overflow > 0:
+                logger.warning('dropping %d bytes of unread audio', overflow)
+                del self._pending[:overflow]
+            self._cond.notify()
+        return None, self._continue
+
+    def readinto(self, buf):
+        with self._cond:
+            while not self._pending and not self._stopped:
+                self._cond.wait()
+            if self._stopped:
+                return 0
+
+            count = min(len(buf), len(self._pending))
+            with memoryview(self._pending) as pending:
+                buf[:count] = pending[:count]
+            del self._pending[:count]
+            return count
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+        if self._stream:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._audio.terminate()
+            self._stream = None
+
+
+class FileCapture(CaptureBackend):
+
+    """Replays audio from a raw PCM or WAV file, or from stdin.
+
+    This lets the whole pipeline run on a machine without a sound card. With
+    realtime=True the audio is delivered at its natural rate, as if it came from
+    a microphone; otherwise it is read as fast as the Recorder can take it.
+    """
+
+    finite = True
+
+    def __init__(self, path, channels, bytes_per_sample, sample_rate_hz,
+                 realtime=True):
+        self._path = path
+        self._channels = channels
+        self._bytes_per_sample = bytes_per_sample
+        self._sample_rate_hz = sample_rate_hz
+        self._bytes_per_second = sample_rate_hz * channels * bytes_per_sample
+        self._realtime = realtime
+
+        self._file = None
+        self._remaining = None
+        self._stopped = False
+        self._bytes_read = 0
+        self._start_time = None
+
+    def start(self):
+        if self._path == '-':
+            self._file = sys.stdin.buffer
+        else:
+            self._file = open(self._path, 'rb')
+
+        if self._path.endswith('.wav'):
+            self._skip_wav_header()
+
+        self._start_time = time.monotonic()
+
+    def _skip_wav_header(self):
+        """Checks the WAV format and leaves the file at the start of the data."""
+        wav = wave.open(self._file, 'rb')
+        if (wav.getnchannels() != self._channels or
+                wav.getsampwidth() != self._bytes_per_sample or
+                wav.getframerate() != self._sample_rate_hz):
+            raise ValueError(
+                '%s must have %d channel(s), %d byte samples at %d Hz' % (
+                    self._path, self._channels, self._bytes_per_sample,
+                    self._sample_rate_hz))
+        self._remaining = wav.getnframes() * self._channels * self._bytes_per_sample
+
+    def readinto(self, buf):
+        if self._stopped:
+            self._close()
+            return 0
+
+        if self._remaining is not None:
+            buf = memoryview(buf)[:self._remaining]
+        count = self._file.readinto(buf) or 0
+        if not count:
+            self._close()
+        if self._remaining is not None:
+            self._remaining -= count
+        self._bytes_read += count
+
+        if self._realtime:
+            due = self._start_time + self._bytes_read / self._bytes_per_second
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        return count
+
+    def stop(self):
+        # The file is closed by the reading thread, which may be in readinto().
+        self._stopped = True
+
+    def _close(self):
+        if self._file and self._file is not sys.stdin.buffer:
+            self._file.close()
+
+
+def make_backend(name, input_device, channels, bytes_per_sample, sample_rate_hz):
+    """Creates the capture backend with the given name.
+
+    For the file backend, input_device is the path to replay, or '-' for stdin.
+    """
+    if name == BACKEND_ARECORD:
+        return ArecordCapture(input_device, channels, bytes_per_sample, sample_rate_hz)
+    elif name == BACKEND_PYAUDIO:
+        return PyAudioCapture(input_device, channels, bytes_per_sample, sample_rate_hz)
+    elif name == BACKEND_FILE:
+        return FileCapture(input_device, channels, bytes_per_sample, sample_rate_hz)
+    raise ValueError('backend must be one of %s' % ', '.join(BACKENDS))
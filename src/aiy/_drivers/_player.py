@@ -12,34 +12,254 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+
 """A driver for audio playback."""
 
+import collections
+import concurrent.futures
 import logging
+import os
+import queue
 import subprocess
+import threading
+import time
 import wave
 
 import aiy._drivers._alsa
 
 logger = logging.getLogger('audio')
 
+Pcm = collections.namedtuple('Pcm', ['frames', 'channels', 'sample_width', 'sample_rate'])
+
 
 class Player(object):
 
-    """Plays short audio clips from a buffer or file."""
+    """Plays short audio clips from a buffer or file.
+
+    All clips are played through one long-running aplay process, so the output
+    device stays open between clips and a clip doesn't pay for starting aplay
+    and opening the device. Clips are queued without blocking and played in
+    order by a background thread. If a clip has a different format from the
+    previous one, aplay is restarted with the new format once the previous
+    clip has finished.
+    """
+
+    # Clips are written to aplay in pieces of this many seconds, so that
+    # interrupt() takes effect quickly.
+    WRITE_CHUNK_S = 0.1
 
     def __init__(self, output_device='default'):
         self._output_device = output_device
 
+        self._clips = queue.Queue()
+        self._thread = None
+
+        # Guards everything below, which is shared with interrupt().
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._aplay = None
+        self._format = None
+        # Monotonic time when aplay will have played everything written to it.
+        self._play_end = 0.0
+        # (end time, future) of clips that have been written but may be playing.
+        self._playing = collections.deque()
+        # Futures of all the clips that haven't finished.
+        self._unfinished = set()
+
     def play_bytes(self, audio_bytes, sample_rate, sample_width=2):
         """Play audio from the given bytes-like object.
 
+        Blocks until the audio has been played or interrupted.
+
         Args:
           audio_bytes: audio data (mono)
           sample_rate: sample rate in Hertz (24 kHz by default)
           sample_width: sample width in bytes (eg 2 for 16-bit audio)
         """
+        _wait(self.enqueue(audio_bytes, sample_rate, sample_width))
+
+    def enqueue(self, audio_bytes, sample_rate, sample_width=2):
+        """Queue audio from the given bytes-like object without blocking.
+
+        Args:
+          audio_bytes: audio data (mono)
+          sample_rate: sample rate in Hertz
+          sample_width: sample width in bytes (eg 2 for 16-bit audio)
+
+        Returns:
+          a concurrent.futures.Future that completes when the clip has been
+          played, or is cancelled if interrupt() is called first.
+        """
+        clip = self._new_clip(sample_rate, sample_width)
+        clip.add(audio_bytes)
+        clip.end()
+        return clip.future
+
+    def open_stream(self, sample_rate, sample_width=2):
+        """Returns a PlaybackStream that plays mono audio as it is written.
+
+        The stream is queued like any other clip, and starts playing when the
+        clips before it have finished and its first audio has been written.
+
+        Args:
+          sample_rate: sample rate in Hertz
+          sample_width: sample width in bytes (eg 2 for 16-bit audio)
+        """
+        return PlaybackStream(self._new_clip(sample_rate, sample_width))
+
+    def interrupt(self):
+        """Stop the current clip and cancel all queued clips, eg for barge-in."""
+        with self._lock:
+            self._generation += 1
+            if self._aplay:
+                # Killing aplay is the only way to drop the audio it has buffered.
+                self._aplay.kill()
+                self._aplay = None
+            self._play_end = 0.0
+            self._playing.clear()
+            for future in list(self._unfinished):
+                future.cancel()
+
+    def play_wav(self, wav_path):
+        """Play audio from the given WAV file.
+
+        The file should be mono and small enough to load into memory. The
+        decoded audio is cached, see preload_wav().
+        Args:
+          wav_path: path to the wav file
+        """
+        _wait(self.enqueue_wav(wav_path))
+
+    def enqueue_wav(self, wav_path):
+        """Queue audio from the given WAV file without blocking.
+
+        Returns a Future, like enqueue().
+        """
+        pcm = _pcm_cache.get(wav_path)
+        if pcm.channels != 1:
+            raise ValueError(wav_path + ' is not a mono file')
+        return self.enqueue(pcm.frames, pcm.sample_rate, pcm.sample_width)
+
+    def preload_wav(self, wav_path):
+        """Decode a WAV file into the cache, so playing it needs no disk I/O."""
+        _pcm_cache.get(wav_path)
+
+    def _new_clip(self, sample_rate, sample_width):
+        with self._lock:
+            clip = _Clip(sample_rate, sample_width, self._generation)
+            self._unfinished.add(clip.future)
+            clip.future.add_done_callback(self._unfinished.discard)
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._clips.put(clip)
+        return clip
+
+    def _run(self):
+        """Plays queued clips, one after the other."""
+        while True:
+            clip = self._wait_for(self._clips.get)
+            while not self._is_stale(clip):
+                audio_bytes = self._wait_for(clip.get, clip)
+                if audio_bytes is None:
+                    break
+                self._write(clip, memoryview(audio_bytes).cast('B'))
+
+            with self._lock:
+                if clip.generation == self._generation:
+                    self._playing.append((self._play_end, clip.future))
+                else:
+                    clip.future.cancel()
+
+    def _wait_for(self, get, clip=None):
+        """Returns get(timeout), finishing played clips while it waits.
+
+        Returns None if the clip is interrupted while waiting.
+        """
+        while True:
+            timeout = self._finish_played_clips()
+            if clip:
+                if self._is_stale(clip):
+                    return None
+                timeout = min(timeout or self.WRITE_CHUNK_S, self.WRITE_CHUNK_S)
+            try:
+                return get(timeout=timeout)
+            except queue.Empty:
+                pass
+
+    def _finish_played_clips(self):
+        """Completes the futures of clips that have finished playing.
+
+        Returns the seconds until the next clip finishes, or None.
+        """
+        with self._lock:
+            now = time.monotonic()
+            while self._playing and self._playing[0][0] <= now:
+                future = self._playing.popleft()[1]
+                if not future.done():
+                    future.set_result(None)
+            if self._playing:
+                return self._playing[0][0] - now
+            return None
 
-        cmd = [
+    def _is_stale(self, clip):
+        return clip.generation != self._generation
+
+    def _write(self, clip, audio):
+        """Writes audio to aplay in short pieces, unless interrupted."""
+        audio_format = (clip.sample_rate, clip.sample_width)
+        bytes_per_second = clip.sample_rate * clip.sample_width
+        piece_bytes = int(self.WRITE_CHUNK_S * clip.sample_rate) * clip.sample_width
+
+        for start in range(0, len(audio), piece_bytes):
+            piece = audio[start:start + piece_bytes]
+            with self._lock:
+                if self._is_stale(clip):
+                    return
+                old_aplay = self._aplay if self._format != audio_format else None
+
+            if old_aplay:
+                # Let aplay finish the previous clip before changing format. It
+                # stays in self._aplay meanwhile, so interrupt() can kill it.
+                old_aplay.stdin.close()
+                old_aplay.wait()
+
+            with self._lock:
+                if self._is_stale(clip):
+                    return
+                aplay = self._get_aplay(audio_format)
+
+            try:
+                written = 0
+                while written < len(piece):
+                    written += aplay.stdin.write(piece[written:])
+            except OSError:
+                with self._lock:
+                    if not self._is_stale(clip):
+                        logger.error('aplay failed with %s', aplay.poll())
+                        self._aplay = None
+                return
+
+            with self._lock:
+                now = time.monotonic()
+                self._play_end = max(now, self._play_end) + len(piece) / bytes_per_second
+
+    def _get_aplay(self, audio_format):
+        """Returns aplay running with the given format, starting it if needed.
+
+        Must be called with the lock held.
+        """
+        if (not self._aplay or self._format != audio_format or
+                self._aplay.poll() is not None):
+            self._aplay = subprocess.Popen(
+                self._aplay_cmd(*audio_format), stdin=subprocess.PIPE, bufsize=0)
+            self._format = audio_format
+            self._play_end = 0.0
+
+        return self._aplay
+
+    def _aplay_cmd(self, sample_rate, sample_width):
+        return [
             'aplay',
             '-q',
             '-t', 'raw',
@@ -49,25 +269,117 @@ class Player(object):
             '-r', str(sample_rate),
         ]
 
-        aplay = subprocess.Popen(cmd, stdin=subprocess.PIPE)
-        aplay.stdin.write(audio_bytes)
-        aplay.stdin.close()
-        retcode = aplay.wait()
 
-        if retcode:
-            logger.error('aplay failed with %d', retcode)
+class PcmCache(object):
 
-    def play_wav(self, wav_path):
-        """Play audio from the given WAV file.
+    """An LRU cache of decoded WAV files.
 
-        The file should be mono and small enough to load into memory.
-        Args:
-          wav_path: path to the wav file
-        """
+    Entries are keyed by path and checked against the file's modification
+    time, so an edited file is read again. The least recently used entries are
+    evicted when the decoded audio exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        # path -> (mtime, Pcm), least recently used first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, wav_path):
+        """Returns the Pcm for the given WAV file, reading it if necessary."""
+        mtime = os.stat(wav_path).st_mtime_ns
+        with self._lock:
+            entry = self._entries.get(wav_path)
+            if entry and entry[0] == mtime:
+                self._entries.move_to_end(wav_path)
+                return entry[1]
 
         with wave.open(wav_path, 'r') as wav:
-            if wav.getnchannels() != 1:
-                raise ValueError(wav_path + ' is not a mono file')
+            pcm = Pcm(wav.readframes(wav.getnframes()), wav.getnchannels(),
+                      wav.getsampwidth(), wav.getframerate())
+
+        with self._lock:
+            self._remove(wav_path)
+            if len(pcm.frames) <= self._max_bytes:
+                self._entries[wav_path] = (mtime, pcm)
+                self._bytes += len(pcm.frames)
+                while self._bytes > self._max_bytes:
+                    self._remove(next(iter(self._entries)))
+        return pcm
+
+    def _remove(self, wav_path):
+        entry = self._entries.pop(wav_path, None)
+        if entry:
+            self._bytes -= len(entry[1].frames)
+
+
+_pcm_cache = PcmCache()
+
+
+def get_pcm_cache():
+    """Returns the PcmCache shared by all players."""
+    return _pcm_cache
+
+
+class PlaybackStream(object):
+
+    """Plays audio as it is written.
+
+    The stream is a clip in the Player's queue, so it starts playing as soon
+    as the clips before it have finished and its first audio has been written,
+    even if the rest of the audio is still arriving.
+    """
+
+    def __init__(self, clip):
+        self._clip = clip
+        self._closed = False
+
+    @property
+    def future(self):
+        """A Future that completes when all the audio has been played."""
+        return self._clip.future
+
+    def write(self, audio_bytes):
+        """Queues audio for playback without blocking."""
+        self._clip.add(audio_bytes)
+
+    def finish(self):
+        """Marks the end of the audio, without waiting for it to be played."""
+        if not self._closed:
+            self._closed = True
+            self._clip.end()
+
+    def close(self):
+        """Waits until all the written audio has been played."""
+        self.finish()
+        _wait(self._clip.future)
+
+
+class _Clip(object):
+
+    """Audio queued for playback, which may still be arriving."""
+
+    def __init__(self, sample_rate, sample_width, generation):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.generation = generation
+        self.future = concurrent.futures.Future()
+        self._chunks = queue.Queue()
+
+    def add(self, audio_bytes):
+        self._chunks.put(audio_bytes)
+
+    def end(self):
+        self._chunks.put(None)
+
+    def get(self, timeout=None):
+        return self._chunks.get(timeout=timeout)
+
 
-            frames = wav.readframes(wav.getnframes())
-            self.play_bytes(frames, wav.getframerate(), wav.getsampwidth())
+def _wait(future):
+    """Waits for a clip to finish, returning early if it is interrupted."""
+    try:
+        future.result()
+    except concurrent.futures.CancelledError:
+        pass
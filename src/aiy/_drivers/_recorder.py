@@ -14,16 +14,31 @@
 
 """A recorder driver capable of recording voice samples from the VoiceHat microphones."""
 
+import collections
 import logging
 import os
-import subprocess
 import threading
+import time
 import wave
 
-import aiy._drivers._alsa
+import aiy._drivers._capture
 
 logger = logging.getLogger('recorder')
 
+# What a processor queue does when it is full.
+OVERFLOW_DROP_OLDEST = 'drop-oldest'
+OVERFLOW_DROP_NEWEST = 'drop-newest'
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_BLOCK)
+
+ProcessorStats = collections.namedtuple('ProcessorStats', [
+    'backlog',     # chunks waiting in the queue
+    'delivered',   # chunks passed to add_data
+    'dropped',     # chunks discarded because the queue was full
+    'lag_s',       # capture-to-processed time of the last chunk
+    'max_lag_s',   # worst capture-to-processed time seen
+])
+
 
 class Recorder(threading.Thread):
 
@@ -33,46 +48,76 @@ class Recorder(threading.Thread):
     callbacks. It reads audio in a configurable format from the microphone,
     then converts it to a known format before passing it to the processors.
 
-    This driver accumulates input (audio samples) in a local buffer. Once the
-    buffer contains more than CHUNK_S seconds, it passes the chunk to all
-    processors. An audio processor defines a 'add_data' method that receives
-    the chunk of audio samples to process.
+    This driver reads input (audio samples) into a preallocated ring of
+    CHUNK_S second chunks. Each complete chunk is passed to all processors. An
+    audio processor defines a 'add_data' method that receives the chunk of
+    audio samples to process.
+
+    By default processors run on the capture thread, so a slow processor delays
+    all the others. If processor_queue is set, each processor instead gets its
+    own worker thread fed from a queue of at most that many chunks, and the
+    overflow policy decides what happens when a processor falls behind.
+
+    The recorder can also keep the last preroll_s seconds of audio, so that a
+    processor added when a trigger fires can be primed with the speech that
+    started just before it.
     """
 
     CHUNK_S = 0.1
+    RING_CHUNKS = 4
 
     def __init__(self, input_device='default',
-                 channels=1, bytes_per_sample=2, sample_rate_hz=16000):
+                 channels=1, bytes_per_sample=2, sample_rate_hz=16000,
+                 processor_queue=0, overflow=OVERFLOW_DROP_OLDEST,
+                 backend=aiy._drivers._capture.BACKEND_ARECORD, preroll_s=0):
         """Create a Recorder with the given audio format.
 
         The Recorder will not start until start() is called. start() is called
         automatically if the Recorder is used in a `with`-statement.
 
-        - input_device: name of ALSA device (for a list, run `arecord -L`)
+        - input_device: name of ALSA device (for a list, run `arecord -L`), or
+          the file to replay with the file backend
         - channels: number of channels in audio read from the mic
         - bytes_per_sample: sample width in bytes (eg 2 for 16-bit audio)
         - sample_rate_hz: sample rate in hertz
+        - processor_queue: if non-zero, run each processor in its own thread
+          with a queue of up to this many chunks
+        - overflow: one of OVERFLOW_POLICIES, used when a processor queue is
+          full
+        - backend: the name of a capture backend in aiy._drivers._capture, or a
+          CaptureBackend instance
+        - preroll_s: seconds of recent audio to keep for add_processor(preroll=True)
         """
 
         super().__init__()
 
-        self._processors = []
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('overflow must be one of %s' % ', '.join(OVERFLOW_POLICIES))
 
-        self._chunk_bytes = int(self.CHUNK_S * sample_rate_hz) * channels * bytes_per_sample
+        # Copy-on-write: these are replaced, not modified, when processors are
+        # added or removed, so the recording thread can use them without copying.
+        self._processors = ()
+        self._workers = {}
+        self._worker_list = ()
+        self._processor_queue = processor_queue
+        self._overflow = overflow
+        # Guards changes to the processors and the ring's history, see
+        # _read_stream().
+        self._lock = threading.Lock()
 
-        self._cmd = [
-            'arecord',
-            '-q',
-            '-t', 'raw',
-            '-D', input_device,
-            '-c', str(channels),
-            '-f', aiy._drivers._alsa.sample_width_to_string(bytes_per_sample),
-            '-r', str(sample_rate_hz),
-        ]
-        self._arecord = None
+        self._chunk_bytes = int(self.CHUNK_S * sample_rate_hz) * channels * bytes_per_sample
+        self._preroll_chunks = int(round(preroll_s / self.CHUNK_S))
+        # The slot being filled must never be part of the pre-roll.
+        self._ring = _ChunkRing(self._chunk_bytes,
+                                max(self.RING_CHUNKS, self._preroll_chunks + 1))
+
+        if isinstance(backend, str):
+            backend = aiy._drivers._capture.make_backend(
+                backend, input_device, channels, bytes_per_sample, sample_rate_hz)
+        self._backend = backend
         self._closed = False
 
-    def add_processor(self, processor):
+    def add_processor(self, processor, preroll=False):
         """Adds an audio processor.
 
         An audio processor is an object that has an 'add_data' method with the
@@ -85,52 +130,113 @@ class Recorder(threading.Thread):
             # processes the chunk of data here.
 
         The added processor may be called multiple times with chunks of audio data.
+        Each chunk is a read-only memoryview into the recorder's ring buffer,
+        which is only valid until add_data returns. A processor that keeps the
+        data for later must take an explicit copy, eg with bytes(data).
+        When processors run in worker threads they receive bytes instead.
+
+        If preroll is True, the processor first receives the recorder's
+        pre-roll history as a single bytes object, followed by the chunks
+        recorded after it.
         """
-        self._processors.append(processor)
+        with self._lock:
+            history = self._ring.history(self._preroll_chunks) if preroll else None
+
+            if self._processor_queue:
+                worker = _ProcessorWorker(processor, self._processor_queue, self._overflow)
+                if history:
+                    worker.put(history)
+                worker.start()
+                workers = dict(self._workers)
+                workers[processor] = worker
+                self._workers = workers
+                self._worker_list = tuple(workers.values())
+            elif history:
+                processor.add_data(history)
+
+            self._processors += (processor,)
 
     def remove_processor(self, processor):
         """Removes an added audio processor."""
 
-        try:
-            self._processors.remove(processor)
-        except ValueError:
-            logger.warn("processor was not found in the list")
+        with self._lock:
+            if processor in self._processors:
+                processors = list(self._processors)
+                processors.remove(processor)
+                self._processors = tuple(processors)
+            else:
+                logger.warn("processor was not found in the list")
+
+            workers = dict(self._workers)
+            worker = workers.pop(processor, None)
+            self._workers = workers
+            self._worker_list = tuple(workers.values())
+
+        if worker:
+            worker.stop()
+
+    def get_processor_stats(self):
+        """Returns a dict of ProcessorStats for each queued processor."""
+        return {p: w.get_stats() for p, w in self._workers.items()}
 
     def run(self):
-        """Reads data from arecord and passes to processors."""
+        """Reads data from the capture backend and passes to processors.
 
-        self._arecord = subprocess.Popen(self._cmd, stdout=subprocess.PIPE)
-        logger.info("started recording")
+        The process exits if capturing fails, as it can't work without audio.
+        """
 
-        # Check for race-condition when __exit__ is called at the same time as
-        # the process is started by the background thread
-        if self._closed:
-            self._arecord.kill()
+        try:
+            self._backend.start()
+            logger.info("started recording")
+
+            # Check for race-condition when __exit__ is called at the same time as
+            # the backend is started by the background thread
+            if self._closed:
+                self._backend.stop()
+                return
+
+            self._read_stream(self._backend)
+        except Exception:  # pylint: disable=broad-except
+            if not self._closed:
+                logger.exception('Audio capture failed, aborting...')
+                _abort()
             return
 
-        this_chunk = b''
+        if self._backend.finite:
+            logger.info('audio input finished')
+        elif not self._closed:
+            logger.error('Microphone recorder died unexpectedly, aborting...')
+            _abort()
 
+    def _read_stream(self, stream):
+        """Reads chunks from a binary stream until EOF and passes them on."""
         while True:
-            input_data = self._arecord.stdout.read(self._chunk_bytes)
-            if not input_data:
+            chunk = self._ring.fill(stream)
+            if chunk is None:
                 break
 
-            this_chunk += input_data
-            if len(this_chunk) >= self._chunk_bytes:
-                self._handle_chunk(this_chunk[:self._chunk_bytes])
-                this_chunk = this_chunk[self._chunk_bytes:]
+            # Committing the chunk to the history and choosing its processors
+            # under one lock means a processor added with pre-roll gets each
+            # chunk exactly once. The processors are immutable tuples, so
+            # taking them needs no copy.
+            with self._lock:
+                self._ring.commit()
+                processors = self._processors
+                workers = self._worker_list
 
-        if not self._closed:
-            logger.error('Microphone recorder died unexpectedly, aborting...')
-            # sys.exit doesn't work from background threads, so use os._exit as
-            # an emergency measure.
-            logging.shutdown()
-            os._exit(1)  # pylint: disable=protected-access
+            self._handle_chunk(chunk, processors, workers)
 
-    def _handle_chunk(self, chunk):
+    def _handle_chunk(self, chunk, processors, workers):
         """Send audio chunk to all processors."""
-        for p in self._processors:
-            p.add_data(chunk)
+        if self._processor_queue:
+            if workers:
+                # One copy is shared by all the workers, as the ring is reused.
+                data = bytes(chunk)
+                for worker in workers:
+                    worker.put(data)
+        else:
+            for p in processors:
+                p.add_data(chunk)
 
     def __enter__(self):
         self.start()
@@ -138,5 +244,143 @@ class Recorder(threading.Thread):
 
     def __exit__(self, *args):
         self._closed = True
-        if self._arecord:
-            self._arecord.kill()
+        self._backend.stop()
+        for worker in self._worker_list:
+            worker.stop()
+
+
+def _abort():
+    # sys.exit doesn't work from background threads, so use os._exit as an
+    # emergency measure.
+    logging.shutdown()
+    os._exit(1)  # pylint: disable=protected-access
+
+
+class _ProcessorWorker(threading.Thread):
+
+    """Feeds chunks to one processor from a bounded queue."""
+
+    def __init__(self, processor, max_chunks, overflow):
+        super().__init__(daemon=True)
+
+        self._processor = processor
+        self._max_chunks = max_chunks
+        self._overflow = overflow
+
+        self._chunks = collections.deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+
+        self._delivered = 0
+        self._dropped = 0
+        self._lag_s = 0.0
+        self._max_lag_s = 0.0
+
+    def put(self, data):
+        """Queues a chunk, applying the overflow policy if the queue is full."""
+        with self._cond:
+            if self._stopped:
+                return
+            if len(self._chunks) >= self._max_chunks:
+                if self._overflow == OVERFLOW_BLOCK:
+                    while len(self._chunks) >= self._max_chunks and not self._stopped:
+                        self._cond.wait()
+                elif self._overflow == OVERFLOW_DROP_NEWEST:
+                    self._dropped += 1
+                    return
+                else:
+                    self._chunks.popleft()
+                    self._dropped += 1
+
+            self._chunks.append((time.monotonic(), data))
+            self._cond.notify_all()
+
+    def stop(self):
+        """Stops the worker, discarding any queued chunks."""
+        with self._cond:
+            self._stopped = True
+            self._chunks.clear()
+            self._cond.notify_all()
+
+    def get_stats(self):
+        with self._cond:
+            return ProcessorStats(len(self._chunks), self._delivered,
+                                  self._dropped, self._lag_s, self._max_lag_s)
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._chunks and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                queued_at, data = self._chunks.popleft()
+                # Wake up the capture thread if it is blocked on a full queue.
+                self._cond.notify_all()
+
+            self._processor.add_data(data)
+
+            lag_s = time.monotonic() - queued_at
+            with self._cond:
+                self._delivered += 1
+                self._lag_s = lag_s
+                self._max_lag_s = max(self._max_lag_s, lag_s)
+
+
+class _ChunkRing(object):
+
+    """A preallocated ring of fixed-size audio chunks.
+
+    Chunks are read straight into the ring with readinto(), so no intermediate
+    bytes objects are created. Each filled chunk is returned as a read-only
+    memoryview that stays valid until the ring wraps around to the same slot.
+    Committed chunks also serve as a history of the most recent audio.
+    """
+
+    def __init__(self, chunk_bytes, num_chunks):
+        self._chunk_bytes = chunk_bytes
+        self._num_chunks = num_chunks
+        self._buf = bytearray(chunk_bytes * num_chunks)
+        self._view = memoryview(self._buf)
+        # The views of each slot are made once, not for every chunk.
+        self._slots = [self._view[i * chunk_bytes:(i + 1) * chunk_bytes]
+                       for i in range(num_chunks)]
+        self._readonly_slots = [slot.toreadonly() for slot in self._slots]
+        self._next = 0
+        self._committed = 0
+
+    def fill(self, stream):
+        """Reads the next chunk from the stream into the ring.
+
+        The chunk is not part of the history until commit() is called.
+
+        Returns a read-only memoryview of the chunk, or None if the stream
+        ended before a complete chunk was read.
+        """
+        slot = self._slots[self._next]
+
+        filled = stream.readinto(slot) or 0
+        while filled < self._chunk_bytes:
+            count = stream.readinto(slot[filled:])
+            if not count:
+                return None
+            filled += count
+
+        return self._readonly_slots[self._next]
+
+    def commit(self):
+        """Adds the chunk from the last fill() to the history."""
+        self._next += 1
+        if self._next == self._num_chunks:
+            self._next = 0
+        if self._committed < self._num_chunks:
+            self._committed += 1
+
+    def history(self, num_chunks):
+        """Returns up to num_chunks of the most recent committed audio as bytes."""
+        num_chunks = min(num_chunks, self._committed, self._num_chunks - 1)
+        end = self._next * self._chunk_bytes
+        start = end - num_chunks * self._chunk_bytes
+        if start >= 0:
+            return bytes(self._view[start:end])
+        return b''.join((self._view[start:], self._view[:end]))
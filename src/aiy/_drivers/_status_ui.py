@@ -52,6 +52,7 @@ class _StatusUi(object):
         """
         if trigger_sound_wave and os.path.exists(os.path.expanduser(trigger_sound_wave)):
             self.trigger_sound_wave = os.path.expanduser(trigger_sound_wave)
+            aiy.audio.preload_wave(self.trigger_sound_wave)
         else:
             if trigger_sound_wave:
                 logger.warning(
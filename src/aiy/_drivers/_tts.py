@@ -14,19 +14,193 @@
 
 """Wrapper around a TTS system."""
 
+import atexit
+import collections
+import concurrent.futures
 import functools
+import hashlib
 import logging
 import os
+import re
+import shutil
+import struct
 import subprocess
 import tempfile
+import threading
+import wave
 
+import aiy._drivers._player
 import aiy.i18n
 
 # Path to a tmpfs directory to avoid SD card wear
 TMP_DIR = '/run/user/%d' % os.getuid()
 
+# Bytes of synthesized audio to read from pico2wave at a time.
+CHUNK_BYTES = 3200
+
+# say() synthesizes text a sentence at a time. Shorter sentences are joined
+# to the next one, and longer ones are split between clauses.
+MIN_SENTENCE_CHARS = 20
+MAX_SENTENCE_CHARS = 200
+
+# pico2wave markup that sets the volume and pitch of the voice.
+MARKUP = '<volume level="60"><pitch level="130">%s</pitch></volume>'
+
+# Default size limits for synthesized speech kept in memory and on disk.
+MEMORY_CACHE_BYTES = 4 * 1024 * 1024
+DISK_CACHE_BYTES = 32 * 1024 * 1024
+
 logger = logging.getLogger('tts')
 
+_SENTENCE_END = re.compile(r'(?<=[.!?;:])\s+')
+_CLAUSE_END = re.compile(r'(?<=,)\s+')
+
+
+class TtsCache(object):
+
+    """A content-addressed cache of synthesized speech.
+
+    Entries are keyed by a hash of the language and the marked-up text, so a
+    change to either (or to MARKUP) synthesizes the words again. The least
+    recently used entries are kept in memory, up to max_bytes of audio. If a
+    cache directory is set, entries are also stored there as WAV files, up to
+    max_disk_bytes, so they survive restarts.
+    """
+
+    def __init__(self, max_bytes=MEMORY_CACHE_BYTES, cache_dir=None,
+                 max_disk_bytes=DISK_CACHE_BYTES):
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        # key -> Pcm, least recently used first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.set_cache_dir(cache_dir, max_disk_bytes)
+
+    def set_cache_dir(self, cache_dir, max_disk_bytes=DISK_CACHE_BYTES):
+        """Sets the directory for the on-disk tier, or None to disable it."""
+        files = collections.OrderedDict()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            files = _scan_files(cache_dir)
+        with self._lock:
+            self._cache_dir = cache_dir
+            self._max_disk_bytes = max_disk_bytes
+            # key -> file size, least recently used first. The directory is
+            # only scanned here, so storing a file doesn't list it again.
+            self._files = files
+            self._disk_bytes = sum(files.values())
+
+    @staticmethod
+    def key(text, lang):
+        """Returns the cache key for the given marked-up text."""
+        return hashlib.sha1(('%s\n%s' % (lang, text)).encode('utf-8')).hexdigest()
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._entries:
+                return True
+        return bool(self._cache_dir) and os.path.exists(self._path(key))
+
+    def get(self, key):
+        """Returns the cached Pcm for the key, or None."""
+        with self._lock:
+            pcm = self._entries.get(key)
+            if pcm:
+                self._entries.move_to_end(key)
+                return pcm
+
+        if not self._cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with wave.open(path, 'r') as wav:
+                pcm = aiy._drivers._player.Pcm(
+                    wav.readframes(wav.getnframes()), wav.getnchannels(),
+                    wav.getsampwidth(), wav.getframerate())
+            # Mark the file as recently used for eviction.
+            os.utime(path)
+        except (IOError, OSError, EOFError, wave.Error):
+            return None
+        with self._lock:
+            if key in self._files:
+                self._files.move_to_end(key)
+
+        self._remember(key, pcm)
+        return pcm
+
+    def put(self, key, pcm):
+        """Stores the Pcm under the key."""
+        self._remember(key, pcm)
+        if self._cache_dir:
+            try:
+                self._store(key, pcm)
+            except (IOError, OSError):
+                logger.exception('Failed to store TTS audio in %s', self._cache_dir)
+
+    def _remember(self, key, pcm):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= len(old.frames)
+            if len(pcm.frames) <= self._max_bytes:
+                self._entries[key] = pcm
+                self._bytes += len(pcm.frames)
+                while self._bytes > self._max_bytes:
+                    _, old = self._entries.popitem(last=False)
+                    self._bytes -= len(old.frames)
+
+    def _path(self, key):
+        return os.path.join(self._cache_dir, key + '.wav')
+
+    def _store(self, key, pcm):
+        # Write to a temporary file first, so readers never see partial files.
+        (fd, tmp_path) = tempfile.mkstemp(suffix='.tmp', dir=self._cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f, wave.open(f, 'wb') as wav:
+                wav.setnchannels(pcm.channels)
+                wav.setsampwidth(pcm.sample_width)
+                wav.setframerate(pcm.sample_rate)
+                wav.writeframes(pcm.frames)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        # Remove the least recently used files beyond max_disk_bytes.
+        evicted = []
+        with self._lock:
+            self._disk_bytes += size - self._files.pop(key, 0)
+            self._files[key] = size
+            while self._disk_bytes > self._max_disk_bytes:
+                old_key, old_size = self._files.popitem(last=False)
+                self._disk_bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.unlink(self._path(old_key))
+            except OSError:
+                pass
+
+
+def _scan_files(cache_dir):
+    """Returns the sizes of the cached files by key, least recently used first."""
+    files = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.wav'):
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name[:-len('.wav')], stat.st_size))
+    files.sort()
+    return collections.OrderedDict((key, size) for _, key, size in files)
+
+
+_cache = TtsCache()
+
+
+def get_cache():
+    """Returns the TtsCache shared by all say() calls."""
+    return _cache
+
 
 def create_say(player):
     """Return a function say(words) for the given player.
@@ -38,27 +212,198 @@ def create_say(player):
 def say(player, words, lang='en-US'):
     """Say the given words with TTS.
 
+    The words are split into sentences. Each sentence starts playing while it
+    is still being synthesized, and the next one is synthesized while it
+    plays, so long responses start as quickly as short ones. Synthesized
+    sentences are cached. If the player is interrupted, the rest of the words
+    are not synthesized.
+
     Args:
       player: To play the text-to-speech audio.
       words: string to say aloud.
       lang: language for the text-to-speech engine.
     """
+    playing = collections.deque()
+    for sentence in split_sentences(words):
+        # Stay one sentence ahead of the one that is playing.
+        if len(playing) > 1:
+            concurrent.futures.wait([playing.popleft()])
+        if any(future.cancelled() for future in playing):
+            return
+        future = _play_sentence(player, sentence, lang)
+        if future.cancelled():
+            return
+        playing.append(future)
+    concurrent.futures.wait(playing)
 
+
+def split_sentences(text):
+    """Splits text into the pieces that say() synthesizes one at a time.
+
+    Pieces shorter than MIN_SENTENCE_CHARS are joined to the next one, and
+    sentences longer than MAX_SENTENCE_CHARS are split between clauses.
+    """
+    pieces = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        if len(sentence) > MAX_SENTENCE_CHARS:
+            pieces.extend(_CLAUSE_END.split(sentence))
+        else:
+            pieces.append(sentence)
+
+    sentences = []
+    pending = ''
+    for piece in pieces:
+        pending = pending + ' ' + piece if pending else piece
+        if len(pending) >= MIN_SENTENCE_CHARS:
+            sentences.append(pending)
+            pending = ''
+    if pending:
+        sentences.append(pending)
+    return sentences
+
+
+def synthesize(words, lang='en-US'):
+    """Returns the Pcm for the given words, using the cached sentences."""
+    pcms = []
+    for sentence in split_sentences(words):
+        text = MARKUP % sentence
+        key = TtsCache.key(text, lang)
+        pcm = _cache.get(key)
+        if pcm is None:
+            pcm = _join(list(_pico2wave(text, lang)))
+            _cache.put(key, pcm)
+        pcms.append(pcm)
+    return _join(pcms)
+
+
+def presynthesize(phrases, lang='en-US'):
+    """Synthesizes the sentences of the phrases that are not cached yet.
+
+    Returns the number of sentences that were synthesized.
+    """
+    count = 0
+    sentences = {sentence for words in phrases for sentence in split_sentences(words)}
+    for sentence in sorted(sentences):
+        text = MARKUP % sentence
+        key = TtsCache.key(text, lang)
+        if key not in _cache:
+            _cache.put(key, _join(list(_pico2wave(text, lang))))
+            count += 1
+    return count
+
+
+def _play_sentence(player, sentence, lang):
+    """Queues the sentence for playback, synthesizing it if necessary.
+
+    Returns the Future of the queued clip.
+    """
+    text = MARKUP % sentence
+    key = TtsCache.key(text, lang)
+    pcm = _cache.get(key)
+    if pcm:
+        return player.enqueue(pcm.frames, pcm.sample_rate, pcm.sample_width)
+
+    stream = None
+    chunks = []
     try:
-        (fd, tts_wav) = tempfile.mkstemp(suffix='.wav', dir=TMP_DIR)
-    except IOError:
-        logger.exception('Using fallback directory for TTS output')
-        (fd, tts_wav) = tempfile.mkstemp(suffix='.wav')
+        for chunk in _pico2wave(text, lang):
+            if not stream:
+                stream = player.open_stream(chunk.sample_rate, chunk.sample_width)
+            if stream.future.cancelled():
+                return stream.future
+            stream.write(chunk.frames)
+            chunks.append(chunk)
+    finally:
+        if stream:
+            stream.finish()
+    _cache.put(key, _join(chunks))
+    return stream.future
 
-    os.close(fd)
 
-    words = '<volume level="60"><pitch level="130">%s</pitch></volume>' % words
+def _pico2wave(text, lang):
+    """Runs pico2wave, yielding its audio as Pcm chunks while it is synthesized.
 
+    pico2wave only writes to files with a .wav suffix, so it is given a
+    symlink to its own stdout and the audio is read from a pipe, without
+    touching the disk.
+    """
+    process = subprocess.Popen(
+        ['pico2wave', '--lang', lang, '-w', _get_stdout_wav(), text],
+        stdout=subprocess.PIPE)
     try:
-        subprocess.call(['pico2wave', '--lang', lang, '-w', tts_wav, words])
-        player.play_wav(tts_wav)
+        channels, sample_width, sample_rate = _read_wav_header(process.stdout)
+        if channels != 1:
+            raise wave.Error('pico2wave produced %d channels' % channels)
+        while True:
+            frames = process.stdout.read1(CHUNK_BYTES)
+            if not frames:
+                break
+            yield aiy._drivers._player.Pcm(frames, channels, sample_width, sample_rate)
     finally:
-        os.unlink(tts_wav)
+        if process.poll() is None:
+            # Stopped early, so the rest of the audio is not wanted.
+            process.kill()
+        process.stdout.close()
+        process.wait()
+
+
+def _get_stdout_wav():
+    """Returns the path of a .wav symlink to /dev/stdout, creating it once."""
+    global _stdout_wav
+    with _stdout_wav_lock:
+        if not _stdout_wav:
+            try:
+                tmp_dir = tempfile.mkdtemp(dir=TMP_DIR)
+            except IOError:
+                logger.exception('Using fallback directory for TTS output')
+                tmp_dir = tempfile.mkdtemp()
+            atexit.register(shutil.rmtree, tmp_dir, True)
+            path = os.path.join(tmp_dir, 'stdout.wav')
+            os.symlink('/dev/stdout', path)
+            _stdout_wav = path
+        return _stdout_wav
+
+
+_stdout_wav = None
+_stdout_wav_lock = threading.Lock()
+
+
+def _read_wav_header(stream):
+    """Reads a WAV header up to the start of the audio data.
+
+    Returns (channels, sample width, sample rate). The size of the data chunk
+    is ignored, because pico2wave cannot fill it in when writing to a pipe.
+    """
+    riff = _read_exactly(stream, 12)
+    if riff[:4] != b'RIFF' or riff[8:] != b'WAVE':
+        raise wave.Error('pico2wave did not produce a WAV file')
+    audio_format = None
+    while True:
+        chunk_id, size = struct.unpack('<4sI', _read_exactly(stream, 8))
+        if chunk_id == b'data':
+            if not audio_format:
+                raise wave.Error('WAV data before format')
+            return audio_format
+        body = _read_exactly(stream, size + (size & 1))
+        if chunk_id == b'fmt ':
+            _, channels, sample_rate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+            audio_format = (channels, bits // 8, sample_rate)
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise EOFError('pico2wave output ended early')
+    return data
+
+
+def _join(chunks):
+    """Joins Pcm chunks of the same format into one Pcm."""
+    if not chunks:
+        raise EOFError('pico2wave produced no audio')
+    if len(chunks) == 1:
+        return chunks[0]
+    return chunks[0]._replace(frames=b''.join(chunk.frames for chunk in chunks))
 
 
 def _main():
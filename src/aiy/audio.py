@@ -17,6 +17,7 @@
 import time
 import wave
 
+import aiy._drivers._capture
 import aiy._drivers._player
 import aiy._drivers._recorder
 import aiy._drivers._tts
@@ -24,6 +25,13 @@ import aiy._drivers._tts
 AUDIO_SAMPLE_SIZE = 2  # bytes per sample
 AUDIO_SAMPLE_RATE_HZ = 16000
 
+OVERFLOW_DROP_OLDEST = aiy._drivers._recorder.OVERFLOW_DROP_OLDEST
+OVERFLOW_DROP_NEWEST = aiy._drivers._recorder.OVERFLOW_DROP_NEWEST
+OVERFLOW_BLOCK = aiy._drivers._recorder.OVERFLOW_BLOCK
+OVERFLOW_POLICIES = aiy._drivers._recorder.OVERFLOW_POLICIES
+
+CAPTURE_BACKENDS = aiy._drivers._capture.BACKENDS
+
 # Global variables. They are lazily initialized.
 _voicehat_recorder = None
 _voicehat_player = None
@@ -71,15 +79,16 @@ def get_player():
     return _voicehat_player
 
 
-def get_recorder():
+def get_recorder(**kwargs):
     """Returns a driver to control the VoiceHat microphones.
 
     The aiy modules automatically use this recorder. So usually you do not need to
-    use this.
+    use this. Keyword arguments are passed to the Recorder when it is first
+    created, so they only take effect on the first call.
     """
     global _voicehat_recorder
     if _voicehat_recorder is None:
-        _voicehat_recorder = aiy._drivers._recorder.Recorder()
+        _voicehat_recorder = aiy._drivers._recorder.Recorder(**kwargs)
     return _voicehat_recorder
 
 
@@ -102,6 +111,12 @@ def play_wave(wave_file):
     player.play_wav(wave_file)
 
 
+def preload_wave(wave_file):
+    """Decodes the given wave file ahead of time, so playing it is instant."""
+    player = get_player()
+    player.preload_wav(wave_file)
+
+
 def play_audio(audio_data):
     """Plays the given audio data."""
     player = get_player()
@@ -119,6 +134,26 @@ def say(words, lang=None):
     aiy._drivers._tts.say(aiy.audio.get_player(), words, lang=lang)
 
 
+def set_tts_cache_dir(cache_dir, max_bytes=aiy._drivers._tts.DISK_CACHE_BYTES):
+    """Keeps synthesized speech in the given directory across restarts.
+
+    At most max_bytes of audio are kept; the least recently used files are
+    removed first. Pass None to keep synthesized speech in memory only.
+    """
+    aiy._drivers._tts.get_cache().set_cache_dir(cache_dir, max_bytes)
+
+
+def presynthesize(phrases, lang=None):
+    """Synthesizes the given phrases into the TTS cache ahead of time.
+
+    Phrases are synthesized a sentence at a time, like say() does. Returns the
+    number of sentences that were not cached yet.
+    """
+    if not lang:
+        lang = aiy.i18n.get_language_code()
+    return aiy._drivers._tts.presynthesize(phrases, lang=lang)
+
+
 def get_status_ui():
     """Returns a driver to access the StatusUI daemon.
 
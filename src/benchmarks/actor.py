@@ -0,0 +1,103 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""Compare Actor keyword matching with a linear scan of the handlers.
+
+Also times fuzzy matching of commands with misspelled keywords.
+
+Run from the src directory:
+    python3 -m benchmarks.actor --keywords 500 --commands 2000
+"""
+
+import argparse
+import random
+import time
+
+import actionbase
+
+# Words around the keywords in the commands.
+FILLER = ('please', 'can', 'you', 'turn', 'the', 'on', 'off', 'what', 'is',
+          'set', 'to', 'my', 'in', 'a', 'now', 'hey', 'and', 'for', 'it')
+
+
+class _NoAction(object):
+
+    def run(self, voice_command):
+        pass
+
+
+def _linear_can_handle(actor, command):
+    """The old scan, which lowercases the command for every handler."""
+    for handler in actor.handlers:
+        if handler.can_handle(command):
+            return True
+    return False
+
+
+def _run(name, can_handle, actor, commands):
+    start = time.perf_counter()
+    handled = sum(1 for command in commands if can_handle(actor, command))
+    elapsed = time.perf_counter() - start
+    print('%-8s %8.1f us/command  (%d of %d handled)' % (
+        name, elapsed / len(commands) * 1e6, handled, len(commands)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keywords', type=int, default=500,
+                        help='Number of generated keywords')
+    parser.add_argument('--commands', type=int, default=2000,
+                        help='Number of generated commands to match')
+    args = parser.parse_args()
+
+    rand = random.Random(0)
+
+    # Keywords are pairs of made up names, like device and room names.
+    names = [''.join(rand.choice('bcdfgklmnprstvz') + rand.choice('aeiou')
+                     for _ in range(rand.randint(2, 4)))
+             for _ in range(args.keywords)]
+
+    def phrase(words, length):
+        return ' '.join(rand.choice(words) for _ in range(length))
+
+    actor = actionbase.Actor()
+    for _ in range(args.keywords):
+        actor.add_keyword(phrase(names, 2), _NoAction())
+    # About half the commands contain a keyword.
+    commands = [phrase(FILLER, 4) + ' ' + phrase(names, 2)
+                for _ in range(args.commands)]
+    for i in range(0, len(commands), 2):
+        commands[i] = phrase(FILLER, 4) + ' ' + rand.choice(actor.handlers).keyword
+
+    start = time.perf_counter()
+    actor.can_handle('')
+    print('%d keywords, matcher built in %.1f ms' % (
+        args.keywords, (time.perf_counter() - start) * 1e3))
+
+    _run('linear', _linear_can_handle, actor, commands)
+    _run('matcher', actionbase.Actor.can_handle, actor, commands)
+
+    def misspell(text):
+        i = rand.randrange(len(text))
+        return text[:i] + rand.choice('aeiou') + text[i + 1:]
+
+    actor.set_fuzzy_matching()
+    _run('fuzzy', actionbase.Actor.can_handle, actor,
+         [misspell(command) for command in commands])
+
+
+if __name__ == '__main__':
+    main()
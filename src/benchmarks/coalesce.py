@@ -0,0 +1,129 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""Compare sending each audio chunk as a message with coalescing queued chunks.
+
+A producer queues 100 ms chunks in real time (optionally sped up) while a
+simulated uplink sends messages, with a fixed cost per message plus the time
+to send its bytes, and stalls now and then. Bytes on the wire include the
+protobuf, gRPC and HTTP/2 framing of each message.
+
+Run from the src directory:
+    python3 -m benchmarks.coalesce --seconds 30 --speedup 10
+"""
+
+import argparse
+import threading
+import time
+
+import aiy._apis._audio_queue
+
+CHUNK_BYTES = 3200
+MAX_REQUEST_BYTES = 32000
+HTTP2_MAX_FRAME = 16384
+
+
+def _varint_size(value):
+    size = 1
+    while value >= 0x80:
+        value >>= 7
+        size += 1
+    return size
+
+
+def _wire_bytes(payload):
+    """Bytes on the wire for one audio request with the given payload."""
+    # The audio bytes field, inside the request message.
+    message = 1 + _varint_size(payload) + payload
+    # gRPC length prefix, and one HTTP/2 frame header per frame.
+    grpc = 5 + message
+    frames = -(-grpc // HTTP2_MAX_FRAME)
+    return grpc + 9 * frames
+
+
+def _run(name, batched, args):
+    queue = aiy._apis._audio_queue.AudioQueue(max_bytes=10 ** 9)
+    chunk_s = 0.1 / args.speedup
+    num_chunks = int(args.seconds * 10)
+
+    def produce():
+        start = time.monotonic()
+        for i in range(num_chunks):
+            time.sleep(max(0, start + i * chunk_s - time.monotonic()))
+            queue.put(bytes(CHUNK_BYTES))
+        queue.put(None)
+
+    producer = threading.Thread(target=produce)
+    start = time.monotonic()
+    producer.start()
+
+    messages = wire = 0
+    next_stall = args.stall_every
+    while True:
+        if batched:
+            batch = queue.get_batch(MAX_REQUEST_BYTES)
+            if batch is None:
+                break
+            payload = sum(len(data) for data in batch)
+        else:
+            data = queue.get()
+            if data is None:
+                break
+            payload = len(data)
+
+        # Simulate the uplink, in sped up time.
+        send_s = args.message_cost + payload * 8 / args.uplink_bps
+        elapsed_audio_s = (time.monotonic() - start) * args.speedup
+        if args.stall_every and elapsed_audio_s >= next_stall:
+            send_s += args.stall
+            next_stall += args.stall_every
+        time.sleep(send_s / args.speedup)
+
+        messages += 1
+        wire += _wire_bytes(payload)
+
+    producer.join()
+    elapsed_s = (time.monotonic() - start) * args.speedup
+    stats = queue.get_stats()
+    print('%-9s %6d messages  %5.1f messages/s  %8d bytes on the wire  '
+          '(%.1f%% framing)  max queue wait %.2f s' % (
+              name, messages, messages / elapsed_s, wire,
+              100.0 * (wire - num_chunks * CHUNK_BYTES) / wire,
+              stats.max_wait_s * args.speedup))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=30,
+                        help='Seconds of audio to send')
+    parser.add_argument('--speedup', type=float, default=10,
+                        help='How much faster than real time to run')
+    parser.add_argument('--message-cost', type=float, default=0.01,
+                        help='Seconds of uplink time per message')
+    parser.add_argument('--uplink-bps', type=float, default=1e6,
+                        help='Uplink bits per second')
+    parser.add_argument('--stall', type=float, default=1.0,
+                        help='Seconds the uplink stalls for')
+    parser.add_argument('--stall-every', type=float, default=5.0,
+                        help='Seconds of audio between stalls, or 0 for none')
+    args = parser.parse_args()
+
+    _run('per-chunk', False, args)
+    _run('batched', True, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Measure audio throughput of the Recorder with N dummy processors.
+
+Each run is repeated, and the median and best throughput are reported. Audio
+is read from a stream that always returns whole chunks, and from a stream that
+returns short reads, like a pipe from arecord. Both repeat one second of audio,
+so long runs fit in the memory of a Pi Zero.
+
+Run from the src directory:
+    python3 -m benchmarks.recorder --processors 4 --seconds 30000
+"""
+
+import argparse
+import io
+import statistics
+import time
+
+import aiy._drivers._recorder
+
+# The Recorder's default format: 16 kHz, 16-bit mono.
+SAMPLE_RATE_HZ = 16000
+BYTES_PER_SAMPLE = 2
+CHUNK_BYTES = int(aiy._drivers._recorder.Recorder.CHUNK_S * SAMPLE_RATE_HZ) * BYTES_PER_SAMPLE
+
+# One second of audio, a whole number of chunks, so full reads never wrap.
+_AUDIO = memoryview(bytes(SAMPLE_RATE_HZ * BYTES_PER_SAMPLE))
+
+
+class _DummyProcessor(object):
+
+    """Touches every chunk without keeping it."""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def add_data(self, data):
+        self.bytes += len(data)
+
+
+class _LoopedStream(io.RawIOBase):
+
+    """Returns total_bytes of audio by repeating _AUDIO.
+
+    If max_read is set, reads return at most that many bytes, like a pipe.
+    """
+
+    def __init__(self, total_bytes, max_read=None):
+        self._remaining = total_bytes
+        self._max_read = max_read or len(_AUDIO)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        size = min(len(b), self._max_read, self._remaining, len(_AUDIO) - self._pos)
+        memoryview(b)[:size] = _AUDIO[self._pos:self._pos + size]
+        self._pos = (self._pos + size) % len(_AUDIO)
+        self._remaining -= size
+        return size
+
+
+def _legacy_reader(processors):
+    """The old bytes-concatenating loop, for comparison."""
+    return lambda stream: _legacy_read(stream, CHUNK_BYTES, processors)
+
+
+def _legacy_read(stream, chunk_bytes, processors):
+    this_chunk = b''
+    while True:
+        input_data = stream.read(chunk_bytes)
+        if not input_data:
+            break
+
+        this_chunk += input_data
+        if len(this_chunk) >= chunk_bytes:
+            for p in processors:
+                p.add_data(this_chunk[:chunk_bytes])
+            this_chunk = this_chunk[chunk_bytes:]
+
+
+def _ring_reader(processors):
+    recorder = aiy._drivers._recorder.Recorder()
+    for p in processors:
+        recorder.add_processor(p)
+    return recorder._read_stream  # pylint: disable=protected-access
+
+
+def _run(name, make_reader, max_read, total_bytes, args):
+    rates = []
+    for _ in range(args.repeat):
+        stream = _LoopedStream(total_bytes, max_read)
+        read = make_reader([_DummyProcessor() for _ in range(args.processors)])
+        start = time.perf_counter()
+        read(stream)
+        elapsed = time.perf_counter() - start
+        rates.append(total_bytes / elapsed / 1e6)
+    print('%-20s median %8.1f MB/s  best %8.1f MB/s  (%d runs of %d bytes)' % (
+        name, statistics.median(rates), max(rates), args.repeat, total_bytes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processors', type=int, default=4,
+                        help='Number of dummy processors')
+    parser.add_argument('--seconds', type=float, default=30000,
+                        help='Seconds of 16 kHz mono audio to push through')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of runs of each reader')
+    parser.add_argument('--short-read', type=int, default=1000,
+                        help='Most bytes per read from the short-read stream')
+    args = parser.parse_args()
+
+    total_bytes = int(args.seconds * SAMPLE_RATE_HZ) * BYTES_PER_SAMPLE
+
+    print('%d processors, %.0f s of audio' % (args.processors, args.seconds))
+    _run('legacy full reads', _legacy_reader, None, total_bytes, args)
+    _run('ring full reads', _ring_reader, None, total_bytes, args)
+    _run('legacy short reads', _legacy_reader, args.short_read, total_bytes, args)
+    _run('ring short reads', _ring_reader, args.short_read, total_bytes, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the snowboy decoder's ring buffer with the deque it replaced.
+
+PortAudio delivers 2048-frame callbacks of 16-bit mono audio at 16 kHz into a
+buffer of the detector's 5 seconds capacity, which the detection loop drains
+every few callbacks.
+
+Run from the src directory (needs the snowboy library to import the decoder):
+    python3 -m benchmarks.ringbuffer --seconds 600
+"""
+
+import argparse
+import collections
+import time
+
+from triggers import snowboydecoder
+
+SAMPLE_RATE_HZ = 16000
+BYTES_PER_SAMPLE = 2
+CALLBACK_FRAMES = 2048
+
+
+class DequeRingBuffer(object):
+    """The original ring buffer, a deque of single bytes."""
+
+    def __init__(self, size=4096):
+        self._buf = collections.deque(maxlen=size)
+
+    def extend(self, data):
+        self._buf.extend(data)
+
+    def get(self):
+        tmp = bytes(bytearray(self._buf))
+        self._buf.clear()
+        return tmp
+
+
+def _run(name, buffer_class, args):
+    capacity = SAMPLE_RATE_HZ * BYTES_PER_SAMPLE * 5
+    buffer = buffer_class(capacity)
+    chunk = bytes(range(256)) * (CALLBACK_FRAMES * BYTES_PER_SAMPLE // 256)
+    num_chunks = int(args.seconds * SAMPLE_RATE_HZ / CALLBACK_FRAMES)
+
+    start = time.perf_counter()
+    drained = 0
+    for i in range(num_chunks):
+        buffer.extend(chunk)
+        if (i + 1) % args.drain_every == 0:
+            drained += len(buffer.get())
+    drained += len(buffer.get())
+    elapsed_s = time.perf_counter() - start
+
+    print('%-8s %8.3f s for %d s of audio  %7.1f us per callback  %.4f%% of real time  '
+          '%d bytes dropped' % (
+              name, elapsed_s, args.seconds, 1e6 * elapsed_s / num_chunks,
+              100.0 * elapsed_s / args.seconds, num_chunks * len(chunk) - drained))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=int, default=600,
+                        help='Seconds of audio to buffer')
+    parser.add_argument('--drain-every', type=int, default=1,
+                        help='Callbacks between reads by the detection loop')
+    args = parser.parse_args()
+
+    _run('deque', DequeRingBuffer, args)
+    _run('ring', snowboydecoder.RingBuffer, args)
+
+
+if __name__ == '__main__':
+    main()
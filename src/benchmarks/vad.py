@@ -0,0 +1,129 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""Evaluate the voice activity detector offline.
+
+Each recording is fed to the detector in 100 ms chunks, as the Recorder would,
+and the detected end of speech is compared with the labelled end of speech.
+Without recordings, synthetic utterances in noise are used.
+
+Run from the src directory:
+    python3 -m benchmarks.vad --labels labels.csv
+where each line of labels.csv is "path/to/16k_mono.wav,seconds_when_speech_ends".
+"""
+
+import argparse
+import csv
+import time
+import wave
+
+import numpy as np
+
+import vad
+
+RATE = 16000
+CHUNK_SAMPLES = 1600
+
+
+def _synthetic(count, seed):
+    """Yields (name, int16 audio, end of speech) for made up utterances."""
+    rand = np.random.RandomState(seed)
+    for i in range(count):
+        lead_s, speech_s, tail_s = rand.uniform(0.2, 1), rand.uniform(0.5, 3), 2.0
+        noise_level = 10 ** (rand.uniform(-70, -40) / 20)
+        speech_level = 10 ** (rand.uniform(-30, -10) / 20)
+        f0 = rand.uniform(90, 250)
+
+        t = np.arange(int(speech_s * RATE)) / RATE
+        tone = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 10))
+        envelope = 0.6 + 0.4 * np.sin(2 * np.pi * rand.uniform(3, 6) * t)
+        speech = speech_level * tone * envelope / np.max(np.abs(tone))
+
+        audio = np.concatenate((np.zeros(int(lead_s * RATE)), speech,
+                                np.zeros(int(tail_s * RATE))))
+        audio += rand.normal(0, noise_level, audio.size)
+        audio = (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+        yield 'synthetic-%03d' % i, audio, lead_s + speech_s
+
+
+def _recordings(labels_path):
+    with open(labels_path) as f:
+        for path, end_s in csv.reader(f):
+            with wave.open(path, 'r') as wav:
+                if (wav.getnchannels(), wav.getsampwidth(), wav.getframerate()) != (1, 2, RATE):
+                    raise ValueError(path + ' is not 16 kHz 16-bit mono')
+                audio = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+            yield path, audio, float(end_s)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--labels', help='CSV of WAV paths and end of speech times')
+    parser.add_argument('--synthetic', type=int, default=50,
+                        help='Number of synthetic utterances without --labels')
+    parser.add_argument('--min-energy-db', type=float, default=-50.0)
+    parser.add_argument('--energy-margin-db', type=float, default=6.0)
+    parser.add_argument('--max-zcr', type=float, default=0.4)
+    parser.add_argument('--max-flatness', type=float, default=0.45)
+    parser.add_argument('--min-speech', type=float, default=0.15)
+    parser.add_argument('--end-silence', type=float, default=0.7)
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Print the result for each recording')
+    args = parser.parse_args()
+
+    if args.labels:
+        recordings = _recordings(args.labels)
+    else:
+        recordings = _synthetic(args.synthetic, seed=0)
+
+    latencies = []
+    early = missed = 0
+    audio_s = processing_s = 0.0
+    for name, audio, end_s in recordings:
+        detector = vad.VoiceActivityDetector(
+            min_energy_db=args.min_energy_db, energy_margin_db=args.energy_margin_db,
+            max_zcr=args.max_zcr, max_flatness=args.max_flatness,
+            min_speech_s=args.min_speech, end_silence_s=args.end_silence)
+        data = audio.tobytes()
+        start = time.perf_counter()
+        for i in range(0, len(data), 2 * CHUNK_SAMPLES):
+            detector.add_data(data[i:i + 2 * CHUNK_SAMPLES])
+        processing_s += time.perf_counter() - start
+        audio_s += audio.size / RATE
+
+        if detector.endpoint_s is None:
+            missed += 1
+            result = 'missed'
+        elif detector.endpoint_s < end_s:
+            early += 1
+            result = 'cut off %.2f s early' % (end_s - detector.endpoint_s)
+        else:
+            latencies.append(detector.endpoint_s - end_s)
+            result = 'ended %.2f s after speech' % latencies[-1]
+        if args.verbose:
+            print('%-30s %s' % (name, result))
+
+    total = len(latencies) + early + missed
+    print('%d recordings: %d ended after speech, %d cut off early, %d missed' % (
+        total, len(latencies), early, missed))
+    if latencies:
+        print('latency after end of speech: median %.2f s, 90th percentile %.2f s' % (
+            np.median(latencies), np.percentile(latencies, 90)))
+    print('processing: %.1f ms per second of audio' % (processing_s / audio_s * 1e3))
+
+
+if __name__ == '__main__':
+    main()
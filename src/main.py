@@ -64,6 +64,9 @@ ASSISTANT_CREDENTIALS = (
     os.path.join(VR_CACHE_DIR, 'assistant_credentials.json')
 )
 
+# Where synthesized speech is kept across restarts.
+TTS_CACHE_DIR = os.path.join(VR_CACHE_DIR, 'tts')
+
 # Where the locale/language bundles are stored
 LOCALE_DIR = os.path.realpath(
     os.path.join(os.path.abspath(os.path.dirname(__file__)), '../po'))
@@ -120,7 +123,8 @@ def main():
         default_config_files=CONFIG_FILES,
         description="Act on voice commands using Google's speech recognition")
     parser.add_argument('-T', '--trigger', default='gpio',
-                        choices=['clap', 'gpio', 'ok-google', 'custom'], help='Trigger to use')
+                        choices=['clap', 'gpio', 'ok-google', 'custom', 'hotword'],
+                        help='Trigger to use')
     parser.add_argument('--cloud-speech', action='store_true',
                         help='Use the Cloud Speech API instead of the Assistant API')
     parser.add_argument('-L', '--language', default='en-US',
@@ -145,13 +149,88 @@ def main():
                         'Cloud Speech API')
     parser.add_argument('--trigger-sound', default=None,
                         help='Sound when trigger is activated (WAV format)')
+    parser.add_argument('--processor-queue', type=int, default=0,
+                        help='Run each audio processor in its own thread with a'
+                        ' queue of this many 100 ms chunks (default: 0, run'
+                        ' them on the recording thread)')
+    parser.add_argument('--processor-overflow', default=aiy.audio.OVERFLOW_DROP_OLDEST,
+                        choices=aiy.audio.OVERFLOW_POLICIES,
+                        help='What to do when a processor queue is full')
+    parser.add_argument('--audio-backend', default='arecord',
+                        choices=aiy.audio.CAPTURE_BACKENDS,
+                        help='How to capture audio: an arecord subprocess,'
+                        ' in-process with PyAudio, or by replaying a file')
+    parser.add_argument('--audio-input', default='default',
+                        help='Input device for arecord or PyAudio, or the raw'
+                        ' or WAV file to replay (- for stdin)')
+    parser.add_argument('--preroll', type=float, default=0,
+                        help='Seconds of audio from before the trigger to'
+                        ' include in each request (default: 0)')
+    parser.add_argument('--vad', action='store_true',
+                        help='Detect the end of speech locally, instead of'
+                        ' waiting for the server to detect it')
+    parser.add_argument('--vad-end-silence', type=float, default=0.7,
+                        help='Seconds of silence after speech that end an'
+                        ' utterance with --vad (default: 0.7)')
+    parser.add_argument('--vad-min-energy', type=float, default=-50,
+                        help='Quietest level in dBFS that counts as speech'
+                        ' with --vad (default: -50)')
+    parser.add_argument('--upload-queue', type=float, default=5,
+                        help='Seconds of audio that may wait to be sent to the'
+                        ' server, eg while the network stalls (default: 5)')
+    parser.add_argument('--upload-overflow', default=aiy.audio.OVERFLOW_DROP_OLDEST,
+                        choices=aiy.audio.OVERFLOW_POLICIES,
+                        help='What to do when the upload queue is full'
+                        ' (default: %(default)s)')
+    parser.add_argument('--suppress-silence', action='store_true',
+                        help='Do not upload long runs of silence, to save'
+                        ' bandwidth')
+    parser.add_argument('--silence-threshold', type=float, default=-45,
+                        help='Level in dBFS below which audio counts as silence'
+                        ' with --suppress-silence (default: -45)')
+    parser.add_argument('--claps', type=int, default=1,
+                        help='Number of claps in a row for --trigger=clap'
+                        ' (default: 1)')
+    parser.add_argument('--clap-max-gap', type=float, default=0.6,
+                        help='Most seconds between claps in a row with'
+                        ' --claps (default: 0.6)')
+    parser.add_argument('--hotword', action='append', default=[],
+                        metavar='MODEL[:SENSITIVITY][=COMMAND]',
+                        help='A snowboy model for --trigger=hotword, with its'
+                        ' sensitivity (default: 0.5) and optionally a voice'
+                        ' command to run directly instead of starting a'
+                        ' request. Can be given several times.')
+    parser.add_argument('--fuzzy-threshold', type=float, default=None,
+                        help='Also run voice commands that are only similar to'
+                        ' a keyword, with a similarity from 0 to 1 of at least'
+                        ' this (eg 0.8)')
+    parser.add_argument('--tts-disk-cache', action='store_true',
+                        help='Also keep synthesized speech in %s across'
+                        ' restarts, instead of only in memory. This writes'
+                        ' to the SD card.' % TTS_CACHE_DIR)
+    parser.add_argument('--tts-cache-mb', type=int, default=32,
+                        help='Megabytes of synthesized speech to keep with'
+                        ' --tts-disk-cache (default: 32)')
+    parser.add_argument('--tts-presynthesize', action='store_true',
+                        help='Synthesize the fixed responses of all voice'
+                        ' commands into the TTS disk cache, then exit')
 
     args = parser.parse_args()
+    if args.trigger == 'hotword' and not args.hotword:
+        parser.error('--trigger=hotword needs at least one --hotword')
+    if args.tts_presynthesize and not args.tts_disk_cache:
+        parser.error('--tts-presynthesize needs --tts-disk-cache')
 
     create_pid_file(args.pid_file)
     aiy.i18n.set_locale_dir(LOCALE_DIR)
     aiy.i18n.set_language_code(args.language, gettext_install=True)
 
+    if args.tts_disk_cache:
+        aiy.audio.set_tts_cache_dir(TTS_CACHE_DIR, args.tts_cache_mb * 1024 * 1024)
+    if args.tts_presynthesize:
+        presynthesize_tts()
+        return
+
     player = aiy.audio.get_player()
 
     if args.cloud_speech:
@@ -175,11 +254,31 @@ def main():
             sys.exit(1)
         do_assistant_library(args, credentials, player, status_ui)
     else:
-        recorder = aiy.audio.get_recorder()
+        recorder = aiy.audio.get_recorder(
+            input_device=args.audio_input,
+            backend=args.audio_backend,
+            processor_queue=args.processor_queue,
+            overflow=args.processor_overflow,
+            preroll_s=args.preroll)
         with recorder:
             do_recognition(args, recorder, recognizer, player, status_ui)
 
 
+def presynthesize_tts():
+    """Synthesize everything the voice commands can say ahead of time."""
+    say = aiy.audio.say
+    actor = action.make_actor(say)
+    action.add_commands_just_for_cloud_speech_api(actor, say)
+
+    phrases = action.get_static_responses(actor) + [unexpected_error_text()]
+    count = aiy.audio.presynthesize(phrases)
+    logger.info('synthesized %d sentences that were not cached yet', count)
+
+
+def unexpected_error_text():
+    return _('Unexpected error. Try again or check the logs.')
+
+
 def do_assistant_library(args, credentials, player, status_ui):
     """Run a recognizer using the Google Assistant Library.
 
@@ -200,6 +299,8 @@ installed with:
 
     say = aiy.audio.say
     actor = action.make_actor(say)
+    if args.fuzzy_threshold is not None:
+        actor.set_fuzzy_matching(args.fuzzy_threshold)
 
     def process_event(event):
         logging.info(event)
@@ -237,12 +338,19 @@ def do_recognition(args, recorder, recognizer, player, status_ui):
     """Configure and run the recognizer."""
     say = aiy.audio.say
     actor = action.make_actor(say)
+    if args.fuzzy_threshold is not None:
+        actor.set_fuzzy_matching(args.fuzzy_threshold)
 
     if args.cloud_speech:
         action.add_commands_just_for_cloud_speech_api(actor, say)
 
     recognizer.add_phrases(actor)
     recognizer.set_audio_logging_enabled(args.audio_logging)
+    recognizer.set_audio_queue_limit(
+        int(args.upload_queue * aiy.audio.AUDIO_SAMPLE_RATE_HZ * aiy.audio.AUDIO_SAMPLE_SIZE),
+        args.upload_overflow)
+    recognizer.set_silence_suppression_enabled(
+        args.suppress_silence, threshold_db=args.silence_threshold)
 
     if args.trigger == 'gpio':
         import triggers.gpio
@@ -250,19 +358,37 @@ def do_recognition(args, recorder, recognizer, player, status_ui):
         msg = 'Press the button on GPIO 23'
     elif args.trigger == 'clap':
         import triggers.clap
-        triggerer = triggers.clap.ClapTrigger(recorder)
+        triggerer = triggers.clap.ClapTrigger(
+            recorder, claps=args.claps, max_gap_s=args.clap_max_gap)
         msg = 'Clap your hands'
+        if args.claps > 1:
+            msg += ' %d times' % args.claps
     elif args.trigger == 'custom':
         import triggers.custom
         triggerer = triggers.custom.CustomTrigger(recorder)
         msg = 'Clap your hands'
+    elif args.trigger == 'hotword':
+        import triggers.hotword
+        keywords = [triggers.hotword.parse_keyword(spec) for spec in args.hotword]
+        for keyword in keywords:
+            if keyword.command and not actor.can_handle(keyword.command):
+                logger.warning('No voice command handles %r for hotword %s',
+                               keyword.command, keyword.model)
+        triggerer = triggers.hotword.HotwordTrigger(recorder, keywords)
+        msg = 'Say a hotword'
     else:
         logger.error("Unknown trigger '%s'", args.trigger)
         return
 
+    detector = None
+    if args.vad:
+        import vad
+        detector = vad.VoiceActivityDetector(
+            end_silence_s=args.vad_end_silence, min_energy_db=args.vad_min_energy)
+
     mic_recognizer = SyncMicRecognizer(
         actor, recognizer, recorder, player, say, triggerer, status_ui,
-        args.assistant_always_responds)
+        args.assistant_always_responds, vad=detector)
 
     with mic_recognizer:
         if sys.stdout.isatty():
@@ -295,6 +421,8 @@ class StatusUi(object):
 
         if trigger_sound and os.path.exists(os.path.expanduser(trigger_sound)):
             self.trigger_sound = os.path.expanduser(trigger_sound)
+            # Decode it now, so the earcon plays without touching the disk.
+            self.player.preload_wav(self.trigger_sound)
         else:
             if trigger_sound:
                 logger.warning(
@@ -323,22 +451,38 @@ class SyncMicRecognizer(object):
     # pylint: disable=too-many-instance-attributes
 
     def __init__(self, actor, recognizer, recorder, player, say, triggerer,
-                 status_ui, assistant_always_responds):
+                 status_ui, assistant_always_responds, vad=None):
         self.actor = actor
         self.player = player
         self.recognizer = recognizer
         self.recognizer.set_endpointer_cb(self.endpointer_cb)
+        self.recognizer.set_audio_out_cb(self.audio_out_cb)
         self.recorder = recorder
         self.say = say
         self.triggerer = triggerer
         self.triggerer.set_callback(self.recognize)
+        if hasattr(self.triggerer, 'set_command_callback'):
+            self.triggerer.set_command_callback(self.run_command)
         self.status_ui = status_ui
         self.assistant_always_responds = assistant_always_responds
+        self.vad = vad
+        if vad:
+            vad.callback = self.recognizer.end_utterance
 
         self.running = False
 
         self.recognizer_event = threading.Event()
 
+        # Plays the current Assistant response as it arrives. It is None until
+        # the first audio arrives, then a PlaybackStream, or False if the
+        # response should not be played.
+        self._response_stream = None
+        # Set while a response is being played, when a trigger interrupts it.
+        self._responding = False
+        self._barge_in = False
+        # A voice command from the trigger, to run instead of a request.
+        self._command = None
+
     def __enter__(self):
         self.running = True
         threading.Thread(target=self._recognize).start()
@@ -351,46 +495,109 @@ class SyncMicRecognizer(object):
 
         self.recognizer.end_audio()
 
-    def recognize(self):
+    def recognize(self, preroll=True):
         if self.recognizer_event.is_set():
-            # Duplicate trigger (eg multiple button presses)
+            if self._responding:
+                # Stop the response, and listen again once it has stopped.
+                self._barge_in = True
+                self.player.interrupt()
+            # Otherwise a duplicate trigger (eg multiple button presses)
             return
 
         self.status_ui.status('listening')
         self.recognizer.reset()
-        self.recorder.add_processor(self.recognizer)
+        self.recorder.add_processor(self.recognizer, preroll=preroll)
+        if self.vad:
+            self.vad.reset()
+            self.recorder.add_processor(self.vad)
         # Tell recognizer to run
         self.recognizer_event.set()
 
+    def run_command(self, command):
+        """Runs a voice command without recognizing any speech."""
+        if self.recognizer_event.is_set():
+            return
+
+        self.status_ui.status('thinking')
+        self._command = command
+        self.recognizer_event.set()
+
     def endpointer_cb(self):
         self.recorder.remove_processor(self.recognizer)
+        if self.vad:
+            self.recorder.remove_processor(self.vad)
         self.status_ui.status('thinking')
 
+    def audio_out_cb(self, transcript, audio_data):
+        if self._response_stream is None:
+            handled_locally = transcript and self.actor.can_handle(transcript)
+            if handled_locally and not self.assistant_always_responds:
+                self._response_stream = False
+            else:
+                self._response_stream = self.player.open_stream(
+                    sample_width=speech.AUDIO_SAMPLE_SIZE,
+                    sample_rate=speech.AUDIO_SAMPLE_RATE_HZ)
+                self._responding = True
+
+        if self._response_stream and not self._response_stream.future.cancelled():
+            self._response_stream.write(audio_data)
+
     def _recognize(self):
         while self.running:
             self.recognizer_event.wait()
             if not self.running:
                 break
 
-            logger.info('recognizing...')
-            try:
-                self._handle_result(self.recognizer.do_request())
-            except speech.Error:
-                logger.exception('Unexpected error')
-                self.say(_('Unexpected error. Try again or check the logs.'))
+            command, self._command = self._command, None
+            if command:
+                logger.info('running command: %s', command)
+                self._responding = True
+                if not self.actor.handle(command):
+                    logger.warning('%r was not handled', command)
+            else:
+                self._recognize_once()
 
+            self._responding = False
             self.recognizer_event.clear()
-            if self.recognizer.dialog_follow_on:
-                self.recognize()
+            if self._barge_in or self.recognizer.dialog_follow_on:
+                # The pre-roll would contain the response we just played.
+                self._barge_in = False
+                self.recognize(preroll=False)
             else:
                 self.triggerer.start()
                 self.status_ui.status('ready')
 
+    def _recognize_once(self):
+        logger.info('recognizing...')
+        self._response_stream = None
+        try:
+            result = self.recognizer.do_request()
+            self._responding = True
+            self._handle_result(result)
+        except speech.Error:
+            logger.exception('Unexpected error')
+            self._responding = True
+            if self._response_stream:
+                self._response_stream.close()
+            self.say(unexpected_error_text())
+        finally:
+            # The Player waits for the end of an unfinished stream, holding up
+            # every clip queued after it.
+            if self._response_stream:
+                self._response_stream.finish()
+
     def _handle_result(self, result):
-        if result.transcript and self.actor.handle(result.transcript):
-            logger.info('handled local command: %s', result.transcript)
+        if result.transcript and self.actor.can_handle(result.transcript):
+            # The Player plays one clip at a time, so the response stream must
+            # end before the command runs, or the command's own responses would
+            # wait for it forever.
             if result.response_audio and self.assistant_always_responds:
                 self._play_assistant_response(result.response_audio)
+            else:
+                # Don't play the Assistant's response to a local command.
+                self._discard_response_stream()
+            self.actor.handle(result.transcript)
+            logger.info('handled local command: %s', result.transcript)
         elif result.response_audio:
             self._play_assistant_response(result.response_audio)
         elif result.transcript:
@@ -398,13 +605,23 @@ class SyncMicRecognizer(object):
         else:
             logger.warning('no command recognized')
 
+    def _discard_response_stream(self):
+        if self._response_stream:
+            self._response_stream.finish()
+            self.player.interrupt()
+        self._response_stream = False
+
     def _play_assistant_response(self, audio_bytes):
         bytes_per_sample = speech.AUDIO_SAMPLE_SIZE
         sample_rate_hz = speech.AUDIO_SAMPLE_RATE_HZ
         logger.info('Playing %.4f seconds of audio...',
                     len(audio_bytes) / (bytes_per_sample * sample_rate_hz))
-        self.player.play_bytes(audio_bytes, sample_width=bytes_per_sample,
-                               sample_rate=sample_rate_hz)
+        if self._response_stream:
+            # Playback started as the audio arrived, so just let it finish.
+            self._response_stream.close()
+        else:
+            self.player.play_bytes(audio_bytes, sample_width=bytes_per_sample,
+                                   sample_rate=sample_rate_hz)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,248 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""asyncio variants of the speech requests, using grpc.aio.
+
+These send the same messages and handle the responses the same way as the
+requests in speech.py, but the gRPC call runs on an asyncio event loop instead
+of blocking a thread. The recorder thread still feeds audio with add_data().
+"""
+
+import asyncio
+import logging
+import threading
+import weakref
+
+import google.auth.exceptions
+import google.auth.transport.grpc
+import google.auth.transport.requests
+import grpc
+import grpc.aio
+
+import speech
+
+logger = logging.getLogger('speech')
+
+
+class _AioChannelFactory(speech._ChannelFactory):
+
+    """Creates grpc.aio channels with a given configuration.
+
+    Like _ChannelFactory, channels are pooled per host, but also per event loop,
+    as a grpc.aio channel can only be used on the loop it was created on. The
+    pool holds its loops weakly, and forgets the channels of loops that have
+    been closed. make_channel(), discard_channel() and release_channels() are
+    coroutines.
+    """
+
+    # Shared by all factories: loop -> {(target, credentials): channel}
+    _pool = weakref.WeakKeyDictionary()
+    _pool_lock = threading.Lock()
+
+    async def make_channel(self):
+        """Returns a secure channel, reusing the pooled one if it is healthy."""
+
+        # Only refresh on the loop's executor, as it blocks on the network.
+        manager = self._credentials_manager
+        if not manager.credentials.valid:
+            await asyncio.get_running_loop().run_in_executor(None, manager.ensure_valid)
+
+        with self._pool_lock:
+            channel = self._loop_pool().pop(self._pool_key(), None)
+        if channel:
+            if channel.get_state() not in self.BROKEN_STATES:
+                with self._pool_lock:
+                    self._loop_pool()[self._pool_key()] = channel
+                return channel
+
+            logger.info('rebuilding broken channel to %s', self._api_host)
+            await channel.close()
+
+        channel = self._create_channel()
+        with self._pool_lock:
+            self._loop_pool()[self._pool_key()] = channel
+        return channel
+
+    async def discard_channel(self):
+        """Forgets the pooled channel, eg after it failed a request."""
+
+        with self._pool_lock:
+            channel = self._loop_pool().pop(self._pool_key(), None)
+        if channel:
+            await channel.close()
+
+    async def release_channels(self):
+        """Closes all the pooled channels of the running loop, eg before the
+        loop is closed.
+        """
+        with self._pool_lock:
+            channels = self._pool.pop(asyncio.get_running_loop(), {})
+        for channel in channels.values():
+            await channel.close()
+
+    def _loop_pool(self):
+        """Returns the pool of the running loop. Call with _pool_lock held."""
+        for loop in [loop for loop in self._pool if loop.is_closed()]:
+            del self._pool[loop]
+        return self._pool.setdefault(asyncio.get_running_loop(), {})
+
+    def _pool_key(self):
+        return (self._api_host + ':443', self._credentials)
+
+    def _create_channel(self):
+        """Creates a secure channel."""
+
+        # The same per-call credentials as secure_authorized_channel() uses.
+        request = google.auth.transport.requests.Request()
+        metadata_plugin = google.auth.transport.grpc.AuthMetadataPlugin(
+            self._credentials, request)
+        credentials = grpc.composite_channel_credentials(
+            grpc.ssl_channel_credentials(),
+            grpc.metadata_call_credentials(metadata_plugin))
+
+        return grpc.aio.secure_channel(
+            self._api_host + ':443', credentials, options=self.KEEPALIVE_OPTIONS)
+
+
+class _AsyncSpeechRequest(object):
+
+    """Mixin that runs a speech request on an asyncio event loop.
+
+    Audio is still queued by add_data() and end_audio(), which may be called
+    from any thread. The loop is woken up to send it.
+    """
+
+    CHANNEL_FACTORY = _AioChannelFactory
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Set while do_request_async() is running.
+        self._loop = None
+        self._audio_ready = None
+
+    def add_data(self, data):
+        super().add_data(data)
+        self._wake()
+
+    def end_audio(self):
+        super().end_audio()
+        self._wake()
+
+    def _wake(self):
+        loop, audio_ready = self._loop, self._audio_ready
+        if loop and not loop.is_closed():
+            loop.call_soon_threadsafe(audio_ready.set)
+
+    async def _request_aiter(self):
+        """Asynchronously yields a config request followed by requests
+        constructed from the audio queue.
+        """
+        yield self._get_config_request()
+
+        if self._silence_suppressor:
+            self._silence_suppressor.reset()
+
+        while True:
+            batch = self._audio_queue.get_batch(self.MAX_AUDIO_REQUEST_BYTES, block=False)
+
+            if batch is None:
+                return
+
+            if not batch:
+                # add_data() or end_audio() will wake us up. Check the queue
+                # again after clearing, as audio may have arrived meanwhile.
+                await self._audio_ready.wait()
+                self._audio_ready.clear()
+                continue
+
+            request = self._create_batch_request(batch)
+            if request:
+                yield request
+
+    async def do_request_async(self):
+        """Establishes a connection and starts sending audio to the cloud
+        endpoint. Responses are handled by the subclass until one returns a
+        result.
+
+        Returns the same namedtuple as do_request(), and sets the same
+        measurements.
+
+        Raises speech.Error on error.
+        """
+        self._audio_ready = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._start_request()
+        ready = None
+        try:
+            channel = await self._channel_factory.make_channel()
+            ready = asyncio.ensure_future(channel.channel_ready())
+            ready.add_done_callback(
+                lambda future: future.cancelled() or self._on_channel_ready())
+            service = self._make_service(channel)
+
+            call = self._create_response_stream(
+                service, self._request_aiter(), self.DEADLINE_SECS)
+
+            if self._audio_logging_enabled:
+                self._start_logging_request()
+
+            async for resp in call:
+                self._check_response(resp)
+
+            # Server has closed the connection
+            return self._finish_request() or ''
+        except (
+                google.auth.exceptions.GoogleAuthError,
+                grpc.RpcError,
+        ) as exc:
+            self._abort_audio()
+            code = exc.code() if hasattr(exc, 'code') else None
+            if code == grpc.StatusCode.UNAVAILABLE:
+                # Don't hand out a channel that just failed to the next request.
+                await self._channel_factory.discard_channel()
+            raise speech.Error('Exception in speech request') from exc
+        except speech.Error:
+            self._abort_audio()
+            raise
+        finally:
+            if ready:
+                ready.cancel()
+            self._loop = None
+
+    def do_request(self):
+        """Runs do_request_async() to completion on a new loop.
+
+        The loop and its channel are closed afterwards, so unlike the requests
+        in speech.py, this doesn't reuse connections.
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.do_request_async())
+        finally:
+            loop.run_until_complete(self._channel_factory.release_channels())
+            loop.close()
+
+
+class AsyncCloudSpeechRequest(_AsyncSpeechRequest, speech.CloudSpeechRequest):
+
+    """A transcription request to the Cloud Speech API, run with asyncio.
+
+    Args:
+        credentials_file: path to service account credentials JSON file
+    """
+
+
+class AsyncAssistantSpeechRequest(_AsyncSpeechRequest, speech.AssistantSpeechRequest):
+
+    """A request to the Assistant API, run with asyncio."""
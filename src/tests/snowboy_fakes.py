@@ -0,0 +1,103 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+'''A fake snowboy detector for the hotword trigger tests.'''
+
+import importlib
+import sys
+import types
+
+import triggers
+
+_DETECT_MODULE = 'triggers.snowboydetect'
+
+
+class FakeSnowboyDetect(object):
+
+    """Detects hotword N in audio that contains b'wordN'.
+
+    Each model has one hotword, except for those listed in HOTWORDS. Audio that
+    contains b'alice' is detected as hotword 1. The detector keeps the chunks
+    it was given and counts its resets.
+    """
+
+    # model -> number of hotwords, for models with more than one
+    HOTWORDS = {}
+
+    instances = 0
+
+    def __init__(self, resource_filename, model_str):
+        FakeSnowboyDetect.instances += 1
+        self.model_str = model_str
+        self.models = model_str.split(b',')
+        self.num_hotwords = sum(self.HOTWORDS.get(model, 1) for model in self.models)
+        self.sensitivity = None
+        self.chunks = []
+        self.resets = 0
+
+    def SetAudioGain(self, audio_gain):
+        pass
+
+    def SetSensitivity(self, sensitivity_str):
+        self.sensitivity = sensitivity_str
+
+    def NumHotwords(self):
+        return self.num_hotwords
+
+    def NumChannels(self):
+        return 1
+
+    def SampleRate(self):
+        return 16000
+
+    def BitsPerSample(self):
+        return 16
+
+    def Reset(self):
+        self.resets += 1
+
+    def RunDetection(self, data):
+        assert isinstance(data, bytes)
+        self.chunks.append(data)
+        for index in range(self.num_hotwords, 0, -1):
+            if b'word%d' % index in data:
+                return index
+        return 1 if b'alice' in data else 0
+
+
+def import_with_fake_snowboy(name):
+    """Imports triggers.<name> afresh, with FakeSnowboyDetect as the detector.
+
+    The module and snowboydecoder are dropped from sys.modules and from the
+    triggers package first, so a test never gets a module that another test
+    imported with a different detector. Only the fake detector module is
+    taken out of sys.modules afterwards: the modules imported along the way
+    stay, as some (numpy) cannot be imported twice in one process.
+    """
+    fake_module = types.ModuleType(_DETECT_MODULE)
+    fake_module.SnowboyDetect = FakeSnowboyDetect
+    previous = sys.modules.get(_DETECT_MODULE)
+    sys.modules[_DETECT_MODULE] = fake_module
+    try:
+        for stale in {'snowboydecoder', name}:
+            sys.modules.pop('triggers.' + stale, None)
+            vars(triggers).pop(stale, None)
+        return importlib.import_module('triggers.' + name)
+    finally:
+        if previous is None:
+            sys.modules.pop(_DETECT_MODULE, None)
+        else:
+            sys.modules[_DETECT_MODULE] = previous
@@ -0,0 +1,67 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+'''Imports modules under test when some of their dependencies are missing.'''
+
+import importlib
+import sys
+import types
+
+# Generated protobuf modules that speech.py imports, and the attributes the
+# tests need if they are not installed.
+PROTO_MODULES = {
+    'google.cloud.grpc.speech.v1beta1.cloud_speech_pb2': {},
+    'google.rpc.code_pb2': {'OK': 0},
+    'google.assistant.embedded.v1alpha1.embedded_assistant_pb2': {},
+}
+
+
+def import_with_stand_ins(module_name, stand_ins):
+    """Imports a module, with stand-ins for dependencies that are missing.
+
+    Args:
+      module_name: the module to import
+      stand_ins: maps the names of modules it may need to the attributes their
+        stand-ins should have. A stand-in is only used if the module itself
+        can't be imported.
+    """
+    fakes = {}
+    for name, attributes in stand_ins.items():
+        try:
+            importlib.import_module(name)
+            continue
+        except ImportError:
+            pass
+        parts = name.split('.')
+        for i in range(1, len(parts) + 1):
+            parent_name = '.'.join(parts[:i])
+            if parent_name not in sys.modules and parent_name not in fakes:
+                fakes[parent_name] = types.ModuleType(parent_name)
+        for attribute, value in attributes.items():
+            setattr(fakes[name], attribute, value)
+        for i in range(1, len(parts)):
+            parent = fakes.get('.'.join(parts[:i]))
+            if parent:
+                setattr(parent, parts[i], fakes['.'.join(parts[:i + 1])])
+
+    # Only the stand-ins are removed again, as modules like numpy can't be
+    # imported twice.
+    sys.modules.update(fakes)
+    try:
+        return importlib.import_module(module_name)
+    finally:
+        for name in fakes:
+            sys.modules.pop(name, None)
@@ -14,6 +14,8 @@
 
 '''Test the action base classes.'''
 
+import fractions
+import random
 import unittest
 
 import actionbase
@@ -91,6 +93,203 @@ class TestActor(unittest.TestCase):
         actor.add_keyword('foo', foo_action)
         self.assertIsNone(foo_action.voice_command)
 
+    def test_first_added_keyword_wins(self):
+        actor = actionbase.Actor()
+        bar_action = TestAction()
+        actor.add_keyword('bar', bar_action)
+        foo_bar_action = TestAction()
+        actor.add_keyword('foo bar', foo_bar_action)
+        self.assertTrue(actor.handle('moo foo bar'))
+        self.assertIsNotNone(bar_action.voice_command)
+        self.assertIsNone(foo_bar_action.voice_command)
+
+    def test_keyword_inside_longer_partial_match(self):
+        actor = actionbase.Actor()
+        actor.add_keyword('the lights on', TestAction())
+        light_action = TestAction()
+        actor.add_keyword('light', light_action)
+        self.assertTrue(actor.handle('Turn the Lights off'))
+        self.assertEqual(light_action.voice_command, 'Turn the Lights off')
+        self.assertFalse(actor.can_handle('the ligh'))
+
+    def test_handlers_changed_directly(self):
+        actor = actionbase.Actor()
+        actor.add_keyword('foo', TestAction())
+        self.assertFalse(actor.can_handle('bar'))
+        actor.handlers.append(actionbase.KeywordHandler('bar', TestAction()))
+        self.assertTrue(actor.can_handle('bar'))
+        del actor.handlers[:]
+        self.assertFalse(actor.can_handle('foo'))
+
+    def test_custom_handlers_are_scanned(self):
+        class EverythingHandler(object):
+            def can_handle(self, command):
+                return True
+
+            def handle(self, command):
+                return True
+
+        actor = actionbase.Actor()
+        actor.add_keyword('foo', TestAction())
+        actor.handlers.append(EverythingHandler())
+        self.assertTrue(actor.can_handle('bar'))
+        self.assertTrue(actor.handle('bar'))
+
+
+
+class TestFuzzyMatching(unittest.TestCase):
+
+    def setUp(self):
+        self.actor = actionbase.Actor()
+        self.actions = {}
+        for keyword in ['ip address', 'volume up', 'volume down', 'time']:
+            self.actions[keyword] = TestAction()
+            self.actor.add_keyword(keyword, self.actions[keyword])
+        self.actions['raspberry reboot'] = TestAction()
+        self.actor.add_keyword('raspberry reboot', self.actions['raspberry reboot'],
+                               fuzzy=False)
+
+    def test_off_by_default(self):
+        self.assertFalse(self.actor.can_handle('what is my i.p. address'))
+
+    def test_normalized_punctuation(self):
+        self.actor.set_fuzzy_matching()
+        self.assertTrue(self.actor.handle('what is my I.P. address'))
+        self.assertTrue(self.actor.handle('Volume-Up'))
+        self.assertEqual(self.actions['ip address'].voice_command, 'what is my I.P. address')
+        self.assertEqual(self.actions['volume up'].voice_command, 'Volume-Up')
+
+    def test_misspelling_picks_closest_keyword(self):
+        self.actor.set_fuzzy_matching()
+        self.assertTrue(self.actor.handle('turn the volume dawn'))
+        self.assertIsNone(self.actions['volume up'].voice_command)
+        self.assertIsNotNone(self.actions['volume down'].voice_command)
+
+    def test_homophone(self):
+        # Sounding alike finds the keyword, but it is scored by spelling.
+        self.actor.set_fuzzy_matching()
+        self.assertFalse(self.actor.can_handle('what thyme is it'))
+        self.actor.set_fuzzy_matching(threshold=0.6)
+        self.assertTrue(self.actor.can_handle('what thyme is it'))
+
+    def test_same_sound_code_is_not_enough(self):
+        # "tom" and "time" are both T500.
+        self.actor.set_fuzzy_matching()
+        self.assertFalse(self.actor.handle('who is tom hanks'))
+        self.assertIsNone(self.actions['time'].voice_command)
+
+    def test_exact_only_keyword(self):
+        self.actor.set_fuzzy_matching()
+        self.assertFalse(self.actor.handle('raspberry robot'))
+        self.assertFalse(self.actor.handle('raspberry re-boot'))
+        self.assertIsNone(self.actions['raspberry reboot'].voice_command)
+        self.assertTrue(self.actor.handle('raspberry reboot'))
+
+    def test_threshold(self):
+        self.actor.set_fuzzy_matching()
+        self.assertFalse(self.actor.can_handle('hello there'))
+        self.actor.set_fuzzy_matching(threshold=0.95)
+        self.assertFalse(self.actor.can_handle('turn the volume dawn'))
+
+    def test_threshold_is_inclusive(self):
+        # Both are exactly 0.8 similar, the default threshold.
+        actor = actionbase.Actor()
+        actor.add_keyword('hello', TestAction())
+        actor.add_keyword('alexa', TestAction())
+        actor.set_fuzzy_matching()
+        self.assertTrue(actor.can_handle('hallo'))
+        self.assertTrue(actor.can_handle('alexi'))
+
+    def test_ties_go_to_first_keyword(self):
+        # Both are 5/6 similar, but "volumx" shares more trigrams, so it is
+        # scored first.
+        index = actionbase._FuzzyIndex(['vxlume', 'volumx'], 0.8)  # pylint: disable=protected-access
+        self.assertEqual(index.find('volume'), 0)
+
+    def test_no_shared_trigrams(self):
+        # "lume" shares no trigrams with "time", but is 0.5 similar to it, as
+        # to "volume up", and ties go to the first keyword.
+        actor = actionbase.Actor()
+        time_action = TestAction()
+        actor.add_keyword('time', time_action)
+        actor.add_keyword('volume up', TestAction())
+        actor.set_fuzzy_matching(threshold=0.5)
+        self.assertTrue(actor.handle('lume'))
+        self.assertEqual(time_action.voice_command, 'lume')
+
+    def test_matches_brute_force(self):
+        def full_similarity(a, b):
+            distance = actionbase._edit_distance(a, b, len(a) + len(b))  # pylint: disable=protected-access
+            return 1 - fractions.Fraction(distance, max(len(a), len(b)))
+
+        def closest(keywords, command, threshold):
+            words = command.split()
+            best, best_score = None, fractions.Fraction(threshold)
+            for index, keyword in enumerate(keywords):
+                size = len(keyword.split())
+                for run_size in range(max(1, size - 1), size + 2):
+                    for start in range(len(words) - run_size + 1):
+                        score = full_similarity(keyword.replace(' ', ''),
+                                                ''.join(words[start:start + run_size]))
+                        if score > best_score or (score == best_score and best is None):
+                            best, best_score = index, score
+            return best
+
+        rand = random.Random(0)
+        for _ in range(300):
+            keywords = list({''.join(rand.choice('ab ') for _ in range(rand.randint(1, 6))).strip()
+                             or 'a' for _ in range(rand.randint(1, 6))})
+            keywords = [' '.join(keyword.split()) for keyword in keywords]
+            command = ' '.join(''.join(rand.choice('ab ') for _ in range(rand.randint(1, 10))).split())
+            threshold = rand.choice(['0.5', '0.6', '0.75', '0.8'])
+            index = actionbase._FuzzyIndex(keywords, float(threshold))  # pylint: disable=protected-access
+            self.assertEqual(index.find(command), closest(keywords, command, threshold),
+                             (keywords, command, threshold))
+
+    def test_exact_match_wins(self):
+        self.actor.set_fuzzy_matching()
+        self.assertTrue(self.actor.handle('volume dawn time'))
+        self.assertIsNotNone(self.actions['time'].voice_command)
+        self.assertIsNone(self.actions['volume down'].voice_command)
+
+    def test_edit_distance_matches_full_table(self):
+        def full_edit_distance(a, b):
+            previous = list(range(len(b) + 1))
+            for i, char_a in enumerate(a, 1):
+                current = [i]
+                for j, char_b in enumerate(b, 1):
+                    current.append(min(previous[j] + 1, current[j - 1] + 1,
+                                       previous[j - 1] + (char_a != char_b)))
+                previous = current
+            return previous[-1]
+
+        rand = random.Random(0)
+        for _ in range(500):
+            a = ''.join(rand.choice('abc') for _ in range(rand.randint(0, 8)))
+            b = ''.join(rand.choice('abc') for _ in range(rand.randint(0, 8)))
+            limit = rand.randint(0, 4)
+            expected = min(full_edit_distance(a, b), limit + 1)
+            self.assertEqual(actionbase._edit_distance(a, b, limit),  # pylint: disable=protected-access
+                             expected, (a, b, limit))
+
+    def test_phonetic_code(self):
+        self.assertEqual(actionbase.phonetic_code('robert'), 'r163')
+        self.assertEqual(actionbase.phonetic_code('rupert'), 'r163')
+        self.assertEqual(actionbase.phonetic_code('42'), '42')
+
+
+class TestKeywordMatcher(unittest.TestCase):
+
+    def test_matches_linear_scan(self):
+        rand = random.Random(0)
+        for _ in range(200):
+            keywords = [''.join(rand.choice('ab ') for _ in range(rand.randint(1, 4)))
+                        for _ in range(rand.randint(1, 8))]
+            text = ''.join(rand.choice('ab ') for _ in range(rand.randint(0, 12)))
+            expected = next((i for i, k in enumerate(keywords) if k in text), None)
+            matcher = actionbase._KeywordMatcher(keywords)  # pylint: disable=protected-access
+            self.assertEqual(matcher.find(text), expected, (keywords, text))
+
 
 if __name__ == '__main__':
     unittest.main()
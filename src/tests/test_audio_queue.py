@@ -0,0 +1,139 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''Test the bounded audio queue of speech requests.'''
+
+import threading
+import time
+import unittest
+
+import aiy._apis._audio_queue
+import aiy._drivers._recorder
+
+
+def _queue(overflow):
+    return aiy._apis._audio_queue.AudioQueue(max_bytes=10, overflow=overflow)
+
+
+class TestAudioQueue(unittest.TestCase):
+
+    def test_fifo(self):
+        queue = _queue(aiy._drivers._recorder.OVERFLOW_DROP_OLDEST)
+        queue.put(b'1234')
+        queue.put(b'5678')
+        queue.put(None)
+        self.assertEqual(queue.get(), b'1234')
+        self.assertEqual(queue.get(), b'5678')
+        self.assertIsNone(queue.get())
+
+    def test_drop_oldest(self):
+        queue = _queue(aiy._drivers._recorder.OVERFLOW_DROP_OLDEST)
+        for chunk in [b'1111', b'2222', b'3333']:
+            queue.put(chunk)
+        self.assertEqual(queue.get(), b'2222')
+        self.assertEqual(queue.get_stats().dropped, 1)
+
+    def test_drop_newest(self):
+        queue = _queue(aiy._drivers._recorder.OVERFLOW_DROP_NEWEST)
+        for chunk in [b'1111', b'2222', b'3333']:
+            queue.put(chunk)
+        self.assertEqual(queue.get(), b'1111')
+        self.assertEqual(queue.get(), b'2222')
+        self.assertRaises(IndexError, queue.get_nowait)
+
+    def test_end_is_never_dropped(self):
+        queue = _queue(aiy._drivers._recorder.OVERFLOW_DROP_NEWEST)
+        for chunk in [b'1111', b'2222', None]:
+            queue.put(chunk)
+        self.assertEqual(queue.get_stats().depth, 3)
+
+    def test_block_until_room(self):
+        queue = _queue(aiy._drivers._recorder.OVERFLOW_BLOCK)
+        queue.put(b'1111')
+        queue.put(b'2222')
+        thread = threading.Thread(target=queue.put, args=(b'3333',))
+        thread.start()
+        time.sleep(0.05)
+        self.assertTrue(thread.is_alive())
+        queue.get()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(queue.get_stats().depth_bytes, 8)
+
+    def test_clear_unblocks_and_restarts_stats(self):
+        queue = _queue(aiy._drivers._recorder.OVERFLOW_BLOCK)
+        queue.put(b'1111')
+        queue.put(b'2222')
+        thread = threading.Thread(target=queue.put, args=(b'3333',))
+        thread.start()
+        time.sleep(0.05)
+        queue.clear()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        stats = queue.get_stats()
+        self.assertEqual(stats.depth, 0)
+        self.assertEqual(stats.dropped, 0)
+
+    def test_batch_takes_what_is_queued(self):
+        queue = aiy._apis._audio_queue.AudioQueue(max_bytes=100)
+        for chunk in [b'1111', b'2222', b'3333', None]:
+            queue.put(chunk)
+        self.assertEqual(queue.get_batch(8), [b'1111', b'2222'])
+        self.assertEqual(queue.get_batch(8), [b'3333'])
+        self.assertIsNone(queue.get_batch(8))
+
+    def test_batch_does_not_wait_for_more(self):
+        queue = aiy._apis._audio_queue.AudioQueue(max_bytes=100)
+        queue.put(b'1111')
+        self.assertEqual(queue.get_batch(100), [b'1111'])
+
+    def test_batch_splits_large_chunks(self):
+        # A second of pre-roll, split into requests of 32000 bytes at most.
+        queue = aiy._apis._audio_queue.AudioQueue(max_bytes=10 ** 6)
+        preroll = bytes(range(256)) * 125
+        queue.put(preroll)
+        queue.put(b'1111')
+        queue.put(None)
+        batches = []
+        while True:
+            batch = queue.get_batch(3200 * 3)
+            if batch is None:
+                break
+            batches.append(batch)
+        self.assertTrue(all(sum(len(data) for data in batch) <= 9600 for batch in batches))
+        self.assertEqual([len(batch) for batch in batches], [1, 1, 1, 2])
+        self.assertEqual(b''.join(b''.join(batch) for batch in batches), preroll + b'1111')
+        self.assertEqual(queue.get_stats().depth_bytes, 0)
+
+    def test_batch_without_blocking(self):
+        queue = aiy._apis._audio_queue.AudioQueue(max_bytes=100)
+        self.assertEqual(queue.get_batch(100, block=False), [])
+        queue.put(b'1111')
+        queue.put(None)
+        self.assertEqual(queue.get_batch(100, block=False), [b'1111'])
+        self.assertIsNone(queue.get_batch(100, block=False))
+
+    def test_wait_gauge(self):
+        queue = _queue(aiy._drivers._recorder.OVERFLOW_DROP_OLDEST)
+        queue.put(b'1111')
+        time.sleep(0.05)
+        queue.get()
+        stats = queue.get_stats()
+        self.assertGreaterEqual(stats.wait_s, 0.04)
+        self.assertEqual(stats.max_depth_bytes, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
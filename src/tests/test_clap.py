@@ -0,0 +1,101 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''Test the clap trigger with synthetic audio.'''
+
+import unittest
+
+import mock
+import numpy as np
+
+import triggers.clap
+
+RATE = 16000
+CHUNK = 1600  # 100 ms
+
+
+class FakeRecorder(object):
+
+    def add_processor(self, processor):
+        pass
+
+
+def _audio(seconds, claps=(), jump=30000):
+    """Quiet noise, with a sharp jump at each of the given times."""
+    audio = np.random.RandomState(0).randint(-100, 100, int(seconds * RATE))
+    for at in claps:
+        start = int(at * RATE)
+        audio[start:start + 40] = jump // 2
+        audio[start + 40:start + 80] = -(jump // 2)
+    return np.clip(audio, -32768, 32767).astype(np.int16).tobytes()
+
+
+class TestClapTrigger(unittest.TestCase):
+
+    def _trigger(self, **kwargs):
+        trigger = triggers.clap.ClapTrigger(FakeRecorder(), **kwargs)
+        self.callback = mock.Mock()
+        trigger.set_callback(self.callback)
+        trigger.start()
+        return trigger
+
+    def _feed(self, trigger, data):
+        for i in range(0, len(data), CHUNK * 2):
+            trigger.add_data(memoryview(data)[i:i + CHUNK * 2])
+
+    def test_single_clap(self):
+        trigger = self._trigger()
+        self._feed(trigger, _audio(1))
+        self.callback.assert_not_called()
+        self._feed(trigger, _audio(1, claps=[0.5]))
+        self.callback.assert_called_once_with()
+
+    def test_jump_beyond_int16(self):
+        # From -25000 to 25000 would wrap around in int16 arithmetic.
+        trigger = self._trigger()
+        self._feed(trigger, _audio(1, claps=[0.5], jump=50000))
+        self.callback.assert_called_once_with()
+
+    def test_no_work_when_disarmed(self):
+        trigger = self._trigger()
+        trigger.have_clap = True
+        with mock.patch('triggers.clap.np.frombuffer') as frombuffer:
+            self._feed(trigger, _audio(1, claps=[0.5]))
+        frombuffer.assert_not_called()
+        self.callback.assert_not_called()
+
+    def test_double_clap(self):
+        trigger = self._trigger(claps=2)
+        self._feed(trigger, _audio(1, claps=[0.2, 0.5]))
+        self.callback.assert_called_once_with()
+
+    def test_double_clap_too_far_apart(self):
+        trigger = self._trigger(claps=2)
+        self._feed(trigger, _audio(1.5, claps=[0.2, 1.2]))
+        self.callback.assert_not_called()
+
+        # A clap soon after the last one completes a new pattern.
+        self._feed(trigger, _audio(1, claps=[0.2]))
+        self.callback.assert_called_once_with()
+
+    def test_one_clap_spanning_chunks_counts_once(self):
+        trigger = self._trigger(claps=2)
+        # The clap's jumps straddle the first chunk boundary.
+        self._feed(trigger, _audio(1, claps=[0.0975]))
+        self.callback.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
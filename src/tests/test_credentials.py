@@ -0,0 +1,94 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''Test the background credentials refresh.'''
+
+import datetime
+import threading
+import unittest
+
+import google.auth.exceptions
+
+import aiy._apis._credentials
+
+
+class FakeCredentials(object):
+
+    def __init__(self, token=None, expires_in_s=3600, fail=False):
+        self.token = token
+        self.expiry = None
+        self.refresh_count = 0
+        self._expires_in_s = expires_in_s
+        self._fail = fail
+        if token:
+            self._set_expiry()
+
+    @property
+    def valid(self):
+        return bool(self.token) and self.expiry > datetime.datetime.utcnow()
+
+    def _set_expiry(self):
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=self._expires_in_s)
+
+    def refresh(self, request):
+        if self._fail:
+            raise google.auth.exceptions.RefreshError('no network')
+        self.refresh_count += 1
+        self.token = 'token%d' % self.refresh_count
+        self._set_expiry()
+
+
+class TestCredentialsManager(unittest.TestCase):
+
+    def test_ensure_valid_refreshes_missing_token(self):
+        credentials = FakeCredentials()
+        manager = aiy._apis._credentials.CredentialsManager(credentials)
+        manager.ensure_valid()
+        self.assertEqual(credentials.refresh_count, 1)
+        self.assertEqual(manager.get_stats().refreshes, 1)
+
+    def test_ensure_valid_does_not_refresh_valid_token(self):
+        credentials = FakeCredentials(token='token')
+        aiy._apis._credentials.CredentialsManager(credentials).ensure_valid()
+        self.assertEqual(credentials.refresh_count, 0)
+
+    def test_failures_are_counted_and_raised(self):
+        manager = aiy._apis._credentials.CredentialsManager(FakeCredentials(fail=True))
+        with self.assertRaises(google.auth.exceptions.RefreshError):
+            manager.ensure_valid()
+        self.assertEqual(manager.get_stats().failures, 1)
+
+    def test_background_refresh_before_expiry(self):
+        credentials = FakeCredentials(token='token', expires_in_s=0.2)
+        manager = aiy._apis._credentials.CredentialsManager(credentials)
+        manager.start()
+        try:
+            for _ in range(100):
+                if credentials.refresh_count:
+                    break
+                threading.Event().wait(0.01)
+        finally:
+            manager.stop()
+        self.assertGreaterEqual(credentials.refresh_count, 1)
+
+    def test_manager_is_shared_per_credentials(self):
+        credentials = FakeCredentials()
+        self.assertIs(aiy._apis._credentials.get_manager(credentials),
+                      aiy._apis._credentials.get_manager(credentials))
+
+
+if __name__ == '__main__':
+    unittest.main()
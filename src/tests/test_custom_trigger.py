@@ -0,0 +1,71 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''Test the snowboy hotword trigger with a fake detector.'''
+
+import unittest
+
+import mock
+
+from snowboy_fakes import FakeSnowboyDetect, import_with_fake_snowboy
+
+
+class FakeRecorder(object):
+
+    def __init__(self):
+        self.processors = []
+
+    def add_processor(self, processor):
+        self.processors.append(processor)
+
+
+class TestCustomTrigger(unittest.TestCase):
+
+    def setUp(self):
+        self.custom = import_with_fake_snowboy('custom')
+
+        FakeSnowboyDetect.instances = 0
+        self.recorder = FakeRecorder()
+        self.trigger = self.custom.CustomTrigger(self.recorder)
+        self.callback = mock.Mock()
+        self.trigger.set_callback(self.callback)
+
+    def test_model_is_loaded_once(self):
+        self.trigger.start()
+        for _ in range(10):
+            self.trigger.add_data(memoryview(b'\0' * 3200))
+        self.assertEqual(FakeSnowboyDetect.instances, 1)
+        self.assertEqual(self.recorder.processors, [self.trigger])
+        self.assertEqual(len(self.trigger.detector.detector.chunks), 10)
+        self.assertTrue(self.trigger.detector.detector.model_str.endswith(b'Alice.pmdl'))
+
+    def test_detects_once_until_started(self):
+        self.trigger.add_data(b'alice')
+        self.callback.assert_not_called()
+
+        self.trigger.start()
+        self.trigger.add_data(b'hello')
+        self.trigger.add_data(b'alice')
+        self.trigger.add_data(b'alice')
+        self.assertEqual(self.callback.call_count, 1)
+
+        self.trigger.start()
+        self.assertEqual(self.trigger.detector.detector.resets, 2)
+        self.trigger.add_data(b'alice')
+        self.assertEqual(self.callback.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''Test the multi-model hotword trigger with a fake detector.'''
+
+import unittest
+
+import mock
+
+from snowboy_fakes import FakeSnowboyDetect, import_with_fake_snowboy
+
+
+class FakeRecorder(object):
+
+    def add_processor(self, processor):
+        pass
+
+
+class TestHotwordTrigger(unittest.TestCase):
+
+    def setUp(self):
+        self.hotword = import_with_fake_snowboy('hotword')
+
+    def _trigger(self, *specs):
+        keywords = [self.hotword.parse_keyword(spec) for spec in specs]
+        trigger = self.hotword.HotwordTrigger(FakeRecorder(), keywords)
+        self.callback = mock.Mock()
+        self.command_callback = mock.Mock()
+        trigger.set_callback(self.callback)
+        trigger.set_command_callback(self.command_callback)
+        trigger.start()
+        return trigger
+
+    def test_parse_keyword(self):
+        parse = self.hotword.parse_keyword
+        self.assertEqual(parse('alice.pmdl'), ('alice.pmdl', 0.5, None))
+        self.assertEqual(parse('lights.pmdl:0.6=turn on the lights'),
+                         ('lights.pmdl', 0.6, 'turn on the lights'))
+        self.assertEqual(parse('time.umdl=what time is it'),
+                         ('time.umdl', 0.5, 'what time is it'))
+        with self.assertRaises(ValueError):
+            parse('alice.pmdl:loud')
+
+    def test_one_detector_for_all_models(self):
+        trigger = self._trigger('a.pmdl:0.4', 'b.pmdl:0.6=what time is it')
+        detector = trigger.detector.detector
+        self.assertEqual(detector.models, [b'a.pmdl', b'b.pmdl'])
+        self.assertEqual(detector.sensitivity, b'0.4,0.6')
+
+        trigger.add_data(b'hello')
+        self.assertEqual(len(detector.chunks), 1)
+
+    def test_routes_keywords(self):
+        trigger = self._trigger('a.pmdl', 'b.pmdl=what time is it')
+
+        trigger.add_data(b'word2')
+        self.command_callback.assert_called_once_with('what time is it')
+        self.callback.assert_not_called()
+
+        # Disarmed until started again.
+        trigger.add_data(b'word1')
+        self.callback.assert_not_called()
+
+        trigger.start()
+        trigger.add_data(b'word1')
+        self.callback.assert_called_once_with()
+        self.assertEqual(self.command_callback.call_count, 1)
+
+    def test_universal_model_with_several_hotwords(self):
+        with mock.patch.dict(FakeSnowboyDetect.HOTWORDS, {b'jarvis.umdl': 2}):
+            trigger = self._trigger('jarvis.umdl:0.4=what time is it', 'b.pmdl:0.6')
+        detector = trigger.detector.detector
+        self.assertEqual(detector.sensitivity, b'0.4,0.4,0.6')
+
+        # Both hotwords of jarvis.umdl run its command.
+        trigger.add_data(b'word2')
+        self.command_callback.assert_called_once_with('what time is it')
+        trigger.start()
+        trigger.add_data(b'word1')
+        self.assertEqual(self.command_callback.call_count, 2)
+
+        # b.pmdl comes after them.
+        trigger.start()
+        trigger.add_data(b'word3')
+        self.callback.assert_called_once_with()
+
+    def test_universal_model_with_one_hotword(self):
+        trigger = self._trigger('alexa.umdl=what time is it', 'b.pmdl')
+        trigger.add_data(b'word2')
+        self.callback.assert_called_once_with()
+        self.assertEqual(trigger.hotword_keywords, trigger.keywords)
+
+    def test_commands_need_a_command_callback(self):
+        trigger = self._trigger('a.pmdl', 'b.pmdl=what time is it')
+        trigger.set_command_callback(None)
+        trigger.add_data(b'word2')
+        self.callback.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
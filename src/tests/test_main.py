@@ -0,0 +1,122 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+'''Test the recognizer loop with a fake recognizer and a fake aplay.'''
+
+import os
+import shutil
+import tempfile
+import threading
+import types
+import unittest
+
+import mock
+
+import actionbase
+import aiy._drivers._player
+from stand_ins import PROTO_MODULES, import_with_stand_ins
+
+try:
+    import grpc
+except ImportError:
+    grpc = None
+
+FAKE_APLAY = '''#!/bin/sh
+cat >> "$(dirname "$0")/played"
+'''
+
+RESPONSE_AUDIO = b'\x01' * 320
+SAID_AUDIO = b'\x02' * 320
+
+
+class FakeRecognizer(object):
+
+    """Streams the Assistant's response, then returns it with the transcript."""
+
+    dialog_follow_on = False
+
+    def __init__(self, transcript):
+        self.transcript = transcript
+        self._audio_out_cb = None
+
+    def set_endpointer_cb(self, cb):
+        pass
+
+    def set_audio_out_cb(self, cb):
+        self._audio_out_cb = cb
+
+    def do_request(self):
+        self._audio_out_cb(self.transcript, RESPONSE_AUDIO)
+        return types.SimpleNamespace(transcript=self.transcript,
+                                     response_audio=RESPONSE_AUDIO)
+
+
+class SayAction(object):
+
+    def __init__(self, say):
+        self.say = say
+
+    def run(self, command):
+        self.say('ok')
+
+
+@unittest.skipIf(grpc is None, 'grpc is not installed')
+class TestSyncMicRecognizer(unittest.TestCase):
+
+    def setUp(self):
+        self.main = import_with_stand_ins(
+            'main', dict(PROTO_MODULES, **{'google_auth_oauthlib.flow': {}}))
+
+        self.bin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.bin_dir)
+        aplay = os.path.join(self.bin_dir, 'aplay')
+        with open(aplay, 'w') as f:
+            f.write(FAKE_APLAY)
+        os.chmod(aplay, 0o755)
+        patcher = mock.patch.dict(
+            os.environ, {'PATH': self.bin_dir + os.pathsep + os.environ['PATH']})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.player = aiy._drivers._player.Player()
+        self.addCleanup(self.player.interrupt)
+
+    def _say(self, text):
+        self.player.play_bytes(SAID_AUDIO, 16000)
+
+    def _recognize_once(self, assistant_always_responds):
+        actor = actionbase.Actor()
+        actor.add_keyword('what time is it', SayAction(self._say))
+        recognizer = self.main.SyncMicRecognizer(
+            actor, FakeRecognizer('what time is it'), mock.Mock(), self.player,
+            self._say, mock.Mock(), mock.Mock(), assistant_always_responds)
+
+        thread = threading.Thread(target=recognizer._recognize_once, daemon=True)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive(), 'the local command was blocked')
+        with open(os.path.join(self.bin_dir, 'played'), 'rb') as f:
+            return f.read()
+
+    def test_local_command_after_assistant_response(self):
+        self.assertEqual(self._recognize_once(True), RESPONSE_AUDIO + SAID_AUDIO)
+
+    def test_local_command_without_assistant_response(self):
+        self.assertEqual(self._recognize_once(False), SAID_AUDIO)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''Test the persistent audio player with a fake aplay.'''
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import wave
+
+import aiy._drivers._player
+
+FAKE_APLAY = '''#!/bin/sh
+echo "$*" >> "$(dirname "$0")/started"
+cat >> "$(dirname "$0")/played"
+'''
+
+
+class TestPlayer(unittest.TestCase):
+
+    def setUp(self):
+        self.bin_dir = tempfile.mkdtemp()
+        aplay = os.path.join(self.bin_dir, 'aplay')
+        with open(aplay, 'w') as f:
+            f.write(FAKE_APLAY)
+        os.chmod(aplay, 0o755)
+        self.old_path = os.environ['PATH']
+        os.environ['PATH'] = self.bin_dir + os.pathsep + self.old_path
+
+        self.player = aiy._drivers._player.Player()
+
+    def tearDown(self):
+        self.player.interrupt()
+        os.environ['PATH'] = self.old_path
+        shutil.rmtree(self.bin_dir)
+
+    def _read(self, name):
+        with open(os.path.join(self.bin_dir, name), 'rb') as f:
+            return f.read()
+
+    def test_clips_share_one_aplay_process(self):
+        self.player.play_bytes(b'\x01' * 320, 16000)
+        self.player.play_bytes(b'\x02' * 320, 16000)
+        self.assertEqual(len(self._read('started').splitlines()), 1)
+
+    def test_clip_waits_for_its_duration(self):
+        start = time.monotonic()
+        self.player.play_bytes(bytes(3200), 16000)
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_format_change_restarts_aplay(self):
+        self.player.play_bytes(bytes(320), 16000)
+        self.player.play_bytes(bytes(320), 24000)
+        started = self._read('started').splitlines()
+        self.assertEqual(len(started), 2)
+        self.assertTrue(started[1].endswith(b'-r 24000'))
+
+    def test_stream_plays_written_audio(self):
+        stream = self.player.open_stream(16000)
+        stream.write(b'\x01' * 320)
+        stream.write(b'\x02' * 320)
+        stream.close()
+        self.assertTrue(stream.future.done())
+
+    def test_interrupt_cancels_queued_clips(self):
+        playing = self.player.enqueue(bytes(320000), 16000)
+        queued = self.player.enqueue(bytes(320), 16000)
+        self.player.interrupt()
+        self.assertTrue(playing.cancelled())
+        self.assertTrue(queued.cancelled())
+        # The player still works after an interrupt.
+        self.player.play_bytes(bytes(320), 16000)
+
+
+class TestPcmCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write_wav(self, name, frames):
+        path = os.path.join(self.dir, name)
+        with wave.open(path, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            wav.writeframes(frames)
+        return path
+
+    def test_cached_until_file_changes(self):
+        cache = aiy._drivers._player.PcmCache()
+        path = self._write_wav('a.wav', b'\x01\x00' * 10)
+        pcm = cache.get(path)
+        self.assertEqual(pcm.frames, b'\x01\x00' * 10)
+        self.assertEqual(pcm.sample_rate, 16000)
+        self.assertIs(cache.get(path), pcm)
+
+        self._write_wav('a.wav', b'\x02\x00' * 10)
+        os.utime(path, ns=(0, 1))
+        self.assertEqual(cache.get(path).frames, b'\x02\x00' * 10)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = aiy._drivers._player.PcmCache(max_bytes=50)
+        a = self._write_wav('a.wav', bytes(20))
+        b = self._write_wav('b.wav', bytes(20))
+        c = self._write_wav('c.wav', bytes(20))
+        pcm_a = cache.get(a)
+        pcm_b = cache.get(b)
+        cache.get(a)
+        cache.get(c)
+        self.assertIs(cache.get(a), pcm_a)
+        self.assertIsNot(cache.get(b), pcm_b)
+
+
+if __name__ == '__main__':
+    unittest.main()
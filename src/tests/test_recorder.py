@@ -0,0 +1,241 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''Test the recorder's chunking of the audio stream.'''
+
+import io
+import os
+import tempfile
+import threading
+import unittest
+import wave
+
+import mock
+
+import aiy._drivers._capture
+import aiy._drivers._recorder
+
+
+class _TrickleStream(io.RawIOBase):
+
+    """A stream that returns at most a few bytes per read, like a pipe."""
+
+    def __init__(self, data, max_read):
+        self._data = io.BytesIO(data)
+        self._max_read = max_read
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._data.readinto(memoryview(b)[:self._max_read])
+
+
+class _Processor(object):
+
+    def __init__(self, copy=True):
+        self.chunks = []
+        self._copy = copy
+
+    def add_data(self, data):
+        self.chunks.append(bytes(data) if self._copy else data)
+
+
+class _FailingCapture(aiy._drivers._capture.CaptureBackend):
+
+    """Fails to start, or to read once started."""
+
+    def __init__(self, fail_on):
+        self._fail_on = fail_on
+
+    def start(self):
+        if self._fail_on == 'start':
+            raise OSError('Invalid input device')
+
+    def readinto(self, buf):
+        raise OSError('Input overflowed')
+
+
+class TestRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.recorder = aiy._drivers._recorder.Recorder()
+        self.chunk_bytes = self.recorder._chunk_bytes
+
+    def test_chunks_are_reassembled_from_short_reads(self):
+        audio = bytes(range(256)) * 50
+        processor = _Processor()
+        self.recorder.add_processor(processor)
+        self.recorder._read_stream(_TrickleStream(audio, 1000))
+
+        whole_chunks = len(audio) // self.chunk_bytes
+        self.assertEqual(len(processor.chunks), whole_chunks)
+        self.assertEqual(b''.join(processor.chunks),
+                         audio[:whole_chunks * self.chunk_bytes])
+
+    def test_chunks_are_read_only(self):
+        processor = _Processor(copy=False)
+        self.recorder.add_processor(processor)
+        self.recorder._read_stream(io.BytesIO(bytes(self.chunk_bytes)))
+        self.assertTrue(processor.chunks[0].readonly)
+
+
+
+class TestCaptureFailure(unittest.TestCase):
+
+    def _run(self, backend):
+        recorder = aiy._drivers._recorder.Recorder(backend=backend)
+        with mock.patch('aiy._drivers._recorder._abort') as abort, \
+                self.assertLogs('recorder', 'ERROR') as logs:
+            recorder.start()
+            recorder.join(5)
+        self.assertFalse(recorder.is_alive())
+        abort.assert_called_once_with()
+        return logs.output
+
+    def test_exits_if_start_fails(self):
+        output = self._run(_FailingCapture('start'))
+        self.assertIn('Audio capture failed', output[0])
+        self.assertIn('Invalid input device', output[0])
+
+    def test_exits_if_read_fails(self):
+        output = self._run(_FailingCapture('read'))
+        self.assertIn('Input overflowed', output[0])
+
+    def test_no_exit_if_closed_while_reading(self):
+        backend = _FailingCapture('read')
+        recorder = aiy._drivers._recorder.Recorder(backend=backend)
+
+        def close_then_fail(buf):
+            recorder.__exit__()
+            raise OSError('Stream closed')
+
+        backend.readinto = close_then_fail
+        with mock.patch('aiy._drivers._recorder._abort') as abort:
+            recorder.run()
+        abort.assert_not_called()
+
+
+class TestPreroll(unittest.TestCase):
+
+    def setUp(self):
+        self.recorder = aiy._drivers._recorder.Recorder(preroll_s=0.5)
+        self.chunk_bytes = self.recorder._chunk_bytes
+
+    def _record(self, first, count):
+        audio = b''.join(bytes([i]) * self.chunk_bytes for i in range(first, first + count))
+        self.recorder._read_stream(io.BytesIO(audio))
+
+    def test_processor_is_primed_with_preroll(self):
+        self._record(0, 8)
+        processor = _Processor()
+        self.recorder.add_processor(processor, preroll=True)
+        self._record(8, 1)
+
+        self.assertEqual(len(processor.chunks), 2)
+        self.assertEqual(processor.chunks[0],
+                         b''.join(bytes([i]) * self.chunk_bytes for i in range(3, 8)))
+        self.assertEqual(processor.chunks[1], bytes([8]) * self.chunk_bytes)
+
+    def test_preroll_is_limited_to_recorded_audio(self):
+        self._record(0, 2)
+        processor = _Processor()
+        self.recorder.add_processor(processor, preroll=True)
+        self.assertEqual(processor.chunks, [bytes([0]) * self.chunk_bytes +
+                                            bytes([1]) * self.chunk_bytes])
+
+    def test_no_preroll_by_default(self):
+        self._record(0, 3)
+        processor = _Processor()
+        self.recorder.add_processor(processor)
+        self.assertEqual(processor.chunks, [])
+
+
+class TestQueuedProcessors(unittest.TestCase):
+
+    def test_queued_processor_receives_all_chunks(self):
+        recorder = aiy._drivers._recorder.Recorder(processor_queue=100)
+        processor = _Processor()
+        recorder.add_processor(processor)
+        recorder._read_stream(io.BytesIO(bytes(recorder._chunk_bytes * 5)))
+
+        worker = recorder._workers[processor]
+        for _ in range(100):
+            if recorder.get_processor_stats()[processor].delivered == 5:
+                break
+            threading.Event().wait(0.01)
+        recorder.remove_processor(processor)
+        worker.join(1)
+
+        self.assertEqual(len(processor.chunks), 5)
+        self.assertEqual(recorder.get_processor_stats(), {})
+
+    def _fill_unstarted_worker(self, overflow):
+        worker = aiy._drivers._recorder._ProcessorWorker(_Processor(), 2, overflow)
+        for data in (b'1', b'2', b'3'):
+            worker.put(data)
+        return worker
+
+    def test_drop_oldest(self):
+        worker = self._fill_unstarted_worker(aiy._drivers._recorder.OVERFLOW_DROP_OLDEST)
+        self.assertEqual([data for _, data in worker._chunks], [b'2', b'3'])
+        self.assertEqual(worker.get_stats().dropped, 1)
+
+    def test_drop_newest(self):
+        worker = self._fill_unstarted_worker(aiy._drivers._recorder.OVERFLOW_DROP_NEWEST)
+        self.assertEqual([data for _, data in worker._chunks], [b'1', b'2'])
+        self.assertEqual(worker.get_stats().dropped, 1)
+
+    def test_invalid_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            aiy._drivers._recorder.Recorder(processor_queue=1, overflow='explode')
+
+
+class TestFileCapture(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.wav_path = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+        self.audio = bytes(range(256)) * 40
+        with wave.open(self.wav_path, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            wav.writeframes(self.audio)
+
+    def tearDown(self):
+        os.unlink(self.wav_path)
+
+    def test_recorder_replays_wav_file(self):
+        backend = aiy._drivers._capture.FileCapture(
+            self.wav_path, 1, 2, 16000, realtime=False)
+        recorder = aiy._drivers._recorder.Recorder(backend=backend)
+        processor = _Processor()
+        recorder.add_processor(processor)
+        with recorder:
+            recorder.join(5)
+
+        self.assertFalse(recorder.is_alive())
+        self.assertEqual(b''.join(processor.chunks), self.audio[:9600])
+
+    def test_wav_format_must_match(self):
+        backend = aiy._drivers._capture.FileCapture(
+            self.wav_path, 1, 2, 48000, realtime=False)
+        with self.assertRaises(ValueError):
+            backend.start()
+
+
+if __name__ == '__main__':
+    unittest.main()
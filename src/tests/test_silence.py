@@ -0,0 +1,68 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''Test dropping silence from uploaded audio.'''
+
+import unittest
+
+import numpy as np
+
+import aiy._apis._silence
+
+CHUNK_SAMPLES = 1600  # 100 ms
+
+
+def _chunk(level):
+    return (np.ones(CHUNK_SAMPLES) * level * 32767).astype(np.int16).tobytes()
+
+
+SILENCE = _chunk(0)
+SPEECH = _chunk(0.1)
+
+
+class TestSilenceSuppressor(unittest.TestCase):
+
+    def setUp(self):
+        self.suppressor = aiy._apis._silence.SilenceSuppressor(
+            max_silence_s=0.3, hangover_s=0.2, timeout_s=1.0)
+
+    def _process(self, chunks):
+        return [self.suppressor.process(chunk) for chunk in chunks]
+
+    def test_speech_is_sent(self):
+        self.assertEqual(self._process([SPEECH] * 3), [[SPEECH]] * 3)
+
+    def test_short_silence_is_sent(self):
+        self.assertEqual(self._process([SPEECH] + [SILENCE] * 3),
+                         [[SPEECH]] + [[SILENCE]] * 3)
+
+    def test_long_silence_is_dropped_with_hangover(self):
+        sent = self._process([SPEECH] + [SILENCE] * 8 + [SPEECH])
+        self.assertEqual(sent[1:4], [[SILENCE]] * 3)
+        self.assertEqual(sent[4:9], [[]] * 5)
+        # The hangover before the speech is sent with it.
+        self.assertEqual(sent[9], [SILENCE, SILENCE, SPEECH])
+
+    def test_times_out(self):
+        self._process([SILENCE] * 12)
+        self.assertFalse(self.suppressor.timed_out)
+        self._process([SILENCE])
+        self.assertTrue(self.suppressor.timed_out)
+        self.suppressor.reset()
+        self.assertFalse(self.suppressor.timed_out)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''Test the audio ring buffer and detection loop of the snowboy decoder.'''
+
+import collections
+import random
+import sys
+import threading
+import time
+import unittest
+
+import mock
+
+from snowboy_fakes import import_with_fake_snowboy
+
+
+class FakePyAudio(object):
+
+    """Calls the stream callback from a thread with the given chunks."""
+
+    paContinue = 0
+    chunks = []
+    results = []
+
+    def PyAudio(self):
+        return self
+
+    def get_format_from_width(self, width):
+        return width
+
+    def open(self, stream_callback, **kwargs):
+        def deliver():
+            for chunk in self.chunks:
+                time.sleep(0.05)
+                self.results.append(stream_callback(chunk, len(chunk) // 2, {}, 0))
+        self.thread = threading.Thread(target=deliver)
+        self.thread.start()
+        return mock.Mock()
+
+    def terminate(self):
+        self.thread.join()
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = import_with_fake_snowboy('snowboydecoder').RingBuffer(8)
+
+    def test_get_clears(self):
+        self.buffer.extend(b'abc')
+        self.buffer.extend(b'de')
+        self.assertEqual(len(self.buffer), 5)
+        self.assertEqual(self.buffer.get(), b'abcde')
+        self.assertEqual(self.buffer.get(), b'')
+        self.assertEqual(self.buffer.overflow, 0)
+
+    def test_wraparound(self):
+        self.buffer.extend(b'abcdef')
+        self.assertEqual(self.buffer.get()[:2], b'ab')
+        self.buffer.extend(b'123456')
+        self.buffer.extend(b'78')
+        self.assertEqual(self.buffer.get(), b'12345678')
+
+    def test_overflow_drops_oldest(self):
+        self.buffer.extend(b'abcdef')
+        self.buffer.extend(b'123456')
+        self.assertEqual(self.buffer.overflow, 4)
+        self.assertEqual(self.buffer.get(), b'ef123456')
+
+    def test_overflow_wraps_start(self):
+        self.buffer.extend(b'abcde')
+        self.buffer.get()
+        self.buffer.extend(b'abcde')
+        self.buffer.extend(b'fghij')
+        self.buffer.extend(b'k')
+        self.assertEqual(self.buffer.overflow, 3)
+        self.assertEqual(self.buffer.get(), b'defghijk')
+
+    def test_chunk_larger_than_buffer(self):
+        self.buffer.extend(b'xyz')
+        self.buffer.extend(b'0123456789')
+        self.assertEqual(self.buffer.overflow, 5)
+        self.assertEqual(self.buffer.get(), b'23456789')
+
+    def test_matches_deque(self):
+        rand = random.Random(0)
+        reference = collections.deque(maxlen=8)
+        for _ in range(200):
+            if rand.random() < 0.3:
+                self.assertEqual(self.buffer.get(), bytes(bytearray(reference)))
+                reference.clear()
+            else:
+                data = bytes(rand.randrange(256) for _ in range(rand.randrange(12)))
+                self.buffer.extend(data)
+                reference.extend(data)
+
+    def test_wait(self):
+        self.assertFalse(self.buffer.wait(0.01))
+        threading.Timer(0.05, self.buffer.extend, [b'abc']).start()
+        self.assertTrue(self.buffer.wait(5))
+        data, written_at = self.buffer.get_with_time()
+        self.assertEqual(data, b'abc')
+        self.assertLessEqual(written_at, time.monotonic())
+        self.assertEqual(self.buffer.get_with_time(), (b'', None))
+
+    def test_wake(self):
+        threading.Timer(0.05, self.buffer.wake).start()
+        start = time.monotonic()
+        self.assertFalse(self.buffer.wait(5))
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class TestHotwordDetector(unittest.TestCase):
+
+    def setUp(self):
+        self.pyaudio = FakePyAudio()
+        self.pyaudio.chunks = [b'hello', b'alice', b'hello']
+        self.pyaudio.results = []
+        patcher = mock.patch.dict(sys.modules, {'pyaudio': self.pyaudio})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.snowboydecoder = import_with_fake_snowboy('snowboydecoder')
+
+    def test_start_detects_without_polling(self):
+        detector = self.snowboydecoder.HotwordDetector('model.pmdl')
+        detected = []
+
+        def callback():
+            detected.append(time.monotonic())
+            detector.terminate()
+
+        # A long sleep_time would delay the detection if the loop polled.
+        start = time.monotonic()
+        detector.start(detected_callback=callback, sleep_time=10)
+
+        self.assertEqual(len(detected), 1)
+        self.assertLess(detected[0] - start, 2)
+        stats = detector.get_stats()
+        self.assertEqual(stats.detections, 1)
+        self.assertLess(stats.last_latency_s, 1)
+        self.assertEqual(stats.max_latency_s, stats.last_latency_s)
+        self.assertEqual(stats.overflow, 0)
+        self.assertEqual(self.pyaudio.results, [(None, 0)] * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
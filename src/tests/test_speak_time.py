@@ -18,6 +18,7 @@ import datetime
 import unittest
 
 import action
+import actionbase
 
 
 class TestTimeToStr(unittest.TestCase):
@@ -55,5 +56,27 @@ class TestTimeToStr(unittest.TestCase):
     def test_twenty_past_four_pm(self):
         self.assertTimeToStr(datetime.time(16, 20), 'It is twenty past four.')
 
+    def test_static_responses_cover_every_minute(self):
+        speak_time = action.SpeakTime(None)
+        responses = speak_time.static_responses()
+        for minute in range(24 * 60):
+            dt = datetime.time(minute // 60, minute % 60)
+            self.assertIn(speak_time.to_str(dt), responses)
+
+
+class TestGetStaticResponses(unittest.TestCase):
+
+    class CustomHandler(object):
+
+        def get_phrases(self):
+            return []
+
+    def test_skips_handlers_without_an_action(self):
+        actor = actionbase.Actor()
+        actor.add_keyword('what time is it', action.SpeakAction(None, 'It is late.'))
+        actor.handlers.append(self.CustomHandler())
+        self.assertEqual(action.get_static_responses(actor), ['It is late.'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,279 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+'''Test the speech requests with a fake gRPC channel.'''
+
+import os
+import threading
+import unittest
+
+import mock
+
+import aiy._drivers._recorder
+from stand_ins import PROTO_MODULES, import_with_stand_ins
+
+try:
+    import grpc
+except ImportError:
+    grpc = None
+
+
+class FakeChannel(object):
+
+    """Reports its connectivity state to its subscribers."""
+
+    def __init__(self):
+        self.closed = False
+        self._callbacks = []
+
+    def subscribe(self, callback, try_to_connect=False):
+        self._callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        self._callbacks.remove(callback)
+
+    def set_state(self, state):
+        for callback in list(self._callbacks):
+            callback(state)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeChannelFactory(object):
+
+    def __init__(self, api_host, credentials):
+        self.channel = FakeChannel()
+        self.discarded = 0
+
+    def make_channel(self):
+        return self.channel
+
+    def discard_channel(self):
+        self.discarded += 1
+
+
+@unittest.skipIf(grpc is None, 'grpc is not installed')
+class TestSpeechRequest(unittest.TestCase):
+
+    # pylint: disable=protected-access
+
+    def setUp(self):
+        self.speech = speech = import_with_stand_ins('speech', PROTO_MODULES)
+
+        class FakeRpcError(grpc.RpcError):
+
+            def __init__(self, code):
+                super().__init__()
+                self._code = code
+
+            def code(self):
+                return self._code
+
+        class FakeRequest(speech.GenericSpeechRequest):
+
+            """Fails the call without reading any of the audio."""
+
+            CHANNEL_FACTORY = FakeChannelFactory
+
+            def __init__(self):
+                super().__init__('speech.example.com', None)
+                self.error_code = grpc.StatusCode.UNAVAILABLE
+
+            def _make_service(self, channel):
+                return channel
+
+            def _create_config_request(self):
+                return ('config', list(self._phrases))
+
+            def _create_audio_request(self, data):
+                return data
+
+            def _create_response_stream(self, service, request_stream, deadline):
+                raise FakeRpcError(self.error_code)
+
+            def _stop_sending_audio(self, resp):
+                return False
+
+            def _handle_response(self, resp):
+                pass
+
+        self.request = FakeRequest()
+
+    def test_failed_call_releases_blocked_audio_source(self):
+        self.request.set_audio_queue_limit(3200, aiy._drivers._recorder.OVERFLOW_BLOCK)
+        removed = threading.Event()
+        self.request.set_endpointer_cb(removed.set)
+
+        def record():
+            # Like the Recorder, until the endpointer callback removes the
+            # request. The queue fills up, so this blocks.
+            while not removed.is_set():
+                self.request.add_data(bytes(3200))
+
+        recorder = threading.Thread(target=record, daemon=True)
+        recorder.start()
+        recorder.join(0.1)
+        self.assertTrue(recorder.is_alive())
+
+        with self.assertRaises(self.speech.Error):
+            self.request.do_request()
+
+        recorder.join(5)
+        self.assertFalse(recorder.is_alive(), 'the audio source is still blocked')
+        self.assertEqual(self.request.get_audio_queue_stats().depth_bytes, 0)
+        self.assertEqual(self.request._channel_factory.discarded, 1)
+
+
+    def test_duplicate_phrases_are_ignored(self):
+        phrases = mock.Mock()
+        phrases.get_phrases.return_value = ['Hello', ' hello ', 'HELLO', '', 'bye']
+        self.request.add_phrases(phrases)
+        self.request.add_phrase('hello')
+        self.assertEqual(self.request._get_config_request(), ('config', ['Hello', 'bye']))
+
+    def test_phrase_length_limit(self):
+        limit = self.speech.MAX_PHRASE_CHARS
+        with self.assertLogs('speech', 'WARNING'):
+            self.request.add_phrase('x' * (limit + 1))
+        self.request.add_phrase('y' * limit)
+        self.assertEqual(self.request._phrases, ['y' * limit])
+
+    def test_phrase_count_limit(self):
+        limit = self.speech.MAX_PHRASES
+        for i in range(limit):
+            self.request.add_phrase('phrase %d' % i)
+        with self.assertLogs('speech', 'WARNING'):
+            self.request.add_phrase('one too many')
+        self.assertEqual(len(self.request._phrases), limit)
+        self.assertNotIn('one too many', self.request._phrases)
+
+    def test_total_length_limit(self):
+        length = self.speech.MAX_PHRASE_CHARS
+        count = self.speech.MAX_PHRASES_TOTAL_CHARS // length
+        for i in range(count):
+            self.request.add_phrase(('%d ' % i).ljust(length, 'x'))
+        with self.assertLogs('speech', 'WARNING'):
+            self.request.add_phrase('a')
+        self.assertEqual(len(self.request._phrases), count)
+        self.assertEqual(sum(len(phrase) for phrase in self.request._phrases),
+                         self.speech.MAX_PHRASES_TOTAL_CHARS)
+
+    def test_config_request_is_rebuilt_when_phrases_change(self):
+        first = self.request._get_config_request()
+        self.assertIs(self.request._get_config_request(), first)
+
+        self.request.add_phrase('hello')
+        second = self.request._get_config_request()
+        self.assertEqual(second, ('config', ['hello']))
+
+        # A duplicate or ignored phrase doesn't change the request.
+        self.request.add_phrase('Hello')
+        self.request.add_phrase('x' * (self.speech.MAX_PHRASE_CHARS + 1))
+        self.assertIs(self.request._get_config_request(), second)
+
+    def test_cloud_config_request_is_rebuilt_when_language_changes(self):
+        class Request(self.speech.CloudSpeechRequest):
+
+            CHANNEL_FACTORY = FakeChannelFactory
+
+        # The request sets GOOGLE_APPLICATION_CREDENTIALS.
+        with mock.patch.object(self.speech, 'cloud_speech') as cloud_speech, \
+                mock.patch('google.auth.default', return_value=(None, None)), \
+                mock.patch.dict(os.environ):
+            request = Request('credentials.json')
+            request.language_code = 'en-US'
+            request._get_config_request()
+            request._get_config_request()
+            self.assertEqual(cloud_speech.StreamingRecognizeRequest.call_count, 1)
+
+            request.language_code = 'de-DE'
+            request._get_config_request()
+            self.assertEqual(cloud_speech.StreamingRecognizeRequest.call_count, 2)
+            self.assertEqual(cloud_speech.RecognitionConfig.call_args[1]['language_code'],
+                             'de-DE')
+
+            request.add_phrase('hallo')
+            request._get_config_request()
+            self.assertEqual(cloud_speech.StreamingRecognizeRequest.call_count, 3)
+            cloud_speech.SpeechContext.assert_called_with(phrases=['hallo'])
+
+
+    def test_only_unavailable_discards_the_channel(self):
+        self.request.error_code = grpc.StatusCode.INVALID_ARGUMENT
+        with self.assertRaises(self.speech.Error):
+            self.request.do_request()
+        self.assertEqual(self.request._channel_factory.discarded, 0)
+
+        self.request.error_code = grpc.StatusCode.UNAVAILABLE
+        with self.assertRaises(self.speech.Error):
+            self.request.do_request()
+        self.assertEqual(self.request._channel_factory.discarded, 1)
+
+
+@unittest.skipIf(grpc is None, 'grpc is not installed')
+class TestChannelFactory(unittest.TestCase):
+
+    # pylint: disable=protected-access
+
+    def setUp(self):
+        self.speech = import_with_stand_ins('speech', PROTO_MODULES)
+        patcher = mock.patch.object(self.speech._ChannelFactory, '_pool', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.created = []
+        self.factory = self._make_factory()
+
+    def _make_factory(self):
+        # Skip the credentials manager, which needs real credentials.
+        with mock.patch('aiy._apis._credentials.get_manager'):
+            factory = self.speech._ChannelFactory('speech.example.com', 'credentials')
+        factory._create_channel = self._create_channel
+        return factory
+
+    def _create_channel(self):
+        self.created.append(FakeChannel())
+        return self.created[-1]
+
+    def test_reuses_channel(self):
+        channel = self.factory.make_channel()
+        self.assertIs(self.factory.make_channel(), channel)
+        # Later requests have their own factories, and share the channel.
+        self.assertIs(self._make_factory().make_channel(), channel)
+        self.assertEqual(len(self.created), 1)
+
+    def test_rebuilds_broken_channel(self):
+        channel = self.factory.make_channel()
+        channel.set_state(grpc.ChannelConnectivity.IDLE)
+        self.assertIs(self.factory.make_channel(), channel)
+
+        channel.set_state(grpc.ChannelConnectivity.TRANSIENT_FAILURE)
+        replacement = self.factory.make_channel()
+        self.assertIsNot(replacement, channel)
+        self.assertTrue(channel.closed)
+        self.assertIs(self.factory.make_channel(), replacement)
+
+    def test_discard_channel(self):
+        channel = self.factory.make_channel()
+        self.factory.discard_channel()
+        self.assertTrue(channel.closed)
+        self.assertIsNot(self.factory.make_channel(), channel)
+        self.assertEqual(len(self.created), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
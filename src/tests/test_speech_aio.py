@@ -0,0 +1,247 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''Test the asyncio speech requests with a fake gRPC call.'''
+
+import asyncio
+import importlib
+import threading
+import time
+import types
+import unittest
+import weakref
+
+import mock
+
+from stand_ins import PROTO_MODULES, import_with_stand_ins
+
+try:
+    import grpc
+    import grpc.aio
+except ImportError:
+    grpc = None
+
+def _import_speech_aio():
+    """Imports speech_aio, with stand-ins for protobuf modules that are missing."""
+    speech_aio = import_with_stand_ins('speech_aio', PROTO_MODULES)
+    return importlib.import_module('speech'), speech_aio
+
+
+def _response(end=False):
+    return types.SimpleNamespace(error=types.SimpleNamespace(code=0, message=''), end=end)
+
+
+class FakeChannel(object):
+
+    def __init__(self):
+        self.closed = False
+
+    def get_state(self):
+        return grpc.ChannelConnectivity.READY
+
+    async def channel_ready(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeChannelFactory(object):
+
+    def __init__(self, api_host, credentials):
+        self.channel = FakeChannel()
+        self.discarded = 0
+        self.released = 0
+
+    async def make_channel(self):
+        return self.channel
+
+    async def discard_channel(self):
+        self.discarded += 1
+
+    async def release_channels(self):
+        self.released += 1
+
+
+@unittest.skipIf(grpc is None, 'grpc is not installed')
+class TestAsyncSpeechRequest(unittest.TestCase):
+
+    def setUp(self):
+        speech, self.speech_aio = _import_speech_aio()
+        self.Error = speech.Error
+
+        class FakeRequest(self.speech_aio._AsyncSpeechRequest, speech.GenericSpeechRequest):
+
+            """Sends the audio to a fake call, which answers at the end."""
+
+            CHANNEL_FACTORY = FakeChannelFactory
+
+            def __init__(self):
+                super().__init__('speech.example.com', None)
+                self.sent = []
+                self.error = None
+
+            def _make_service(self, channel):
+                return channel
+
+            def _get_config_request_key(self):
+                return None
+
+            def _create_config_request(self):
+                return 'config'
+
+            def _create_audio_request(self, data):
+                return data
+
+            def _create_response_stream(self, service, request_stream, deadline):
+                return self._respond(request_stream)
+
+            async def _respond(self, request_stream):
+                async for request in request_stream:
+                    self.sent.append(request)
+                if self.error:
+                    raise self.error
+                yield _response(end=True)
+
+            def _stop_sending_audio(self, resp):
+                return resp.end
+
+            def _handle_response(self, resp):
+                pass
+
+        self.request = FakeRequest()
+
+    def _run(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            # Fail rather than hang if the loop isn't woken up.
+            return loop.run_until_complete(asyncio.wait_for(coroutine, 10))
+        finally:
+            loop.close()
+
+    def _rpc_error(self, code):
+        return grpc.aio.AioRpcError(code, grpc.aio.Metadata(), grpc.aio.Metadata())
+
+    def test_audio_from_another_thread_wakes_the_loop(self):
+        chunks = [bytes([i]) * 3200 for i in range(5)]
+
+        def record():
+            for chunk in chunks:
+                time.sleep(0.02)
+                self.request.add_data(memoryview(chunk))
+            self.request.end_audio()
+
+        recorder = threading.Timer(0.05, record)
+        recorder.start()
+        start = time.monotonic()
+        self._run(self.request.do_request_async())
+        recorder.join()
+
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(self.request.sent[0], 'config')
+        self.assertEqual(b''.join(self.request.sent[1:]), b''.join(chunks))
+        self.assertEqual(self.request.captured_bytes, 5 * 3200)
+        self.assertIsNotNone(self.request.time_to_ready)
+
+    def test_audio_queued_before_the_request(self):
+        self.request.add_data(b'1234')
+        self.request.end_audio()
+        self._run(self.request.do_request_async())
+        self.assertEqual(self.request.sent, ['config', b'1234'])
+
+    def test_unavailable_discards_the_channel(self):
+        self.request.error = self._rpc_error(grpc.StatusCode.UNAVAILABLE)
+        endpointer_cb = mock.Mock()
+        self.request.set_endpointer_cb(endpointer_cb)
+        self.request.end_audio()
+        with self.assertRaises(self.Error):
+            self._run(self.request.do_request_async())
+        self.assertEqual(self.request._channel_factory.discarded, 1)
+        # The audio source is told to stop, as at the end of speech.
+        endpointer_cb.assert_called_once_with()
+
+    def test_other_errors_keep_the_channel(self):
+        self.request.error = self._rpc_error(grpc.StatusCode.INVALID_ARGUMENT)
+        self.request.end_audio()
+        with self.assertRaises(self.Error):
+            self._run(self.request.do_request_async())
+        self.assertEqual(self.request._channel_factory.discarded, 0)
+
+    def test_do_request_closes_its_loop(self):
+        loops = []
+        new_event_loop = asyncio.new_event_loop
+
+        def record_loop():
+            loops.append(new_event_loop())
+            return loops[-1]
+
+        self.request.end_audio()
+        with mock.patch('asyncio.new_event_loop', record_loop):
+            self.request.do_request()
+        self.assertEqual(len(loops), 1)
+        self.assertTrue(loops[0].is_closed())
+        self.assertEqual(self.request._channel_factory.released, 1)
+
+
+@unittest.skipIf(grpc is None, 'grpc is not installed')
+class TestAioChannelFactory(unittest.TestCase):
+
+    def setUp(self):
+        _, speech_aio = _import_speech_aio()
+        patcher = mock.patch.object(speech_aio._AioChannelFactory, '_pool',
+                                    weakref.WeakKeyDictionary())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Skip the credentials manager, which needs real credentials.
+        self.factory = object.__new__(speech_aio._AioChannelFactory)
+        self.factory._api_host = 'speech.example.com'
+        self.factory._credentials = None
+        self.factory._credentials_manager = mock.Mock()
+        self.factory._create_channel = FakeChannel
+
+    def _on_new_loop(self, coroutine_function):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop, loop.run_until_complete(coroutine_function())
+        finally:
+            loop.close()
+
+    def test_reuses_channel_on_the_same_loop(self):
+        async def make_two():
+            return (await self.factory.make_channel(), await self.factory.make_channel())
+
+        _, (first, second) = self._on_new_loop(make_two)
+        self.assertIs(first, second)
+
+    def test_forgets_channels_of_closed_loops(self):
+        first_loop, first = self._on_new_loop(self.factory.make_channel)
+        _, second = self._on_new_loop(self.factory.make_channel)
+        self.assertIsNot(first, second)
+        self.assertNotIn(first_loop, self.factory._pool)
+
+    def test_release_channels(self):
+        async def make_and_release():
+            channel = await self.factory.make_channel()
+            await self.factory.release_channels()
+            return channel
+
+        loop, channel = self._on_new_loop(make_and_release)
+        self.assertTrue(channel.closed)
+        self.assertNotIn(loop, self.factory._pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''Test the TTS cache with a fake pico2wave.'''
+
+import concurrent.futures
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import mock
+
+import aiy._drivers._player
+import aiy._drivers._tts
+
+FAKE_PICO2WAVE = '''#!%s
+import os, struct, sys, time
+_, _, lang, _, path, text = sys.argv
+with open(os.path.join(os.path.dirname(sys.argv[0]), 'calls'), 'a') as f:
+    f.write(text + '\\n')
+# Like pico2wave writing to a pipe, the header cannot give the data size.
+with open(path, 'wb') as f:
+    f.write(b'RIFF' + bytes(4) + b'WAVE')
+    f.write(b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, 16000, 32000, 2, 16))
+    f.write(b'data' + bytes(4))
+    f.flush()
+    for word in text.split():
+        f.write(word.encode('utf-8').ljust(2 * len(word), b'\\0'))
+        f.flush()
+        time.sleep(0.02)
+''' % sys.executable
+
+
+class FakeStream(object):
+
+    def __init__(self, player):
+        self._player = player
+        self.future = concurrent.futures.Future()
+
+    def write(self, audio_bytes):
+        self._player.played.append(audio_bytes)
+        if self._player.interrupted:
+            self.future.cancel()
+
+    def finish(self):
+        self._player.streams_finished += 1
+        if not self.future.cancelled():
+            self.future.set_result(None)
+
+
+class FakePlayer(object):
+
+    """Plays everything instantly, optionally interrupting the first stream."""
+
+    def __init__(self, interrupted=False):
+        self.interrupted = interrupted
+        self.played = []
+        self.streams_finished = 0
+
+    def enqueue(self, audio_bytes, sample_rate, sample_width=2):
+        self.played.append(audio_bytes)
+        future = concurrent.futures.Future()
+        future.set_result(None)
+        return future
+
+    def open_stream(self, sample_rate, sample_width=2):
+        return FakeStream(self)
+
+
+def _pcm(size):
+    return aiy._drivers._player.Pcm(bytes(size), 1, 2, 16000)
+
+
+class TestTtsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_key_depends_on_language(self):
+        key = aiy._drivers._tts.TtsCache.key
+        self.assertEqual(key('hello', 'en-US'), key('hello', 'en-US'))
+        self.assertNotEqual(key('hello', 'en-US'), key('hello', 'en-GB'))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = aiy._drivers._tts.TtsCache(max_bytes=50)
+        cache.put('a', _pcm(20))
+        cache.put('b', _pcm(20))
+        cache.get('a')
+        cache.put('c', _pcm(20))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertNotIn('b', cache)
+
+    def test_disk_tier_survives_new_cache(self):
+        cache = aiy._drivers._tts.TtsCache(cache_dir=self.dir)
+        cache.put('a', _pcm(20))
+        cache = aiy._drivers._tts.TtsCache(cache_dir=self.dir)
+        self.assertIn('a', cache)
+        self.assertEqual(cache.get('a'), _pcm(20))
+
+    def test_disk_tier_is_bounded(self):
+        cache = aiy._drivers._tts.TtsCache(max_bytes=0, cache_dir=self.dir,
+                                           max_disk_bytes=300)
+        cache.put('a', _pcm(100))
+        os.utime(os.path.join(self.dir, 'a.wav'), (1, 1))
+        cache.put('b', _pcm(100))
+        cache.put('c', _pcm(100))
+        self.assertEqual(sorted(os.listdir(self.dir)), ['b.wav', 'c.wav'])
+
+    def test_disk_tier_is_scanned_once(self):
+        cache = aiy._drivers._tts.TtsCache(max_bytes=0, cache_dir=self.dir)
+        cache.put('a', _pcm(100))
+        # The existing file counts towards the limit.
+        cache = aiy._drivers._tts.TtsCache(max_bytes=0, cache_dir=self.dir,
+                                           max_disk_bytes=300)
+        with mock.patch('os.scandir', side_effect=AssertionError('scanned')):
+            cache.put('b', _pcm(100))
+            cache.put('c', _pcm(100))
+        self.assertEqual(sorted(os.listdir(self.dir)), ['b.wav', 'c.wav'])
+
+
+class TestSplitSentences(unittest.TestCase):
+
+    def test_short_text_is_one_sentence(self):
+        self.assertEqual(aiy._drivers._tts.split_sentences(' hello '), ['hello'])
+
+    def test_splits_after_punctuation(self):
+        self.assertEqual(
+            aiy._drivers._tts.split_sentences('It is ten past two. Is it? Yes!  Really.'),
+            ['It is ten past two. Is it?', 'Yes! Really.'])
+
+    def test_long_sentences_split_between_clauses(self):
+        sentence = ', '.join(['word'] * 100) + '.'
+        sentences = aiy._drivers._tts.split_sentences(sentence)
+        self.assertGreater(len(sentences), 1)
+        self.assertEqual(' '.join(sentences), sentence)
+
+
+class TestSynthesize(unittest.TestCase):
+
+    def setUp(self):
+        self.bin_dir = tempfile.mkdtemp()
+        pico2wave = os.path.join(self.bin_dir, 'pico2wave')
+        with open(pico2wave, 'w') as f:
+            f.write(FAKE_PICO2WAVE)
+        os.chmod(pico2wave, 0o755)
+        self.old_path = os.environ['PATH']
+        os.environ['PATH'] = self.bin_dir + os.pathsep + self.old_path
+
+        self.old_cache = aiy._drivers._tts._cache
+        aiy._drivers._tts._cache = aiy._drivers._tts.TtsCache()
+
+    def tearDown(self):
+        aiy._drivers._tts._cache = self.old_cache
+        os.environ['PATH'] = self.old_path
+        shutil.rmtree(self.bin_dir)
+
+    def _calls(self):
+        try:
+            with open(os.path.join(self.bin_dir, 'calls')) as f:
+                return f.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+    def test_words_are_synthesized_once(self):
+        pcm = aiy._drivers._tts.synthesize('hello')
+        self.assertIs(aiy._drivers._tts.synthesize('hello'), pcm)
+        self.assertEqual(self._calls(), [aiy._drivers._tts.MARKUP % 'hello'])
+        self.assertEqual(pcm.sample_rate, 16000)
+
+    def test_say_streams_then_caches(self):
+        player = FakePlayer()
+        aiy._drivers._tts.say(player, 'hello there')
+        self.assertEqual(player.streams_finished, 1)
+        self.assertGreater(len(player.played), 1)
+        streamed = b''.join(player.played)
+
+        player = FakePlayer()
+        aiy._drivers._tts.say(player, 'hello there')
+        self.assertEqual(player.played, [streamed])
+        self.assertEqual(len(self._calls()), 1)
+
+    def test_say_pipelines_sentences(self):
+        player = FakePlayer()
+        aiy._drivers._tts.say(player, 'This is the first sentence. And this is the second one.')
+        self.assertEqual(player.streams_finished, 2)
+        self.assertEqual(self._calls(), [
+            aiy._drivers._tts.MARKUP % 'This is the first sentence.',
+            aiy._drivers._tts.MARKUP % 'And this is the second one.'])
+
+    def test_interrupt_cancels_remaining_sentences(self):
+        player = FakePlayer(interrupted=True)
+        aiy._drivers._tts.say(player, 'This is the first sentence. And this is the second one.')
+        self.assertEqual(len(self._calls()), 1)
+        self.assertEqual(len(player.played), 1)
+
+    def test_presynthesize_skips_cached_phrases(self):
+        aiy._drivers._tts.synthesize('hello')
+        count = aiy._drivers._tts.presynthesize(['hello', 'bye', 'bye'])
+        self.assertEqual(count, 1)
+        self.assertEqual(len(self._calls()), 2)
+
+    def test_presynthesize_counts_sentences(self):
+        aiy._drivers._tts.synthesize('This is the first sentence.')
+        count = aiy._drivers._tts.presynthesize(
+            ['This is the first sentence. And this is the second one.',
+             'And this is the second one.'])
+        self.assertEqual(count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
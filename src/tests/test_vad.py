@@ -0,0 +1,92 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''Test the voice activity detector with synthetic audio.'''
+
+import unittest
+
+import numpy as np
+
+import vad
+
+RATE = 16000
+
+
+def _noise(seconds, level, rand):
+    return rand.normal(0, level, int(seconds * RATE))
+
+
+def _voiced(seconds, level):
+    """A harmonic tone with a syllable-like envelope, roughly like speech."""
+    t = np.arange(int(seconds * RATE)) / RATE
+    tone = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 10))
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+    return level * tone * envelope / np.max(np.abs(tone))
+
+
+def _to_int16(audio):
+    return (np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes()
+
+
+class TestVoiceActivityDetector(unittest.TestCase):
+
+    def setUp(self):
+        self.rand = np.random.RandomState(0)
+        self.calls = 0
+        self.vad = vad.VoiceActivityDetector(callback=self._callback)
+
+    def _callback(self):
+        self.calls += 1
+
+    def _feed(self, audio, chunk_samples=1600):
+        data = _to_int16(audio)
+        chunk_bytes = 2 * chunk_samples
+        for i in range(0, len(data), chunk_bytes):
+            self.vad.add_data(memoryview(data)[i:i + chunk_bytes])
+
+    def _utterance(self):
+        return np.concatenate((
+            _noise(0.5, 0.001, self.rand),
+            _voiced(1.0, 0.2) + _noise(1.0, 0.001, self.rand),
+            _noise(1.5, 0.001, self.rand)))
+
+    def test_end_of_speech(self):
+        self._feed(self._utterance())
+        self.assertEqual(self.calls, 1)
+        self.assertAlmostEqual(self.vad.endpoint_s, 2.2, delta=0.15)
+
+    def test_odd_chunk_sizes(self):
+        self._feed(self._utterance(), chunk_samples=1000)
+        self.assertEqual(self.calls, 1)
+        self.assertAlmostEqual(self.vad.endpoint_s, 2.2, delta=0.15)
+
+    def test_silence_does_not_end(self):
+        self._feed(_noise(3, 0.001, self.rand))
+        self.assertEqual(self.calls, 0)
+        self.assertIsNone(self.vad.endpoint_s)
+
+    def test_loud_noise_is_not_speech(self):
+        self._feed(np.concatenate((_noise(1, 0.1, self.rand), _noise(2, 0.001, self.rand))))
+        self.assertEqual(self.calls, 0)
+
+    def test_reset_detects_again(self):
+        self._feed(self._utterance())
+        self.vad.reset()
+        self._feed(self._utterance())
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
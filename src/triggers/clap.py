@@ -24,29 +24,88 @@ logger = logging.getLogger('trigger')
 
 class ClapTrigger(Trigger):
 
-    """Detect claps in the audio stream."""
+    """Detect claps in the audio stream.
 
-    def __init__(self, recorder):
+    A clap is a jump between consecutive samples of more than a quarter of the
+    full scale. Jumps within min_gap_s of a clap are part of the same clap.
+    With claps > 1, the trigger only fires after that many claps, each within
+    max_gap_s of the one before, so a single bang doesn't start a request.
+    """
+
+    THRESHOLD = 65536 // 4  # quarter max delta
+
+    def __init__(self, recorder, claps=1, min_gap_s=0.1, max_gap_s=0.6,
+                 sample_rate_hz=16000):
         super().__init__()
 
+        self.claps = claps
+        self._min_gap = int(min_gap_s * sample_rate_hz)
+        self._max_gap = int(max_gap_s * sample_rate_hz)
+
+        # Scratch space for the differences, grown to the chunk size.
+        self._diff = np.empty(0, np.int32)
+
         self.have_clap = True  # don't start yet
-        self.prev_sample = 0
+        self._reset()
         recorder.add_processor(self)
 
+    def _reset(self):
+        self.prev_sample = None
+        self._position = 0  # samples since start()
+        self._last_clap = None  # position of the last clap
+        self._count = 0  # claps in the current pattern
+
     def start(self):
-        self.prev_sample = 0
+        self._reset()
         self.have_clap = False
 
     def add_data(self, data):
         """ audio is mono 16bit signed at 16kHz """
-        audio = np.fromstring(data, 'int16')
-        if not self.have_clap:
-            # alternative: np.abs(audio).sum() > thresh
-            shifted = np.roll(audio, 1)
-            shifted[0] = self.prev_sample
-            val = np.max(np.abs(shifted - audio))
-            if val > (65536 // 4):  # quarter max delta
+        if self.have_clap:
+            return
+
+        audio = np.frombuffer(data, 'int16')
+        n = len(audio)
+        if not n:
+            return
+        if len(self._diff) < n:
+            self._diff = np.empty(n, np.int32)
+
+        # Differences in int32, as they can overflow int16.
+        diff = self._diff[:n]
+        diff[0] = 0 if self.prev_sample is None else int(audio[0]) - self.prev_sample
+        np.subtract(audio[1:], audio[:-1], out=diff[1:], dtype=np.int32)
+        np.abs(diff, out=diff)
+        self.prev_sample = int(audio[-1])
+
+        position = self._position
+        self._position += n
+        if diff.max() <= self.THRESHOLD:
+            return
+
+        for index in np.flatnonzero(diff > self.THRESHOLD):
+            if self._on_clap(position + int(index)):
                 logger.info("clap detected")
                 self.have_clap = True
                 self.callback()
-        self.prev_sample = audio[-1]
+                return
+
+    def _on_clap(self, position):
+        """Counts a clap at the given position. Returns True if it completes
+        the pattern.
+        """
+        if self._last_clap is not None:
+            gap = position - self._last_clap
+            if gap < self._min_gap:
+                # Still the same clap.
+                return False
+            if gap > self._max_gap:
+                self._count = 0
+
+        self._last_clap = position
+        self._count += 1
+        if self._count < self.claps:
+            return False
+
+        self._count = 0
+        return True
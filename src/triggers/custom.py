@@ -1,83 +1,56 @@
-"""Detect keyword in the audio stream."""
-
-import snowboydecoder
-import sys
-import signal
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Detect a custom hotword in the audio stream with snowboy."""
 
 import logging
-import numpy as np
-
-
-interrupted = False
-
-
-def signal_handler(signal, frame):
-    global interrupted
-    interrupted = True
-
-
-def interrupt_callback():
-    global interrupted
-    return interrupted
-
-# import trigger in aiy project
-class Trigger(object):
-
-    """Base class for a Trigger."""
-
-    def __init__(self):
-        self.callback = None
-
-    def set_callback(self, callback):
-        self.callback = callback
-
-    def start(self):
-        pass
+import os
 
+from triggers import snowboydecoder
+from triggers.trigger import Trigger
 
 logger = logging.getLogger('trigger')
 
+DEFAULT_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Alice.pmdl')
+
 
 class CustomTrigger(Trigger):
 
-    """Detect claps in the audio stream."""
+    """Detect a custom hotword in the audio stream.
+
+    The snowboy model is loaded once, and the recorder's chunks are fed
+    straight into the detector, so the hotword shares the recorder's capture
+    stream. The audio must be in the model's format, which is normally the
+    recorder's default of 16-bit mono at 16 kHz.
+    """
 
-    def __init__(self, recorder):
+    def __init__(self, recorder, model=DEFAULT_MODEL, sensitivity=0.5, audio_gain=1):
         super().__init__()
 
         self.have_keyword = True  # don't start yet
-        self.prev_sample = 0
+        self.detector = snowboydecoder.HotwordDetector(
+            model, sensitivity=sensitivity, audio_gain=audio_gain)
         recorder.add_processor(self)
 
     def start(self):
-        self.prev_sample = 0
+        # Don't match audio from before the trigger was armed.
+        self.detector.reset()
         self.have_keyword = False
 
-    def detected(self):
-        self.have_keyword = True
-        self.callback()
-
     def add_data(self, data):
-        # capture SIGINT signal, e.g., Ctrl+C
-        signal.signal(signal.SIGINT, signal_handler)
-        detector = snowboydecoder.HotwordDetector("Alice.pmdl", sensitivity=0.5, audio_gain=1)
-        # detector = snowboydecoder.HotwordDetector(model, sensitivity=0.5)
-        print('Listening... Press Ctrl+C to exit')
-        # main loop
-        detector.start(detected_callback=self.detected(),
-                    interrupt_check=interrupt_callback,
-                    sleep_time=0.03)
-        detector.terminate()
-
         """ audio is mono 16bit signed at 16kHz """
-        # audio = np.fromstring(data, 'int16')
-        # if not self.have_keyword:
-        #     # alternative: np.abs(audio).sum() > thresh
-        #     shifted = np.roll(audio, 1)
-        #     shifted[0] = self.prev_sample
-        #     val = np.max(np.abs(shifted - audio))
-        #     if val > (65536 // 4):  # quarter max delta
-        #         logger.info("clap detected")
-        #         self.have_keyword = True
-        #         self.callback()
-        # self.prev_sample = audio[-1]
+        if not self.have_keyword and self.detector.run_detection(data) > 0:
+            logger.info("keyword detected")
+            self.have_keyword = True
+            self.callback()
@@ -0,0 +1,114 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Detect several hotwords in the audio stream with one snowboy detector."""
+
+import collections
+import logging
+
+from triggers import snowboydecoder
+from triggers.trigger import Trigger
+
+logger = logging.getLogger('trigger')
+
+DEFAULT_SENSITIVITY = 0.5
+
+# A snowboy model, its sensitivity from 0 to 1, and the voice command to run
+# when its hotword is detected, or None to start a recognition request.
+Keyword = collections.namedtuple('Keyword', ['model', 'sensitivity', 'command'])
+
+
+def parse_keyword(spec):
+    """Parses a keyword from MODEL[:SENSITIVITY][=COMMAND].
+
+    For example, 'lights.pmdl:0.6=turn on the lights' runs the command 'turn on
+    the lights' when the hotword in lights.pmdl is detected.
+    """
+    model, _, command = spec.partition('=')
+    model, _, sensitivity = model.partition(':')
+    try:
+        sensitivity = float(sensitivity) if sensitivity else DEFAULT_SENSITIVITY
+    except ValueError:
+        raise ValueError('invalid sensitivity in hotword %r' % spec)
+    return Keyword(model, sensitivity, command.strip() or None)
+
+
+class HotwordTrigger(Trigger):
+
+    """Detect any of several hotwords in the audio stream.
+
+    All the models are loaded into one snowboy detector, so each chunk of audio
+    is checked for all of the hotwords in one pass. A hotword without a command
+    calls the callback to start a recognition request, like other triggers. A
+    hotword with a command calls the command callback with it instead, so
+    common commands can run without a round trip to the cloud. Without a
+    command callback, all hotwords start recognition requests.
+
+    A universal model (.umdl) can have several hotwords, eg jarvis.umdl. All of
+    them use the model's sensitivity and run its command.
+    """
+
+    def __init__(self, recorder, keywords, audio_gain=1):
+        super().__init__()
+
+        self.keywords = list(keywords)
+        # The detector numbers the hotwords of all the models in order, so
+        # this has the keyword of each hotword.
+        self.hotword_keywords = [keyword for keyword in self.keywords
+                                 for _ in range(_count_hotwords(keyword.model))]
+        self.command_callback = None
+        self.have_keyword = True  # don't start yet
+        self.detector = snowboydecoder.HotwordDetector(
+            [keyword.model for keyword in self.keywords],
+            sensitivity=[keyword.sensitivity for keyword in self.hotword_keywords],
+            audio_gain=audio_gain)
+        recorder.add_processor(self)
+
+    def set_command_callback(self, callback):
+        self.command_callback = callback
+
+    def start(self):
+        # Don't match audio from before the trigger was armed.
+        self.detector.reset()
+        self.have_keyword = False
+
+    def add_data(self, data):
+        """ audio is mono 16bit signed at 16kHz """
+        if self.have_keyword:
+            return
+
+        index = self.detector.run_detection(data)
+        if index <= 0:
+            return
+
+        keyword = self.hotword_keywords[index - 1]
+        self.have_keyword = True
+        if keyword.command and self.command_callback:
+            logger.info("hotword %s detected, running %r", keyword.model, keyword.command)
+            self.command_callback(keyword.command)
+        else:
+            logger.info("hotword %s detected", keyword.model)
+            self.callback()
+
+
+def _count_hotwords(model):
+    """Returns the number of hotwords in a snowboy model.
+
+    Personal models (.pmdl) have one, so only universal models are loaded.
+    """
+    if not model.endswith('.umdl'):
+        return 1
+    detector = snowboydecoder.snowboydetect.SnowboyDetect(
+        resource_filename=snowboydecoder.RESOURCE_FILE.encode(), model_str=model.encode())
+    return detector.NumHotwords()
@@ -1,13 +1,14 @@
 #!/usr/bin/env python
 
 import collections
-import pyaudio
 from . import snowboydetect
+import threading
 import time
-import wave
 import os
 import logging
 
+import aiy._drivers._player
+
 logging.basicConfig()
 logger = logging.getLogger("snowboy")
 logger.setLevel(logging.INFO)
@@ -17,22 +18,96 @@ RESOURCE_FILE = os.path.join(TOP_DIR, "resources/common.res")
 DETECT_DING = os.path.join(TOP_DIR, "resources/ding.wav")
 DETECT_DONG = os.path.join(TOP_DIR, "resources/dong.wav")
 
+DetectionStats = collections.namedtuple(
+    'DetectionStats',
+    ['detections', 'last_latency_s', 'max_latency_s', 'overflow'])
+
 
 class RingBuffer(object):
-    """Ring buffer to hold audio from PortAudio"""
+    """Ring buffer to hold audio from PortAudio
+
+    A fixed-size circular buffer of bytes, copied in and out in bulk. When it
+    is full, the oldest bytes are overwritten, and counted in `overflow`.
+    extend() and get() may be called from different threads, and wait() lets
+    a reader sleep until there is data.
+    """
 
     def __init__(self, size=4096):
-        self._buf = collections.deque(maxlen=size)
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._size = size
+        self._start = 0  # index of the oldest byte
+        self._len = 0
+        self._cond = threading.Condition()
+        self._written_at = None  # when the newest bytes were added
+        self.overflow = 0
+
+    def __len__(self):
+        return self._len
 
     def extend(self, data):
         """Adds data to the end of buffer"""
-        self._buf.extend(data)
+        data = memoryview(data).cast('B')
+        n = len(data)
+        size = self._size
+        with self._cond:
+            self._written_at = time.monotonic()
+            self._cond.notify_all()
+            if n >= size:
+                # Only the newest bytes fit.
+                self.overflow += self._len + n - size
+                self._view[:] = data[n - size:]
+                self._start = 0
+                self._len = size
+                return
+
+            end = (self._start + self._len) % size
+            first = min(n, size - end)
+            self._view[end:end + first] = data[:first]
+            self._view[:n - first] = data[first:]
+
+            excess = self._len + n - size
+            if excess > 0:
+                self.overflow += excess
+                self._start = (self._start + excess) % size
+                self._len = size
+            else:
+                self._len += n
+
+    def wait(self, timeout=None):
+        """Waits until the buffer has data, wake() is called, or the timeout
+        expires. Returns True if there is data.
+        """
+        with self._cond:
+            if not self._len:
+                self._cond.wait(timeout)
+            return self._len > 0
+
+    def wake(self):
+        """Wakes up callers of wait()."""
+        with self._cond:
+            self._cond.notify_all()
 
     def get(self):
         """Retrieves data from the beginning of buffer and clears it"""
-        tmp = bytes(bytearray(self._buf))
-        self._buf.clear()
-        return tmp
+        return self.get_with_time()[0]
+
+    def get_with_time(self):
+        """Like get(), but also returns the time.monotonic() at which the
+        newest of the bytes was added, or None if there are none.
+        """
+        with self._cond:
+            written_at = self._written_at if self._len else None
+            end = self._start + self._len
+            if end <= self._size:
+                tmp = bytes(self._view[self._start:end])
+            else:
+                tmp = b''.join((self._view[self._start:],
+                                self._view[:end - self._size]))
+            # Start again at the front, so the next writes are contiguous.
+            self._start = 0
+            self._len = 0
+        return tmp, written_at
 
 
 def play_audio_file(fname=DETECT_DING):
@@ -42,15 +117,16 @@ def play_audio_file(fname=DETECT_DING):
     :param str fname: wave file name
     :return: None
     """
-    ding_wav = wave.open(fname, 'rb')
-    ding_data = ding_wav.readframes(ding_wav.getnframes())
+    import pyaudio
+
+    ding = aiy._drivers._player.get_pcm_cache().get(fname)
     audio = pyaudio.PyAudio()
     stream_out = audio.open(
-        format=audio.get_format_from_width(ding_wav.getsampwidth()),
-        channels=ding_wav.getnchannels(),
-        rate=ding_wav.getframerate(), input=False, output=True)
+        format=audio.get_format_from_width(ding.sample_width),
+        channels=ding.channels,
+        rate=ding.sample_rate, input=False, output=True)
     stream_out.start_stream()
-    stream_out.write(ding_data)
+    stream_out.write(ding.frames)
     time.sleep(0.2)
     stream_out.stop_stream()
     stream_out.close()
@@ -62,6 +138,10 @@ class HotwordDetector(object):
     Snowboy decoder to detect whether a keyword specified by `decoder_model`
     exists in a microphone input stream.
 
+    The model is loaded once, when the detector is created. Audio can then
+    either be fed with run_detection(), eg from an existing capture stream, or
+    read from the microphone with PyAudio by start().
+
     :param decoder_model: decoder model file path, a string or a list of strings
     :param resource: resource file path.
     :param sensitivity: decoder sensitivity, a float of a list of floats.
@@ -101,32 +181,84 @@ class HotwordDetector(object):
 
         self.ring_buffer = RingBuffer(
             self.detector.NumChannels() * self.detector.SampleRate() * 5)
+        self._running = False
+        self._detections = 0
+        self._last_latency_s = None
+        self._max_latency_s = 0.0
+
+    def reset(self):
+        """Forgets the audio seen so far, eg after a gap in the stream."""
+        self.detector.Reset()
+
+    def run_detection(self, data, received_at=None):
+        """
+        Run the decoder on a chunk of audio in the model's format, normally
+        16-bit mono at 16 kHz.
+
+        When a hotword is detected, the latency from `received_at` to the
+        end of the detection is added to the stats.
+
+        :param data: bytes or a bytes-like object with the audio.
+        :param received_at: the time.monotonic() at which the end of the
+                            audio was received. Defaults to now.
+        :return: the 1-based index of the detected hotword, 0 if none was
+                 detected, or -1 on error.
+        """
+        if received_at is None:
+            received_at = time.monotonic()
+        ans = self.detector.RunDetection(bytes(data))
+        if ans == -1:
+            logger.warning("Error initializing streams or reading audio data")
+        elif ans > 0:
+            latency_s = time.monotonic() - received_at
+            self._detections += 1
+            self._last_latency_s = latency_s
+            self._max_latency_s = max(self._max_latency_s, latency_s)
+            message = "Keyword " + str(ans) + " detected at time: "
+            message += time.strftime("%Y-%m-%d %H:%M:%S",
+                                     time.localtime(time.time()))
+            message += " (%.1f ms after the audio)" % (latency_s * 1000)
+            logger.info(message)
+        return ans
+
+    def get_stats(self):
+        """
+        :return: DetectionStats with the number of detections, the latest and
+                 highest latency from receiving the audio to detecting the
+                 hotword, and the bytes of audio dropped by start().
+        """
+        return DetectionStats(self._detections, self._last_latency_s,
+                              self._max_latency_s, self.ring_buffer.overflow)
 
     def start(self, detected_callback=play_audio_file,
               interrupt_check=lambda: False,
               sleep_time=0.03):
         """
-        Start the voice detector. For every `sleep_time` second it checks the
-        audio buffer for triggering keywords. If detected, then call
-        corresponding function in `detected_callback`, which can be a single
-        function (single model) or a list of callback functions (multiple
-        models). Every loop it also calls `interrupt_check` -- if it returns
-        True, then breaks from the loop and return.
+        Start the voice detector. As soon as audio arrives from the
+        microphone, it checks the audio for triggering keywords. If detected,
+        then call corresponding function in `detected_callback`, which can be
+        a single function (single model) or a list of callback functions
+        (multiple models). Every loop, and at least every `sleep_time`
+        seconds, it also calls `interrupt_check` -- if it returns True, then
+        breaks from the loop and return.
 
         :param detected_callback: a function or list of functions. The number of
                                   items must match the number of models in
                                   `decoder_model`.
         :param interrupt_check: a function that returns True if the main loop
                                 needs to stop.
-        :param float sleep_time: how much time in second every loop waits.
+        :param float sleep_time: the longest time in seconds between calls to
+                                 `interrupt_check`.
         :return: None
         """
+        import pyaudio
+
         self._running = True
 
         def audio_callback(in_data, frame_count, time_info, status):
             self.ring_buffer.extend(in_data)
-            play_data = chr(0) * len(in_data)
-            return play_data, pyaudio.paContinue
+            # Nothing to play on an input stream.
+            return None, pyaudio.paContinue
 
         self.audio = pyaudio.PyAudio()
         self.stream_in = self.audio.open(
@@ -154,23 +286,23 @@ class HotwordDetector(object):
 
         logger.debug("detecting...")
 
+        overflow = self.ring_buffer.overflow
         while self._running is True:
             if interrupt_check():
                 logger.debug("detect voice break")
                 break
-            data = self.ring_buffer.get()
+            if not self.ring_buffer.wait(sleep_time):
+                continue
+            data, written_at = self.ring_buffer.get_with_time()
             if len(data) == 0:
-                time.sleep(sleep_time)
                 continue
+            if self.ring_buffer.overflow != overflow:
+                logger.warning("Dropped %d bytes of audio",
+                               self.ring_buffer.overflow - overflow)
+                overflow = self.ring_buffer.overflow
 
-            ans = self.detector.RunDetection(data)
-            if ans == -1:
-                logger.warning("Error initializing streams or reading audio data")
-            elif ans > 0:
-                message = "Keyword " + str(ans) + " detected at time: "
-                message += time.strftime("%Y-%m-%d %H:%M:%S",
-                                         time.localtime(time.time()))
-                logger.info(message)
+            ans = self.run_detection(data, written_at)
+            if ans > 0:
                 callback = detected_callback[ans - 1]
                 if callback is not None:
                     callback()
@@ -186,3 +318,4 @@ class HotwordDetector(object):
         self.stream_in.close()
         self.audio.terminate()
         self._running = False
+        self.ring_buffer.wake()
@@ -0,0 +1,140 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Detect the end of an utterance in the recorded audio."""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger('vad')
+
+# Small offset to avoid the log of zero.
+_EPSILON = 1e-10
+
+
+class VoiceActivityDetector(object):
+
+    """Calls back when the user stops speaking.
+
+    This is an audio processor for the Recorder. It splits the 16-bit mono
+    audio into short frames and classifies each one as speech if it is loud
+    enough, has a low enough zero-crossing rate, and a low enough spectral
+    flatness (noise has a flat spectrum, voiced speech does not). Loud enough
+    means min_energy_db dBFS, or energy_margin_db above the estimated noise
+    floor, whichever is higher.
+
+    Once there have been min_speech_s of speech, followed by end_silence_s
+    without speech, the callback is called. It is only called once until
+    reset() is called.
+    """
+
+    def __init__(self, callback=None, sample_rate_hz=16000, frame_s=0.02,
+                 min_energy_db=-50.0, energy_margin_db=6.0, max_zcr=0.4,
+                 max_flatness=0.45, min_speech_s=0.15, end_silence_s=0.7):
+        self.callback = callback
+        self.sample_rate_hz = sample_rate_hz
+        self.min_energy_db = min_energy_db
+        self.energy_margin_db = energy_margin_db
+        self.max_zcr = max_zcr
+        self.max_flatness = max_flatness
+
+        self._frame_samples = int(frame_s * sample_rate_hz)
+        self._min_speech_frames = max(1, int(round(min_speech_s / frame_s)))
+        self._end_silence_frames = max(1, int(round(end_silence_s / frame_s)))
+        self._window = np.hanning(self._frame_samples).astype(np.float32)
+        self._noise_floor_db = None
+        self.reset()
+
+    def reset(self):
+        """Starts looking for a new utterance."""
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._frames = 0
+        self._speech_run = 0
+        self._silence_run = 0
+        self._heard_speech = False
+        self._done = False
+        # Seconds of audio before the end of the utterance was detected, or
+        # None if it hasn't been yet.
+        self.endpoint_s = None
+
+    def add_data(self, data):
+        """Processes a chunk of 16-bit mono audio."""
+        if self._done:
+            return
+
+        audio = np.frombuffer(data, dtype=np.int16)
+        if self._pending.size:
+            audio = np.concatenate((self._pending, audio))
+        num_frames = audio.size // self._frame_samples
+        self._pending = audio[num_frames * self._frame_samples:].copy()
+        if not num_frames:
+            return
+
+        frames = audio[:num_frames * self._frame_samples].reshape(
+            num_frames, self._frame_samples)
+        for is_speech in self.classify(frames):
+            self._frames += 1
+            if self._update(is_speech):
+                self._done = True
+                self.endpoint_s = self._frames * self._frame_samples / self.sample_rate_hz
+                logger.info('end of speech after %.2f s', self.endpoint_s)
+                if self.callback:
+                    self.callback()
+                return
+
+    def classify(self, frames):
+        """Returns a boolean array saying which rows of frames are speech.
+
+        frames is a 2-D int16 array, with one frame per row. This also
+        updates the noise floor from the frames that are not speech.
+        """
+        samples = frames.astype(np.float32) / 32768.0
+
+        energy_db = 10 * np.log10(np.mean(samples * samples, axis=1) + _EPSILON)
+
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+        power = np.abs(np.fft.rfft(samples * self._window, axis=1)) ** 2 + _EPSILON
+        flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+
+        min_energy_db = self.min_energy_db
+        if self._noise_floor_db is not None:
+            min_energy_db = max(min_energy_db, self._noise_floor_db + self.energy_margin_db)
+        speech = ((energy_db >= min_energy_db) & (zcr <= self.max_zcr) &
+                  (flatness <= self.max_flatness))
+
+        noise_db = energy_db[~speech]
+        if noise_db.size:
+            level_db = float(noise_db.mean())
+            if self._noise_floor_db is None or level_db < self._noise_floor_db:
+                self._noise_floor_db = level_db
+            else:
+                # Rise slowly, so speech that was missed does not raise it much.
+                self._noise_floor_db += 0.05 * (level_db - self._noise_floor_db)
+        return speech
+
+    def _update(self, is_speech):
+        """Returns True when a frame ends the utterance."""
+        if is_speech:
+            self._speech_run += 1
+            self._silence_run = 0
+            if self._speech_run >= self._min_speech_frames:
+                self._heard_speech = True
+        else:
+            self._speech_run = 0
+            self._silence_run += 1
+        return self._heard_speech and self._silence_run >= self._end_silence_frames